@@ -1,6 +1,6 @@
 import os
+import imp
 import sys
-import inspect
 import logging
 import warnings
 from math import *
@@ -18,20 +18,15 @@ if (major != 3 and major != 2) or (major == 2 and minor < 7):
     errors.append('  {0} provides {1}.{2}.{3}'.format(
         sys.executable, major, minor, micro))
 
-try:
-    from traits.etsconfig.api import ETSConfig
-    toolkit = os.getenv('ETS_TOOLKIT', 'qt4')
-    ETSConfig.toolkit = toolkit
-    os.environ['ETS_TOOLKIT'] = toolkit
-except ImportError:
-    pass
+# --- traits reads the toolkit from the environment when it is first imported
+os.environ.setdefault('ETS_TOOLKIT', 'qt4')
 
 # --- numpy
 try: import numpy as np
 except ImportError: errors.append('numpy not found')
 
-# --- scipy
-try: import scipy
+# --- scipy, imported by the few functions that use it
+try: imp.find_module('scipy')
 except ImportError: errors.append('scipy not found')
 
 # check prerequisites
@@ -45,6 +40,10 @@ sys.path.insert(0, os.getcwd())
 # ------------------------ FACTORY METHODS TO SET UP AND RUN A SIMULATION --- #
 from numpy import array, float64
 from .mmd.simulator import *
+from .mmd.batch import BatchMaterialPointSimulator
+from .mmd.increments import AdaptiveFrames
+from .mmd.resultcache import ResultCache, StepMemo
+from .mmd.instrumentation import SimulationStats, StepStats
 from .mml_siteenv import environ
 from .mmd.material import build_material
 from .mmd.permutator import Permutator, PermutateVariable
@@ -68,11 +67,13 @@ def matmodlab(func):
     warnings.warn('deprecated', DeprecationWarning)
 
 def gen_runid():
+    import inspect
     stack = inspect.stack()[1]
     return splitext(basename(stack[1]))[0]
 
 def get_my_directory():
     '''return the directory of the calling function'''
+    import inspect
     stack = inspect.stack()[1]
     d = dirname(realpath(stack[1]))
     return d
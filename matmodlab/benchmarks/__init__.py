@@ -0,0 +1,31 @@
+"""Performance benchmarks for matmodlab
+
+Each bench_*.py module defines a main function that runs its benchmarks and
+reports the timings. Run a module directly, e.g.
+
+    python -m matmodlab.benchmarks.bench_records
+
+The performance suite in suite.py runs benchmarks of the driver, kinematics,
+and bundled materials and flags timings that regressed from a stored baseline.
+
+"""
+import sys
+from time import time as tt
+
+def timeit(func, *args, **kwargs):
+    '''Return the best wall time of repeat calls to func(*args)'''
+    repeat = kwargs.pop('repeat', 3)
+    best = None
+    for i in range(repeat):
+        start = tt()
+        func(*args)
+        t = tt() - start
+        best = t if best is None else min(best, t)
+    return best
+
+def report(name, t, reference=None, stream=sys.stdout):
+    '''Write the timing t of benchmark name to stream'''
+    line = '{0:40s} {1:12.6f}s'.format(name, t)
+    if reference is not None and t > 0.:
+        line += '  ({0:.1f}x)'.format(reference / t)
+    stream.write(line + '\n')
@@ -0,0 +1,99 @@
+"""Benchmarks for the umat interface: update_state of the umat and uhyper
+wrappers, with the bundled neo-Hookean umat_neohooke and uhyper_neohooke,
+filling the preallocated work arrays of the material against allocating and
+reordering the arguments of the umat on every call
+
+"""
+import os
+import logging
+import numpy as np
+from matmodlab.constants import *
+from matmodlab.product import MAT_D
+from matmodlab.mmd.simulator import CB
+from matmodlab.mmd.material import Material
+from matmodlab.utils import mmlabpack
+from matmodlab.utils.errors import StopFortran
+from matmodlab.benchmarks import timeit, report
+
+MATERIALS = [
+    (UMAT, {'E': 500., 'Nu': .45}, {'libname': 'umat_t',
+        'param_names': ('E', 'Nu'),
+        'source_files': [os.path.join(MAT_D, 'src/umat_neohooke.f90')]}),
+    (UHYPER, {'C10': 86.2, 'D1': .00138}, {'libname': 'uhyper_t',
+        'param_names': ('C10', 'D1'),
+        'source_files': [os.path.join(MAT_D, 'src/uhyper_neohooke.f90')]}),
+]
+
+def update_state_alloc(self, time, dtime, temp, dtemp, energy, rho, F0, F,
+    stran, d, elec_field, stress, statev, **kwargs):
+    '''UMat.update_state with the allocations and reordering the work arrays
+    replaced'''
+    log = logging.getLogger('matmodlab.mmd.simulator')
+    cmname = '{0:8s}'.format('umat')
+    dfgrd0 = np.reshape(F0, (3, 3), order='F')
+    dfgrd1 = np.reshape(F, (3, 3), order='F')
+    dstran = d * dtime
+    ddsdde = np.zeros((6, 6), order='F')
+    ddsddt = np.zeros(6, order='F')
+    drplde = np.zeros(6, order='F')
+    predef = np.zeros(1, order='F')
+    dpred = np.zeros(1, order='F')
+    coords = np.zeros(3, order='F')
+    drot = np.eye(3)
+    ndi = nshr = 3
+    spd = scd = rpl = drpldt = pnewdt = 0.
+    noel = npt = layer = kspt = kinc = 1
+    sse = mmlabpack.ddot(stress, stran) / rho
+    celent = 1.
+    kstep = 1
+    time = np.array([time, time])
+    stress = stress[self.ordering]
+    dstran = dstran[self.ordering]
+    stran = stran[self.ordering]
+    self.lib.umat(stress, statev, ddsdde,
+        sse, spd, scd, rpl, ddsddt, drplde, drpldt, stran, dstran,
+        time, dtime, temp, dtemp, predef, dpred, cmname, ndi, nshr,
+        self.num_sdv, self.params, coords, drot, pnewdt, celent, dfgrd0,
+        dfgrd1, noel, npt, layer, kspt, kstep, kinc, log.info, log.warn,
+        StopFortran)
+    stress = stress[self.ordering]
+    ddsdde = ddsdde[self.ordering, [[i] for i in self.ordering]]
+    if abs(pnewdt) > 1e-12:
+        CB.request_cutback(pnewdt=pnewdt)
+    return stress, statev, ddsdde
+
+def run_increments(update_state, material, n):
+    '''Drive n increments of uniaxial strain, to a strain of .01, through
+    update_state'''
+    dtime = 1. / n
+    d = np.array([.01, 0., 0., 0., 0., 0.])
+    F0, F = np.eye(3).reshape(9), np.eye(3).reshape(9)
+    stran, stress = np.zeros(6), np.zeros(6)
+    statev = np.array(material.initial_sdv)
+    for i in xrange(n):
+        F0, F = F, np.array(F)
+        F[0] = np.exp(.01 * (i + 1) * dtime)
+        stress, statev, ddsdde = update_state(material, i * dtime, dtime,
+            DEFAULT_TEMP, 0., 0., 1., F0, F, stran, d, None, stress, statev)
+        stran = stran + d * dtime
+    return stress, statev, ddsdde
+
+def main(num_incs=100000):
+    logging.getLogger('matmodlab.mmd.simulator').setLevel(logging.WARN)
+    for (name, parameters, kwargs) in MATERIALS:
+        material = Material(name, parameters, **kwargs)
+        new = type(material).update_state.im_func
+        a = run_increments(update_state_alloc, material, 100)
+        b = run_increments(new, material, 100)
+        assert all(np.allclose(x, y) for (x, y) in zip(a, b))
+
+        libname = kwargs['libname']
+        t1 = timeit(run_increments, update_state_alloc, material, num_incs)
+        report('{0} update (allocated), {1} incs'.format(libname, num_incs),
+               t1)
+        t2 = timeit(run_increments, new, material, num_incs)
+        report('{0} update (workspace), {1} incs'.format(libname, num_incs),
+               t2, reference=t1)
+
+if __name__ == '__main__':
+    main()
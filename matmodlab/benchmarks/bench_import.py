@@ -0,0 +1,43 @@
+"""Benchmarks for import matmodlab, in a fresh interpreter, against importing
+numpy alone, and the check that modules matmodlab imports lazily are not
+imported with it
+
+"""
+import sys
+import subprocess
+from matmodlab.benchmarks import timeit, report
+
+# modules imported only by the functions that use them: optional and heavy
+# dependencies, and modules used only by the command line tools
+LAZY_MODULES = ('scipy', 'matplotlib', 'bokeh', 'pandas', 'h5py', 'traits',
+                'sympy', 'numpy.distutils', 'matmodlab.tpl', 'argparse',
+                'inspect', 'multiprocessing', 'xml')
+
+def run(statement):
+    '''Run statement in a fresh interpreter, returning its output'''
+    return subprocess.check_output([sys.executable, '-c', statement],
+                                   stderr=subprocess.STDOUT)
+
+def eager_imports(lazy=LAZY_MODULES):
+    '''The modules of lazy, or their submodules, imported by import
+    matmodlab'''
+    out = run('import sys, matmodlab\n'
+              'for (name, module) in sys.modules.items():\n'
+              '    if module is not None: print(name)')
+    modules = out.split()
+    return sorted(set(x for x in modules for y in lazy
+                      if x == y or x.startswith(y + '.')))
+
+def main():
+    t1 = timeit(run, 'import numpy')
+    report('import numpy', t1)
+    t2 = timeit(run, 'import matmodlab')
+    report('import matmodlab', t2)
+    report('import matmodlab, less numpy', t2 - t1)
+    eager = eager_imports()
+    if eager:
+        sys.stdout.write('modules imported eagerly: '
+                         '{0}\n'.format(', '.join(eager)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Benchmarks for the kinematics of strain controlled steps: updating F with
+the step-constant operator exp(d dt) against update_deformation on every
+frame, and the uniaxial strain example run through the simulator with the
+python mmlabpack, with and without the cached operator
+
+"""
+import shutil
+import tempfile
+import numpy as np
+from matmodlab import MaterialPointSimulator
+from matmodlab.constants import VOIGT
+from matmodlab.utils import mmlabpack as mml
+from matmodlab.utils import _mmlabpack
+from matmodlab.utils.symeig import expm3
+from matmodlab.benchmarks import timeit, report
+
+D = np.array([.01, 0., 0., 0., 0., 0.])
+
+def update_deformation(n, module, dtime=.01):
+    '''F and E recomputed from scratch each frame'''
+    F = np.eye(3).reshape(9)
+    for i in xrange(n):
+        F, e = module.update_deformation(dtime, 0., F, D)
+    return F
+
+def cached_operator(n, dtime=.01):
+    '''F advanced by the operator computed once for the step'''
+    F = np.eye(3).reshape(9)
+    A = expm3(mml.as3x3(D / VOIGT) * dtime)
+    for i in xrange(n):
+        F = np.dot(A, F.reshape((3, 3))).reshape(9)
+    return F
+
+def uniaxial_strain(frames, cached):
+    '''The strain steps of examples/uniaxial_strain.py, elastic model'''
+    compiled, update = mml.compiled, mml.update_deformation
+    mml.compiled = not cached
+    mml.update_deformation = _mmlabpack.update_deformation
+    d = tempfile.mkdtemp(prefix='mmlbench')
+    try:
+        mps = MaterialPointSimulator('bench_kinematics', verbosity=-1, d=d)
+        mps.Material('elastic', {'K': 9.980040E+09, 'G': 3.750938E+09})
+        for c in (1, 2, 1, 0):
+            mps.StrainStep(components=(c, 0, 0), scale=1e-2, frames=frames)
+    finally:
+        mml.compiled, mml.update_deformation = compiled, update
+        shutil.rmtree(d, ignore_errors=True)
+    return mps
+
+def main(num_frames=10000):
+    assert np.allclose(update_deformation(100, _mmlabpack),
+                       cached_operator(100))
+    t1 = timeit(update_deformation, num_frames, _mmlabpack)
+    report('python update_deformation, {0} frames'.format(num_frames), t1)
+    t2 = timeit(update_deformation, num_frames, mml)
+    report('update_deformation, {0} frames'.format(num_frames), t2,
+           reference=t1)
+    t2 = timeit(cached_operator, num_frames)
+    report('cached exp(d dt), {0} frames'.format(num_frames), t2, reference=t1)
+
+    frames = num_frames / 4
+    t1 = timeit(uniaxial_strain, frames, False, repeat=1)
+    report('uniaxial strain, python, {0} frames'.format(num_frames), t1)
+    t2 = timeit(uniaxial_strain, frames, True, repeat=1)
+    report('uniaxial strain, python, cached', t2, reference=t1)
+
+if __name__ == '__main__':
+    main()
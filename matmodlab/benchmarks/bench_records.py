@@ -0,0 +1,62 @@
+"""Benchmarks for the output records: flattening record arrays with rec2arr
+
+"""
+import numpy as np
+from matmodlab.constants import *
+from matmodlab.mmd.simulator import Records
+from matmodlab.utils.fileio import rec2arr
+from matmodlab.benchmarks import timeit, report
+
+def rec2arr_loop(recarr):
+    '''Row by row flattening, the implementation rec2arr replaced'''
+    def flatten(a):
+        flat = []
+        for x in a:
+            try: flat.extend(x)
+            except TypeError: flat.append(x)
+        return flat
+    return np.array([flatten(row.tolist()) for row in recarr])
+
+def make_records(num_frames, num_sdv=10):
+    '''Records with the simulator's layout and num_frames rows'''
+    records = Records()
+    records.add('Step', SCALAR, dtype='i4')
+    records.add('Frame', SCALAR, dtype='i4')
+    records.add('Time', SCALAR)
+    records.add('DTime', SCALAR)
+    records.add('S', TENSOR_3D)
+    records.add('E', TENSOR_3D)
+    records.add('F', TENSOR_3D_FULL)
+    records.add('D', TENSOR_3D)
+    records.add('DS', TENSOR_3D)
+    records.add('EF', VECTOR)
+    records.add('T', SCALAR)
+    sdv_keys = ['SDV{0}'.format(i+1) for i in range(num_sdv)]
+    records.add('SDV', SDV, keys=sdv_keys)
+    sdv = np.zeros(num_sdv)
+    kw = dict(Step=0, Frame=0, Time=0., DTime=0., E=Z6, F=I9, D=Z6, DS=Z6,
+              S=Z6, SDV=sdv, T=DEFAULT_TEMP, EF=np.zeros(3))
+    records.init(**kw)
+    records.reserve(num_frames)
+    for i in range(1, num_frames):
+        kw.update(Frame=i, Time=float(i), S=Z6+i, SDV=sdv+i)
+        records.cache(**kw)
+    records.advance()
+    return records
+
+def main(num_frames=100000):
+    records = make_records(num_frames)
+    data = records.data
+    sdv = data[[x for x in data.dtype.names if x.startswith('SDV_')]]
+    assert np.allclose(rec2arr_loop(data), rec2arr(data))
+    t1 = timeit(rec2arr_loop, data, repeat=1)
+    report('rec2arr (row loop), {0} rows'.format(num_frames), t1)
+    t2 = timeit(rec2arr, data)
+    report('rec2arr, {0} rows'.format(num_frames), t2, reference=t1)
+    t1 = timeit(rec2arr_loop, sdv, repeat=1)
+    report('rec2arr SDV (row loop), {0} rows'.format(num_frames), t1)
+    t2 = timeit(rec2arr, sdv)
+    report('rec2arr SDV, {0} rows'.format(num_frames), t2, reference=t1)
+
+if __name__ == '__main__':
+    main()
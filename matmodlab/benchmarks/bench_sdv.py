@@ -0,0 +1,90 @@
+"""Benchmarks for state variable lookups: the sdvmap of MaterialModel against
+resolving names with sdv_keys.index on every call
+
+"""
+import numpy as np
+from matmodlab.constants import *
+from matmodlab.mmd.material import Material
+from matmodlab.benchmarks import timeit, report
+
+NAMES = ('BS_XX', 'BS_YY', 'BS_ZZ', 'BS_XY', 'BS_YZ', 'BS_XZ',
+         'Y', 'SIGE', 'EQPS', 'Y', 'SIGE')
+
+def lookup_index(material, n):
+    '''Resolve the von Mises state variables as update_state did'''
+    for i in xrange(n):
+        idx = lambda x: material.sdv_keys.index(x.upper())
+        for name in NAMES:
+            idx(name)
+
+def lookup_map(material, n):
+    '''Resolve the von Mises state variables through the sdvmap'''
+    for i in xrange(n):
+        ix = material.sdv_map
+        ix.BS, ix.Y, ix.SIGE, ix.EQPS, ix.Y, ix.SIGE
+
+def update_state_index(self, time, dtime, temp, dtemp, energy, rho, F0, F,
+    stran, d, elec_field, stress, statev, **kwargs):
+    '''VonMises.update_state with the sdv_keys.index lookups it replaced'''
+    idx = lambda x: self.sdv_keys.index(x.upper())
+    bs = np.array([statev[idx('BS_XX')],
+                   statev[idx('BS_YY')],
+                   statev[idx('BS_ZZ')],
+                   statev[idx('BS_XY')],
+                   statev[idx('BS_YZ')],
+                   statev[idx('BS_XZ')]])
+    yn = statev[idx('Y')]
+    de = d / VOIGT * dtime
+    iso = de[:3].sum() / 3.0 * np.array([1.0, 1.0, 1.0, 0.0, 0.0, 0.0])
+    dev = de - iso
+    stress_trial = stress + 3.0 * self.params['K'] * iso + 2.0 * self.params['G'] * dev
+    xi_trial = stress_trial - bs
+    xi_trial_eqv = self.eqv(xi_trial)
+    if xi_trial_eqv <= yn:
+        statev[idx('SIGE')] = xi_trial_eqv
+        return stress_trial, statev, None
+    N = xi_trial - xi_trial[:3].sum() / 3.0 * np.array([1.0, 1.0, 1.0, 0.0, 0.0, 0.0])
+    N = N / (ROOT23 * xi_trial_eqv)
+    deqps = (xi_trial_eqv - yn) / (3.0 * self.params['G'] + self.params['H'])
+    dps = 1. / ROOT23 * deqps * N
+    stress_final = stress_trial - 2.0 * self.params['G'] / ROOT23 * deqps * N
+    bs = bs + 2.0 / 3.0 * self.params['H'] * self.params['BETA'] * dps
+    statev[idx('EQPS')] += deqps
+    statev[idx('Y')] += self.params['H'] * (1.0 - self.params['BETA']) * deqps
+    statev[idx('BS_XX')] = bs[0]
+    statev[idx('BS_YY')] = bs[1]
+    statev[idx('BS_ZZ')] = bs[2]
+    statev[idx('BS_XY')] = bs[3]
+    statev[idx('BS_YZ')] = bs[4]
+    statev[idx('BS_XZ')] = bs[5]
+    statev[idx('SIGE')] = self.eqv(stress_final - bs)
+    return stress_final, statev, None
+
+def run_increments(update_state, material, n):
+    '''Drive n plastic increments of uniaxial strain through update_state'''
+    d = np.array([1.E-5, 0., 0., 0., 0., 0.])
+    stress, statev = np.zeros(6), np.array(material.initial_sdv)
+    for i in xrange(n):
+        stress, statev, c = update_state(material, 0., 1., 0., 0., 1., 1.,
+            I9, I9, Z6, d, None, stress, statev)
+    return stress, statev
+
+def main(num_incs=100000):
+    material = Material('vonmises', [1.E+10, 3.75E+09, 1.E+07, 1.E+08, .5])
+    new = type(material).update_state.im_func
+    a = run_increments(update_state_index, material, 100)
+    b = run_increments(new, material, 100)
+    assert np.allclose(a[0], b[0]) and np.allclose(a[1], b[1])
+
+    t1 = timeit(lookup_index, material, num_incs)
+    report('sdv lookup (index), {0} incs'.format(num_incs), t1)
+    t2 = timeit(lookup_map, material, num_incs)
+    report('sdv lookup (sdvmap), {0} incs'.format(num_incs), t2, reference=t1)
+    t1 = timeit(run_increments, update_state_index, material, num_incs)
+    report('vonmises update (index), {0} incs'.format(num_incs), t1)
+    t2 = timeit(run_increments, new, material, num_incs)
+    report('vonmises update (sdvmap), {0} incs'.format(num_incs), t2,
+           reference=t1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Benchmarks for startup: import matmodlab and build a first Material, in a
+fresh interpreter, with the material registry cold (removed) and warm, and
+Material() in process with the loader memo cleared and memoized
+
+"""
+import os
+import sys
+import logging
+import shutil
+import tempfile
+import subprocess
+from matmodlab.mmd.loader import MaterialLoader, MaterialRegistry
+from matmodlab.mmd.material import Material
+from matmodlab.benchmarks import timeit, report
+
+PARAMETERS = {'K': 1.35E+11, 'G': 5.3E+10}
+
+SCRIPT = '''\
+import matmodlab.mmd.loader as loader
+loader.DEFAULT_REGISTRY = {0!r}
+import matmodlab
+from matmodlab.mmd.material import Material
+Material('elastic', {1!r})
+'''
+
+def startup(registry, cold=False):
+    '''Run the startup script in a fresh interpreter'''
+    if cold and os.path.isfile(registry):
+        os.remove(registry)
+    with open(os.devnull, 'w') as fh:
+        subprocess.check_call([sys.executable, '-c',
+                               SCRIPT.format(registry, PARAMETERS)],
+                               stdout=fh, stderr=fh)
+
+def material(n, clear=False):
+    '''Build n elastic materials'''
+    for i in xrange(n):
+        if clear:
+            MaterialLoader.clear()
+        Material('elastic', PARAMETERS)
+
+def main(n=100):
+    logging.getLogger('matmodlab.mmd.simulator').setLevel(logging.WARN)
+    d = tempfile.mkdtemp()
+    try:
+        registry = os.path.join(d, 'materials.json')
+        t1 = timeit(startup, registry, True)
+        report('import + Material (cold registry)', t1)
+        t2 = timeit(startup, registry)
+        report('import + Material (warm registry)', t2, reference=t1)
+
+        MaterialLoader.registry = MaterialRegistry(registry)
+        t1 = timeit(material, n, True)
+        report('Material x{0} (loader cleared)'.format(n), t1)
+        t2 = timeit(material, n)
+        report('Material x{0} (loader memoized)'.format(n), t2, reference=t1)
+    finally:
+        MaterialLoader.registry = None
+        MaterialLoader.clear()
+        shutil.rmtree(d, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Benchmarks for the closed form symmetric 3x3 matrix functions against the
+SciPy and numpy.linalg.eig paths of the Python mmlabpack
+
+"""
+import numpy as np
+import scipy.linalg
+from matmodlab.utils import _mmlabpack, mmlabpack
+from matmodlab.utils.symeig import *
+from matmodlab.benchmarks import timeit, report
+
+def random_spd(n, seed=12):
+    '''n random symmetric positive definite 3x3 matrices near the identity'''
+    rs = np.random.RandomState(seed)
+    a = rs.uniform(-.1, .1, (n, 3, 3))
+    return np.eye(3) + np.einsum('nki,nkj->nij', a, a)
+
+def loop(func, a, *args):
+    for x in a:
+        func(x, *args)
+
+def funcm_eig(a, f):
+    '''funcm as it was, with the general eigensolver'''
+    vals, vecs = np.linalg.eig(a)
+    return sum([f(vals[i]) * np.outer(vecs[:, i], vecs[:, i])
+                for i in range(3)])
+
+def update_deformation_scipy(dt, k, farg, darg):
+    '''_mmlabpack.update_deformation as it was, with the SciPy functions'''
+    f0 = farg.reshape((3, 3))
+    d = _mmlabpack.as3x3(darg / _mmlabpack.VOIGT)
+    ff = np.dot(scipy.linalg.expm(d * dt), f0)
+    u = scipy.linalg.sqrtm(np.dot(ff.T, ff))
+    eps = scipy.linalg.logm(u)
+    return (_mmlabpack.asarray(ff, 9),
+            _mmlabpack.symarray(eps) * _mmlabpack.VOIGT)
+
+def run_increments(update_deformation, n):
+    F, d = np.eye(3).flatten(), np.array([1., .1, -.2, .3, 0., .05])
+    for i in xrange(n):
+        F, E = update_deformation(.01, 0., F, d)
+    return F, E
+
+def main(num=1000):
+    a = random_spd(num)
+    x = run_increments(update_deformation_scipy, 10)
+    y = run_increments(_mmlabpack.update_deformation, 10)
+    assert np.allclose(x[0], y[0]) and np.allclose(x[1], y[1])
+    assert np.allclose(logm3_batch(a), [scipy.linalg.logm(x) for x in a])
+
+    for (name, ref, new) in (('expm', scipy.linalg.expm, expm3),
+                             ('sqrtm', scipy.linalg.sqrtm, sqrtm3),
+                             ('logm', scipy.linalg.logm, logm3)):
+        t1 = timeit(loop, ref, a)
+        report('{0} (scipy), {1} matrices'.format(name, num), t1)
+        t2 = timeit(loop, new, a)
+        report('{0}3, {1} matrices'.format(name, num), t2, reference=t1)
+        t3 = timeit(globals()[name + '3_batch'], a)
+        report('{0}3_batch, {1} matrices'.format(name, num), t3, reference=t1)
+
+    f = lambda x: x ** .5
+    t1 = timeit(loop, funcm_eig, a, f)
+    report('powm (eig), {0} matrices'.format(num), t1)
+    t2 = timeit(loop, powm3, a, .5)
+    report('powm3, {0} matrices'.format(num), t2, reference=t1)
+
+    t1 = timeit(run_increments, update_deformation_scipy, num)
+    report('update_deformation (scipy), {0} incs'.format(num), t1)
+    t2 = timeit(run_increments, _mmlabpack.update_deformation, num)
+    report('update_deformation, {0} incs'.format(num), t2, reference=t1)
+
+    F = np.tile(np.eye(3).flatten(), (num, 1))
+    d = np.random.RandomState(3).uniform(-1., 1., (num, 6))
+    t1 = timeit(loop_points, mmlabpack.update_deformation, F, d)
+    report('update_deformation, {0} points'.format(num), t1)
+    t2 = timeit(mmlabpack.update_deformation_batch, .01, 0., F, d)
+    report('update_deformation_batch, {0} points'.format(num), t2,
+           reference=t1)
+
+def loop_points(update_deformation, F, d):
+    for n in xrange(F.shape[0]):
+        update_deformation(.01, 0., F[n], d[n])
+
+if __name__ == '__main__':
+    main()
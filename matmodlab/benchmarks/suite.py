@@ -0,0 +1,360 @@
+"""The performance suite: timings of the driver, kinematics, and bundled
+materials compared against stored baseline timings
+
+The suite times
+
+    update_deformation and deps2d, compiled and python mmlabpack
+    numerical_jacobian
+    strain and stress controlled runs of each bundled material
+    update_state of the umat and uhyper wrappers
+    caching of Records of 10^3, 10^4, and 10^5 frames
+    dump and loadfile of each output format
+    a Permutator campaign
+    import matmodlab, and import matmodlab and a first Material, in a fresh
+    interpreter
+
+Timings are compared with those of a baseline file the way filediff
+compares results: a benchmark whose time exceeds its baseline time by less
+than dtol (relative) passes, by less than ftol diffs, and by more fails. The
+suite returns the worst status, SAME, DIFF, or NOT_SAME. Timings depend on
+the machine, baselines are written with --save on the machine they are used
+on. Run with
+
+    python -m matmodlab.benchmarks.suite [--save] [-b baseline] [-k pattern]
+
+"""
+import os
+import re
+import sys
+import json
+import shutil
+import logging
+import tempfile
+import argparse
+import numpy as np
+
+from matmodlab import MaterialPointSimulator, Permutator, PermutateVariable
+from matmodlab.product import MAT_D
+from matmodlab.constants import *
+from matmodlab.utils import mmlabpack as mml
+from matmodlab.utils import _mmlabpack
+from matmodlab.utils.fileio import loadfile
+from matmodlab.utils.numerix import SAME, DIFF, NOT_SAME
+from matmodlab.benchmarks import timeit
+from matmodlab.benchmarks.bench_records import make_records
+from matmodlab.benchmarks.bench_startup import startup
+from matmodlab.benchmarks.bench_import import run
+from matmodlab.benchmarks import bench_abaqus
+
+__all__ = ['Benchmark', 'benchmarks', 'run_suite', 'compare_timing',
+           'read_baseline', 'write_baseline']
+
+DEFAULT_BASELINE = os.path.join(os.path.expanduser('~'), '.matmodlab',
+                                'benchmarks.json')
+
+# relative slow down at which a benchmark diffs and fails
+BENCH_DIFFTOL = .25
+BENCH_FAILTOL = 1.
+
+# materials run by the suite, with their parameters and keywords
+MATERIALS = [
+    ('elastic', {'K': 9.980040E+09, 'G': 3.750938E+09}, {}),
+    ('plastic', {'E': 10e6, 'Nu': .33, 'Y': 40e3}, {}),
+    ('vonmises', {'K': 1.E+10, 'G': 3.75E+09, 'Y0': 1.E+07, 'H': 1.E+08,
+                  'BETA': .5}, {}),
+    ('pyplastic', {'K': 1.0667E+09, 'G': 1.E+08, 'A1': 7.0711E+05,
+                   'A4': .288675}, {}),
+    ('mooney_rivlin', {'C10': 72, 'C01': 7.56, 'NU': .49}, {}),
+    (UHYPER, {'C10': 86.2, 'D1': .00138}, {'libname': 'uhyper_t',
+        'param_names': ('C10', 'D1'),
+        'source_files': [os.path.join(MAT_D, 'src/uhyper_neohooke.f90')]}),
+    (UMAT, {'E': 500., 'Nu': .45}, {'libname': 'umat_t',
+        'param_names': ('E', 'Nu'),
+        'source_files': [os.path.join(MAT_D, 'src/umat_neohooke.f90')]}),
+]
+
+class Benchmark(object):
+    '''A timed function
+
+    Parameters
+    ----------
+    name : str
+        Name of the benchmark, the key of its baseline timing
+    func : callable
+        The function timed, called as func(*args)
+    args : tuple
+        Arguments to func
+    setup : callable
+        If given, args are setup(*args), computed (untimed) before the first
+        call to func
+
+    '''
+    def __init__(self, name, func, *args, **kwargs):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.setup = kwargs.pop('setup', None)
+        self.repeat = kwargs.pop('repeat', 3)
+
+    def __repr__(self):
+        return 'Benchmark({0!r})'.format(self.name)
+
+    def run(self):
+        '''The best time of repeat calls to func'''
+        args = self.args
+        if self.setup is not None:
+            args = self.setup(*args)
+        return timeit(self.func, *args, repeat=self.repeat)
+
+def kinematics(n, module, func):
+    '''n calls to update_deformation or deps2d of module'''
+    F = np.eye(3).reshape(9)
+    e = np.zeros(6)
+    d = np.array([.01, -.005, -.005, .002, 0., 0.])
+    de = np.array([.01, 0., 0., 0., 0., 0.])
+    if func == 'update_deformation':
+        update = module.update_deformation
+        for i in xrange(n):
+            F, e = update(.01, 0., F, d)
+    else:
+        deps2d = module.deps2d
+        for i in xrange(n):
+            d = deps2d(.01, 0., e, de)
+    return F
+
+def material_state(d, name='vonmises'):
+    '''A material set up by a simulator and the arguments of its
+    numerical_jacobian'''
+    parameters, kwargs = [(p, k) for (m, p, k) in MATERIALS if m == name][0]
+    mps = MaterialPointSimulator('bench_jacobian', verbosity=-1, d=d)
+    material = mps.Material(name, parameters, **kwargs)
+    args = (0., .01, DEFAULT_TEMP, 0., 0., I9, I9, Z6,
+            np.array([.01, 0., 0., 0., 0., 0.]), np.zeros(3), Z6,
+            np.array(material.initial_sdv), range(6))
+    return material, args
+
+def numerical_jacobian(n, material, args):
+    for i in xrange(n):
+        material.numerical_jacobian(*args)
+
+def run_material(d, name, parameters, kwargs, descriptors, frames):
+    '''Load and unload along the uniaxial strain or stress path'''
+    mps = MaterialPointSimulator('bench_' + name, verbosity=-1, d=d)
+    mps.Material(name, parameters, **kwargs)
+    mps.MixedStep(components=(.02, 0, 0), descriptors=descriptors,
+                  frames=frames)
+    mps.MixedStep(components=(0, 0, 0), descriptors=descriptors,
+                  frames=frames)
+    return mps
+
+def abaqus_setup(name, n):
+    '''The update_state of the umat or uhyper material name'''
+    from matmodlab.mmd.material import Material
+    parameters, kwargs = [(p, k) for (m, p, k) in bench_abaqus.MATERIALS
+                          if m == name][0]
+    log = logging.getLogger('matmodlab.mmd.simulator')
+    level = log.level
+    log.setLevel(logging.WARN)
+    try:
+        material = Material(name, parameters, **kwargs)
+    finally:
+        log.setLevel(level)
+    return (type(material).update_state.im_func, material, n)
+
+def dump_setup(d, format, frames):
+    mps = MaterialPointSimulator('bench_dump', verbosity=-1, d=d,
+                                 output_format=format)
+    mps.Material('elastic', MATERIALS[0][1])
+    mps.StrainStep(components=(.02, 0., 0.), frames=frames)
+    return (mps, format)
+
+def dump(mps, format):
+    mps.dump(format=format)
+
+def load_setup(d, format, frames):
+    mps, format = dump_setup(d, format, frames)
+    mps.dump(format=format)
+    return (mps.filename,)
+
+def load(filename):
+    # the header of csv files is not commented
+    skiprows = 1 if filename.endswith('.' + CSV) else 0
+    loadfile(filename, disp=0, skiprows=skiprows)
+
+def permutation_job(x, xnames, d, job, *args):
+    mps = MaterialPointSimulator(job, verbosity=-1, d=d)
+    mps.Material('elastic', dict(zip(xnames, x)))
+    mps.StrainStep(components=(.01, .01, .01), frames=50)
+    mps.StrainStep(components=(0., 0., 0.), frames=50)
+    return np.amax(mps.get('S.XX', disp=-1))
+
+def permutation(d, n):
+    K = PermutateVariable('K', np.linspace(1e9, 1e10, n))
+    G = PermutateVariable('G', np.linspace(1e9, 1e10, n))
+    permutator = Permutator('bench_permutation', permutation_job, [K, G],
+                            method=COMBINATION, descriptors=['MAX_SXX'],
+                            d=d, verbosity=0)
+    permutator.run()
+
+def startup_setup(registry):
+    '''Write the material registry read by the timed startups'''
+    startup(registry)
+    return (registry,)
+
+def benchmarks(d, scale=1.):
+    '''The benchmarks of the suite, writing their output to directory d.
+    Sizes are multiplied by scale'''
+    N = lambda n: max(int(n * scale), 2)
+    items = []
+    for module, label in ((mml, 'compiled'), (_mmlabpack, 'python')):
+        if module is mml and not mml.compiled:
+            continue
+        for func in ('update_deformation', 'deps2d'):
+            name = 'kinematics/{0}/{1}'.format(func, label)
+            items.append(Benchmark(name, kinematics, N(10000), module, func))
+
+    items.append(Benchmark('jacobian/numerical', numerical_jacobian, N(1000),
+                           setup=lambda n: (n,) + material_state(d)))
+
+    for (name, parameters, kwargs) in MATERIALS:
+        for (kind, descriptors) in (('strain', 'EEE'), ('stress', 'ESS')):
+            items.append(Benchmark('material/{0}/{1}'.format(name, kind),
+                                   run_material, d, name, parameters, kwargs,
+                                   descriptors, N(500), repeat=1))
+
+    for (name, parameters, kwargs) in bench_abaqus.MATERIALS:
+        items.append(Benchmark('abaqus/{0}/update_state'.format(name),
+                               bench_abaqus.run_increments, name, N(10000),
+                               setup=abaqus_setup))
+
+    for n in (1000, 10000, 100000):
+        items.append(Benchmark('records/cache/{0}'.format(n), make_records,
+                               N(n), repeat=1))
+
+    for format in DB_FMTS:
+        items.append(Benchmark('io/dump/{0}'.format(format), dump, d, format,
+                               N(10000), setup=dump_setup))
+        items.append(Benchmark('io/loadfile/{0}'.format(format), load, d,
+                               format, N(10000), setup=load_setup))
+
+    items.append(Benchmark('permutator/combination', permutation, d,
+                           max(int(5 * scale ** .5), 2), repeat=1))
+
+    items.append(Benchmark('startup/import', run, 'import matmodlab'))
+    items.append(Benchmark('startup/import_material', startup,
+                           os.path.join(d, 'materials.json'),
+                           setup=startup_setup))
+    return items
+
+def compare_timing(t, base, dtol=BENCH_DIFFTOL, ftol=BENCH_FAILTOL):
+    '''Status of the timing t against the baseline timing base'''
+    if base is None:
+        return None
+    slowdown = (t - base) / base if base > 0. else 0.
+    if slowdown < dtol:
+        return SAME
+    elif slowdown < ftol:
+        return DIFF
+    return NOT_SAME
+
+def read_baseline(filename):
+    '''The baseline timings stored in filename, by benchmark name'''
+    if not os.path.isfile(filename):
+        return {}
+    with open(filename) as fh:
+        return json.load(fh)
+
+def write_baseline(filename, timings):
+    '''Store timings in filename, keeping those of benchmarks not run'''
+    baseline = read_baseline(filename)
+    baseline.update(timings)
+    d = os.path.dirname(filename)
+    if d and not os.path.isdir(d):
+        os.makedirs(d)
+    with open(filename, 'w') as fh:
+        json.dump(baseline, fh, indent=2, sort_keys=True)
+
+def run_suite(baseline=None, pattern=None, scale=1., save=False,
+              dtol=BENCH_DIFFTOL, ftol=BENCH_FAILTOL, stream=sys.stdout):
+    '''Run the benchmarks whose names match the regular expression pattern
+    and compare their timings against those stored in baseline
+
+    Returns
+    -------
+    status : int
+        SAME, DIFF, or NOT_SAME, the worst status of the benchmarks run
+    timings : dict
+        The timings, by benchmark name
+
+    '''
+    baseline = baseline or DEFAULT_BASELINE
+    base = read_baseline(baseline)
+    d = tempfile.mkdtemp(prefix='mmlbench')
+    cwd = os.getcwd()
+    timings = {}
+    status, bad = [SAME], [[], []]
+    try:
+        os.chdir(d)
+        for item in benchmarks(d, scale=scale):
+            if pattern is not None and not re.search(pattern, item.name):
+                continue
+            t = timings[item.name] = item.run()
+            stat = compare_timing(t, base.get(item.name), dtol=dtol, ftol=ftol)
+            line = '{0:40s} {1:12.6f}s'.format(item.name, t)
+            if stat is None:
+                line += '  (no baseline)'
+            else:
+                line += '  ({0:.2f}x baseline)'.format(t / base[item.name])
+                line += {SAME: ' pass', DIFF: ' diff', NOT_SAME: ' fail'}[stat]
+                status.append(stat)
+                if stat != SAME:
+                    bad[stat - 1].append(item.name)
+            stream.write(line + '\n')
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(d, ignore_errors=True)
+
+    if bad[1]:
+        stream.write('Benchmarks that failed: {0}\n'.format(', '.join(bad[1])))
+    if bad[0]:
+        stream.write('Benchmarks that diffed: {0}\n'.format(', '.join(bad[0])))
+    status = max(status)
+    if status == SAME:
+        stream.write('\nTimings are the same\n')
+    elif status == DIFF:
+        stream.write('\nTimings diffed\n')
+    else:
+        stream.write('\nTimings are different\n')
+
+    if save:
+        write_baseline(baseline, timings)
+        stream.write('baseline timings written to {0}\n'.format(baseline))
+
+    return status, timings
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', default=DEFAULT_BASELINE,
+        help='Baseline timings file [default: %(default)s]')
+    parser.add_argument('-k',
+        help='Run only benchmarks whose names match the regular expression')
+    parser.add_argument('--scale', type=float, default=1.,
+        help='Scale the size of the benchmarks [default: %(default)s]')
+    parser.add_argument('--dtol', type=float, default=BENCH_DIFFTOL,
+        help='Relative slow down at which a benchmark diffs '
+             '[default: %(default)s]')
+    parser.add_argument('--ftol', type=float, default=BENCH_FAILTOL,
+        help='Relative slow down at which a benchmark fails '
+             '[default: %(default)s]')
+    parser.add_argument('--save', default=False, action='store_true',
+        help='Store the timings as the baseline [default: %(default)s]')
+    args = parser.parse_args(argv)
+    status, timings = run_suite(baseline=args.b, pattern=args.k,
+                                scale=args.scale, save=args.save,
+                                dtol=args.dtol, ftol=args.ftol)
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
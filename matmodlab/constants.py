@@ -38,6 +38,11 @@ I9 = np.array([1., 0., 0., 0., 1., 0., 0., 0., 1.])
 VOIGT = np.array([1, 1, 1, 2, 2, 2], dtype=np.float64)
 VOIGHT = VOIGT
 
+# The symmetric and deviatoric fourth order identities, as 6x6 matrices acting
+# on strains with engineering shear components
+ISYM6 = np.diag(1. / VOIGT)
+IDEV6 = ISYM6 - np.outer(I6, I6) / 3.
+
 DEFAULT_TEMP = 298.
 
 ROOT2 = np.sqrt(2.0)
@@ -0,0 +1,76 @@
+'''Work arrays of the Abaqus umat interface
+
+The umat, uhyper, and uanisohyper_inv wrappers call the Fortran umat with
+about twenty arguments. The arrays among them are allocated once per material
+instance, Fortran ordered and of the type the signature declares, and filled
+in place on each call so that f2py passes them to the umat without copying.
+
+'''
+import numpy as np
+
+__all__ = ['AbaqusWorkspace']
+
+class AbaqusWorkspace(object):
+    '''Arrays passed to, and returned by, the Fortran umat
+
+    Parameters
+    ----------
+    ordering : list of int
+        Abaqus ordering of the components of symmetric second order tensors
+    cmname : str
+        Material name passed to the umat
+
+    Notes
+    -----
+    stress, stran, and dstran hold the components of the stress, strain, and
+    strain increment in Abaqus ordering and dfgrd0, dfgrd1 the deformation
+    gradients, set by load. ddsdde, ddsddt, and drplde are zeroed by load,
+    the remaining arrays are constant.
+
+    '''
+    def __init__(self, ordering, cmname='umat'):
+        self.ordering = np.array(ordering, dtype=np.intp)
+        o = self.ordering
+        # flat indices in to ddsdde.T of the material stiffness in matmodlab
+        # ordering: ddsdde[o[j], o[i]] is component (i, j)
+        self.ddsdde_ix = o[:, np.newaxis] * 6 + o[np.newaxis, :]
+        self.cmname = '{0:8s}'.format(cmname)
+
+        self.stress = np.zeros(6)
+        self.stran = np.zeros(6)
+        self.dstran = np.zeros(6)
+        self.ddsdde = np.zeros((6, 6), order='F')
+        self.ddsddt = np.zeros(6)
+        self.drplde = np.zeros(6)
+        self.time = np.zeros(2)
+        self.predef = np.zeros(1)
+        self.dpred = np.zeros(1)
+        self.coords = np.zeros(3)
+        self.drot = np.eye(3, order='F')
+        self.dfgrd0 = np.zeros((3, 3), order='F')
+        self.dfgrd1 = np.zeros((3, 3), order='F')
+        # views of dfgrd0 and dfgrd1 with the layout of F
+        self.F0 = self.dfgrd0.reshape(9, order='F')
+        self.F = self.dfgrd1.reshape(9, order='F')
+
+    def load(self, time, dtime, F0, F, stran, d, stress):
+        '''Fill the work arrays for the umat call of an increment'''
+        o = self.ordering
+        self.time.fill(time)
+        self.F0[:] = F0
+        self.F[:] = F
+        # abaqus ordering
+        np.take(stress, o, out=self.stress)
+        np.take(stran, o, out=self.stran)
+        np.take(d, o, out=self.dstran)
+        self.dstran *= dtime
+        self.ddsdde.fill(0.)
+        self.ddsddt.fill(0.)
+        self.drplde.fill(0.)
+
+    def results(self):
+        '''The stress and material stiffness, in matmodlab ordering, of the
+        last umat call'''
+        stress = self.stress.take(self.ordering)
+        ddsdde = self.ddsdde.T.take(self.ddsdde_ix)
+        return stress, ddsdde
@@ -1,9 +1,10 @@
 import logging
-from numpy import dot, ix_, zeros
+from numpy import dot, ix_, zeros, einsum
 from matmodlab.mmd.material import MaterialModel
 
 class PyElastic(MaterialModel):
     name = "pyelastic"
+    complex_step = True
 
     @classmethod
     def param_names(cls, n):
@@ -73,3 +74,25 @@ class PyElastic(MaterialModel):
         stress += dot(ddsdde, d * dtime)
 
         return stress, statev, ddsdde
+
+    def update_state_batch(self, time, dtime, temp, dtemp, energy, rho, F0, F,
+        stran, d, elec_field, stress, statev, params=None, **kwargs):
+        """Compute updated stress of N material points given strain increments"""
+
+        # elastic properties of each point
+        K, G = self.batch_parameters(params, len(stress)).T
+
+        K3 = 3. * K
+        G2 = 2. * G
+        Lam = (K3 - G2) / 3.
+
+        # elastic stiffness of each point
+        ddsdde = zeros((len(stress), 6, 6))
+        ddsdde[:, :3, :3] = Lam[:, None, None]
+        ddsdde[:, range(3), range(3)] += G2[:, None]
+        ddsdde[:, range(3,6), range(3,6)] = G[:, None]
+
+        # stress update
+        stress += einsum('nij,nj->ni', ddsdde, d * dtime)
+
+        return stress, statev, ddsdde
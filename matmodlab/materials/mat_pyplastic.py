@@ -1,11 +1,11 @@
 import logging
 import numpy as np
 from matmodlab.mmd.material import MaterialModel
-from matmodlab.constants import ROOT2, ROOT3, TOOR2, TOOR3, I6, VOIGT
-
+from matmodlab.constants import ROOT2, ROOT3, TOOR2, TOOR3, I6, VOIGT, IDEV6
 
 class PyPlastic(MaterialModel):
     name = 'pyplastic'
+    complex_step = True
 
     @classmethod
     def param_names(cls, n):
@@ -107,55 +107,153 @@ class PyPlastic(MaterialModel):
         statev : array_like
             State dependent variables
 
+        ddsdde : array_like
+            Consistent tangent stiffness
+
         '''
         sigsave = np.copy(stress)
         # Define helper functions and unload params/state vars
         A1 = self.params['A1']
         A4 = self.params['A4']
-        idx = lambda x: self.sdv_keys.index(x.upper())
-        ep = statev[idx('EP_XX'):idx('EP_YZ')+1]
+        ix = self.sdv_map
+        ep = statev[ix.EP]
 
         # Compute the trial stress and invariants
         stress = stress + self.dot_with_elastic_stiffness(d / VOIGT * dtime)
         i1 = self.i1(stress)
         rootj2 = self.rootj2(stress)
         if rootj2 - (A1 - A4 * i1) <= 0.0:
-            statev[idx('ISPLASTIC')] = 0.0
+            statev[ix.ISPLASTIC] = 0.0
+            ddsdde = self.elastic_stiffness()
         else:
-            statev[idx('ISPLASTIC')] = 1.0
-
-            s = self.dev(stress)
-            N = ROOT2 * A4 * I6 + s / self.tensor_mag(s)
-            N = N / np.sqrt(6.0 * A4 ** 2 + 1.0)
-            P = self.dot_with_elastic_stiffness(N)
+            statev[ix.ISPLASTIC] = 1.0
 
             # 1) Check if linear drucker-prager
             # 2) Check if trial stress is beyond the vertex
-            # 3) Check if trial stress is in the vertex
+            # 3) Check if trial stress is in the vertex, the cone of trial
+            #    stresses whose return direction P = C:N, with
+            #    rootj2(P) / i1(P) = G / (9 K A4), passes through the vertex
             if (A4 != 0.0 and
                     i1 > A1 / A4 and
-                    rootj2 / (i1 - A1 / A4) < self.rootj2(P) / self.i1(P)):
+                    rootj2 / (i1 - A1 / A4) < self.params['G'] /
+                    (9.0 * self.params['K'] * A4)):
                 dstress = stress - A1 / A4 / 3.0 * I6
                 # convert all of the extra strain into plastic strain
                 ep += self.iso(dstress) / (3.0 * self.params['K'])
                 ep += self.dev(dstress) / (2.0 * self.params['G'])
                 stress = A1 / A4 / 3.0 * I6
+                # the stress is held at the vertex
+                ddsdde = np.zeros((6, 6))
             else:
                 # not in vertex; do regular return
+                s = self.dev(stress)
+                N = ROOT2 * A4 * I6 + s / self.tensor_mag(s)
+                N = N / np.sqrt(6.0 * A4 ** 2 + 1.0)
+                P = self.dot_with_elastic_stiffness(N)
                 lamb = ((rootj2 - A1 + A4 * i1) / (A4 * self.i1(P)
                         + self.rootj2(P)))
                 stress = stress - lamb * P
                 ep += lamb * N
+                ddsdde = self.consistent_stiffness(s, rootj2 - A1 + A4 * i1)
 
             # Save the updated plastic strain
-            statev[idx('EP_XX'):idx('EP_YZ')+1] = ep
+            statev[ix.EP] = ep
+
+        statev[ix.I1] = self.i1(stress)
+        statev[ix.ROOTJ2] = self.rootj2(stress)
+        statev[ix.YROOTJ2] = A1 - A4 * self.i1(stress)
+
+        return stress, statev, ddsdde
+
+    def update_state_batch(self, time, dtime, temp, dtemp, energy, rho, F0, F,
+        stran, d, elec_field, stress, statev, params=None, **kwargs):
+        '''Compute updated stress of N material points
+
+        The arguments are those of update_state, stacked for each point: d
+        and stress are (N,6) and statev is (N,nsdv). params, if given, is the
+        (N,4) array of parameters of each point.
+
+        '''
+        K, G, A1, A4 = self.batch_parameters(params, len(stress)).T
+        ix = self.sdv_map
+        col = lambda a: a[:, np.newaxis]
+        iso = lambda A: col(A[:, :3].sum(axis=1)) / 3.0 * I6
+        dev = lambda A: A - iso(A)
+        i1 = lambda A: A[:, :3].sum(axis=1)
+        mag = lambda A: np.sqrt(np.sum(A[:, :3] ** 2, axis=1) +
+                                2.0 * np.sum(A[:, 3:] ** 2, axis=1))
+        rootj2 = lambda A: mag(dev(A)) * TOOR2
+
+        # Compute the trial stress and invariants
+        de = d / VOIGT * dtime
+        stress = stress + 3.0 * col(K) * iso(de) + 2.0 * col(G) * dev(de)
+        i1_trial = i1(stress)
+        rootj2_trial = rootj2(stress)
+        plastic = rootj2_trial - (A1 - A4 * i1_trial) > 0.0
+        statev[:, ix.ISPLASTIC] = np.where(plastic, 1.0, 0.0)
+
+        if np.any(plastic):
+            # only the points that yielded are returned to the surface
+            k, g, a1, a4 = K[plastic], G[plastic], A1[plastic], A4[plastic]
+            sig, ep = stress[plastic], statev[plastic, ix.EP]
+            i1_trial, rootj2_trial = i1_trial[plastic], rootj2_trial[plastic]
+
+            # points beyond the vertex are returned to it
+            with np.errstate(divide='ignore', invalid='ignore'):
+                apex = a1 / a4
+                vertex = ((a4 != 0.0) & (i1_trial > apex) &
+                          (rootj2_trial / (i1_trial - apex) <
+                           g / (9.0 * k * a4)))
+            if np.any(vertex):
+                a = col(apex[vertex]) / 3.0 * I6
+                dstress = sig[vertex] - a
+                ep[vertex] += (iso(dstress) / (3.0 * col(k[vertex])) +
+                               dev(dstress) / (2.0 * col(g[vertex])))
+                sig[vertex] = a
+
+            # the others have a regular return
+            r = ~vertex
+            s = dev(sig[r])
+            N = ROOT2 * col(a4[r]) * I6 + s / col(mag(s))
+            N = N / col(np.sqrt(6.0 * a4[r] ** 2 + 1.0))
+            P = 3.0 * col(k[r]) * iso(N) + 2.0 * col(g[r]) * dev(N)
+            lamb = ((rootj2_trial[r] - a1[r] + a4[r] * i1_trial[r]) /
+                    (a4[r] * i1(P) + rootj2(P)))
+            sig[r] = sig[r] - col(lamb) * P
+            ep[r] += col(lamb) * N
+
+            stress[plastic] = sig
+            statev[plastic, ix.EP] = ep
 
-        statev[idx('I1')] = self.i1(stress)
-        statev[idx('ROOTJ2')] = self.rootj2(stress)
-        statev[idx('YROOTJ2')] = A1 - A4 * self.i1(stress)
+        statev[:, ix.I1] = i1(stress)
+        statev[:, ix.ROOTJ2] = rootj2(stress)
+        statev[:, ix.YROOTJ2] = A1 - A4 * i1(stress)
 
         return stress, statev, None
 
+    def elastic_stiffness(self):
+        return (self.params['K'] * np.outer(I6, I6) +
+                2.0 * self.params['G'] * IDEV6)
+
+    def consistent_stiffness(self, s, f):
+        '''Tangent of the return from the trial stress with deviator s and
+        yield function value f
+
+        The return is sig = sig_trial - f / h * B, with
+        B = 3 K A4 I + sqrt(2) G n, n = s / |s|, and h = 9 K A4^2 + G. B is
+        also df/deps, and the derivative of n brings in the deviatoric
+        projection normal to n
+
+        '''
+        K, G, A4 = self.params['K'], self.params['G'], self.params['A4']
+        smag = self.tensor_mag(s)
+        n = s / smag
+        h = 9.0 * K * A4 ** 2 + G
+        B = 3.0 * K * A4 * I6 + ROOT2 * G * n
+        return (self.elastic_stiffness() - np.outer(B, B) / h
+                - 2.0 * ROOT2 * G ** 2 * f / (h * smag) *
+                (IDEV6 - np.outer(n, n)))
+
     def dot_with_elastic_stiffness(self, A):
         return (3.0 * self.params['K'] * self.iso(A) +
                 2.0 * self.params['G'] * self.dev(A))
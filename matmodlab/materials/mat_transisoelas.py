@@ -2,8 +2,13 @@ import numpy as np
 from matmodlab.mmd.material import MaterialModel
 from matmodlab.constants import VOIGT
 
+# symmetric 3x3 tensor components gathered from their Voigt slots, and back
+TENSOR = [[0, 3, 5], [3, 1, 4], [5, 4, 2]]
+VOIGT_I, VOIGT_J = [0, 1, 2, 0, 1, 0], [0, 1, 2, 1, 2, 2]
+
 class TransIsoElas(MaterialModel):
     name = "transisoelas"
+    complex_step = True
 
     @classmethod
     def param_names(cls, n):
@@ -27,9 +32,8 @@ class TransIsoElas(MaterialModel):
             self.params['A0'] = self.params['G']
 
         vec = np.array([self.params["V1"], self.params["V2"], self.params["V3"]])
-        vmag = np.sqrt(np.dot(vec, vec))
-        vec = vec / vmag if vmag > 0.0 else np.array([1, 0, 0])
-        self.M = np.outer(vec, vec)
+        self.M = self.structure_tensor(vec[np.newaxis, :])[0]
+        self.ddsdde = self.stiffness(self.M)
 
         xkeys = ["EPS_XX", "EPS_YY", "EPS_ZZ", "EPS_XY", "EPS_YZ", "EPS_XZ"]
         xvals = np.zeros(len(xkeys))
@@ -61,6 +65,9 @@ class TransIsoElas(MaterialModel):
         statev : array_like
             Updated state dependent variables
 
+        ddsdde : array_like
+            Stiffness
+
         """
 
         # Handle strain-related tasks
@@ -87,4 +94,68 @@ class TransIsoElas(MaterialModel):
         retstress = np.array([stress[0, 0], stress[1, 1], stress[2, 2],
                               stress[0, 1], stress[1, 2], stress[0, 2]])
 
-        return retstress, statev, None
+        return retstress, statev, self.ddsdde.copy()
+
+    def stiffness(self, M):
+        """The stiffness dsig/deps of the material with structure tensor M,
+        constant since the stress is linear in the strain"""
+        p = self.params
+        I = np.eye(3)
+        II = .5 * (np.einsum('ik,jl->ijkl', I, I) +
+                   np.einsum('il,jk->ijkl', I, I))
+        # derivative of M.D + D.M, symmetrized in kl
+        MI = .5 * (np.einsum('ik,jl->ijkl', M, I) +
+                   np.einsum('il,jk->ijkl', M, I) +
+                   np.einsum('ik,lj->ijkl', I, M) +
+                   np.einsum('il,kj->ijkl', I, M))
+        C = (np.einsum('ij,kl->ijkl', I, p["B0"] * I + p["C0"] * M) +
+             np.einsum('ij,kl->ijkl', M, p["B1"] * I + p["C1"] * M) +
+             p["A2"] * II + p["A3"] * MI)
+        # to 6x6, engineering shear strains
+        return C[VOIGT_I, VOIGT_J][:, VOIGT_I, VOIGT_J]
+
+    @staticmethod
+    def structure_tensor(vec):
+        """The structure tensors M = v x v of the unit vectors along each row
+        of vec.  Rows of zero length are taken along the x axis"""
+        vmag = np.sqrt(np.sum(vec * vec, axis=1))
+        vec = np.array(vec, dtype=np.float64)
+        vec[vmag <= 0.0] = [1, 0, 0]
+        vmag[vmag <= 0.0] = 1.
+        vec = vec / vmag[:, np.newaxis]
+        return np.einsum('ni,nj->nij', vec, vec)
+
+    def update_state_batch(self, time, dtime, temp, dtemp, energy, rho, F0, F,
+        stran, d, elec_field, stress, statev, params=None, **kwargs):
+        """Compute updated stress of N material points
+
+        The arguments are those of update_state, stacked for each point: d
+        and stress are (N,6) and statev is (N,nsdv). params, if given, is the
+        (N,13) array of parameters of each point.
+
+        """
+        p = self.batch_parameters(params, len(stress))
+        A0, A1, A2, A3, B0, B1, C0, C1 = p[:, :8].T
+        if params is None:
+            M = np.tile(self.M, (len(stress), 1, 1))
+        else:
+            M = self.structure_tensor(p[:, 8:11])
+
+        # Handle strain-related tasks
+        eps = np.array(statev) + d / VOIGT * dtime
+        D = eps[:, TENSOR]
+        statev = eps
+
+        # Calculate some helper functions
+        trD = np.trace(D, axis1=1, axis2=2)
+        MD = np.einsum('nij,njk->nik', M, D)
+        trMD = np.trace(MD, axis1=1, axis2=2)
+        alpha0 = A0 + B0 * trD + C0 * trMD
+        alpha1 = A1 + B1 * trD + C1 * trMD
+        col = lambda a: a[:, np.newaxis, np.newaxis]
+
+        # Actually calculate the stress
+        stress = (col(alpha0) * np.eye(3, 3) + col(alpha1) * M + col(A2) * D
+                  + col(A3) * (MD + np.einsum('nij,njk->nik', D, M)))
+
+        return stress[:, VOIGT_I, VOIGT_J], statev, None
@@ -6,6 +6,7 @@ from matmodlab.product import PKG_D
 import matmodlab.utils.mmlabpack as mmlabpack
 from matmodlab.mmd.simulator import CB
 from matmodlab.mmd.material import MaterialModel
+from matmodlab.materials.aba_workspace import AbaqusWorkspace
 from matmodlab.materials.product import ABA_UMAT_PYF, ABA_UTL, UMAT
 from matmodlab.utils.errors import StopFortran
 
@@ -35,6 +36,7 @@ class UMat(MaterialModel):
         log = logging.getLogger('matmodlab.mmd.simulator')
 
         self.ordering = kwargs.get('ordering', [0, 1, 2, 3, 5, 4])
+        self.workspace = AbaqusWorkspace(self.ordering)
 
         # depvar must be at least 1 (cannot pass reference to empty list)
         depvar = kwargs.get('depvar', 1)
@@ -62,39 +64,25 @@ class UMat(MaterialModel):
 
         log = logging.getLogger('matmodlab.mmd.simulator')
 
+        # work arrays, in abaqus ordering
+        ws = self.workspace
+        ws.load(time, dtime, F0, F, stran, d, stress)
+
         # abaqus defaults
-        cmname = '{0:8s}'.format('umat')
-        dfgrd0 = np.reshape(F0, (3, 3), order='F')
-        dfgrd1 = np.reshape(F, (3, 3), order='F')
-        dstran = d * dtime
-        ddsdde = np.zeros((6, 6), order='F')
-        ddsddt = np.zeros(6, order='F')
-        drplde = np.zeros(6, order='F')
-        predef = np.zeros(1, order='F')
-        dpred = np.zeros(1, order='F')
-        coords = np.zeros(3, order='F')
-        drot = np.eye(3)
         ndi = nshr = 3
         spd = scd = rpl = drpldt = pnewdt = 0.
         noel = npt = layer = kspt = kinc = 1
         sse = mmlabpack.ddot(stress, stran) / rho
         celent = 1.
         kstep = 1
-        time = np.array([time, time])
-        # abaqus ordering
-        stress = stress[self.ordering]
-        # abaqus passes engineering strain
-        dstran = dstran[self.ordering]
-        stran = stran[self.ordering]
 
-        self.lib.umat(stress, statev, ddsdde,
-            sse, spd, scd, rpl, ddsddt, drplde, drpldt, stran, dstran,
-            time, dtime, temp, dtemp, predef, dpred, cmname, ndi, nshr,
-            self.num_sdv, self.params, coords, drot, pnewdt, celent, dfgrd0,
-            dfgrd1, noel, npt, layer, kspt, kstep, kinc, log.info, log.warn,
-            StopFortran)
-        stress = stress[self.ordering]
-        ddsdde = ddsdde[self.ordering, [[i] for i in self.ordering]]
+        self.lib.umat(ws.stress, statev, ws.ddsdde,
+            sse, spd, scd, rpl, ws.ddsddt, ws.drplde, drpldt, ws.stran,
+            ws.dstran, ws.time, dtime, temp, dtemp, ws.predef, ws.dpred,
+            ws.cmname, ndi, nshr, self.num_sdv, self.params, ws.coords, ws.drot,
+            pnewdt, celent, ws.dfgrd0, ws.dfgrd1, noel, npt, layer, kspt, kstep,
+            kinc, log.info, log.warn, StopFortran)
+        stress, ddsdde = ws.results()
         if abs(pnewdt) > 1e-12:
             CB.request_cutback(pnewdt=pnewdt)
         return stress, statev, ddsdde
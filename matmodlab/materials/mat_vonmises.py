@@ -2,10 +2,15 @@ import logging
 import numpy as np
 
 from matmodlab.mmd.material import MaterialModel
-from matmodlab.constants import ROOT2, ROOT23, VOIGT
+from matmodlab.constants import ROOT2, ROOT23, VOIGT, I6, IDEV6
+
+# The back stress is stored in the order XX, YY, ZZ, XY, XZ, YZ.  VOIGT_BS
+# takes it to Voigt order, and back.
+VOIGT_BS = [0, 1, 2, 3, 5, 4]
 
 class VonMises(MaterialModel):
     name = 'vonmises'
+    complex_step = True
 
     @classmethod
     def param_names(cls, n):
@@ -103,19 +108,17 @@ class VonMises(MaterialModel):
         statev : array_like
             State dependent variables
 
+        ddsdde : array_like
+            Consistent tangent stiffness
+
         '''
-        idx = lambda x: self.sdv_keys.index(x.upper())
-        bs = np.array([statev[idx('BS_XX')],
-                       statev[idx('BS_YY')],
-                       statev[idx('BS_ZZ')],
-                       statev[idx('BS_XY')],
-                       statev[idx('BS_YZ')],
-                       statev[idx('BS_XZ')]])
-        yn = statev[idx('Y')]
+        ix = self.sdv_map
+        bs = statev[ix.BS][VOIGT_BS]
+        yn = statev[ix.Y]
 
         de = d / VOIGT * dtime
 
-        iso = de[:3].sum() / 3.0 * np.array([1.0, 1.0, 1.0, 0.0, 0.0, 0.0])
+        iso = de[:3].sum() / 3.0 * I6
         dev = de - iso
 
         stress_trial = stress + 3.0 * self.params['K'] * iso + 2.0 * self.params['G'] * dev
@@ -124,10 +127,10 @@ class VonMises(MaterialModel):
         xi_trial_eqv = self.eqv(xi_trial)
 
         if xi_trial_eqv <= yn:
-            statev[idx('SIGE')] = xi_trial_eqv
-            return stress_trial, statev, None
+            statev[ix.SIGE] = xi_trial_eqv
+            return stress_trial, statev, self.elastic_stiffness()
         else:
-            N = xi_trial - xi_trial[:3].sum() / 3.0 * np.array([1.0, 1.0, 1.0, 0.0, 0.0, 0.0])
+            N = xi_trial - xi_trial[:3].sum() / 3.0 * I6
             N = N / (ROOT23 * xi_trial_eqv)
             deqps = (xi_trial_eqv - yn) / (3.0 * self.params['G'] + self.params['H'])
             dps = 1. / ROOT23 * deqps * N
@@ -136,19 +139,81 @@ class VonMises(MaterialModel):
 
             bs = bs + 2.0 / 3.0 * self.params['H'] * self.params['BETA'] * dps
 
-            statev[idx('EQPS')] += deqps
-            statev[idx('Y')] += self.params['H'] * (1.0 - self.params['BETA']) * deqps
-            statev[idx('BS_XX')] = bs[0]
-            statev[idx('BS_YY')] = bs[1]
-            statev[idx('BS_ZZ')] = bs[2]
-            statev[idx('BS_XY')] = bs[3]
-            statev[idx('BS_YZ')] = bs[4]
-            statev[idx('BS_XZ')] = bs[5]
-            statev[idx('SIGE')] = self.eqv(stress_final - bs)
-            return stress_final, statev, None
+            statev[ix.EQPS] += deqps
+            statev[ix.Y] += self.params['H'] * (1.0 - self.params['BETA']) * deqps
+            statev[ix.BS] = bs[VOIGT_BS]
+            statev[ix.SIGE] = self.eqv(stress_final - bs)
+
+            # consistent tangent of the radial return (Simo and Hughes,
+            # Box 3.2), with 3 G deqps / xi_trial_eqv = 2 G dgamma / |s_trial|
+            K, G, H = self.params['K'], self.params['G'], self.params['H']
+            theta = 1.0 - 3.0 * G * deqps / xi_trial_eqv
+            thetab = 3.0 * G / (3.0 * G + H) - (1.0 - theta)
+            ddsdde = (K * np.outer(I6, I6) + 2.0 * G * theta * IDEV6
+                      - 2.0 * G * thetab * np.outer(N, N))
+            return stress_final, statev, ddsdde
+
+    def update_state_batch(self, time, dtime, temp, dtemp, energy, rho, F0, F,
+        stran, d, elec_field, stress, statev, params=None, **kwargs):
+        '''Compute updated stress of N material points
+
+        The arguments are those of update_state, stacked for each point: d
+        and stress are (N,6) and statev is (N,nsdv). params, if given, is the
+        (N,5) array of parameters of each point.
+
+        '''
+        K, G, Y0, H, BETA = self.batch_parameters(params, len(stress)).T
+        ix = self.sdv_map
+        bs = statev[:, ix.BS][:, VOIGT_BS]
+        yn = statev[:, ix.Y]
+
+        de = d / VOIGT * dtime
+        iso = de[:, :3].sum(axis=1)[:, np.newaxis] / 3.0 * I6
+        dev = de - iso
+
+        stress_trial = (stress + 3.0 * K[:, np.newaxis] * iso
+                        + 2.0 * G[:, np.newaxis] * dev)
 
+        xi_trial = stress_trial - bs
+        xi_trial_eqv = self.eqv_batch(xi_trial)
+        plastic = xi_trial_eqv > yn
+        statev[:, ix.SIGE] = xi_trial_eqv
+        if not np.any(plastic):
+            return stress_trial, statev, None
+
+        # radial return of the points that yielded
+        xi_trial = xi_trial[plastic]
+        xi_trial_eqv = xi_trial_eqv[plastic]
+        G, H, BETA = G[plastic], H[plastic], BETA[plastic]
+        N = xi_trial - xi_trial[:, :3].sum(axis=1)[:, np.newaxis] / 3.0 * I6
+        N = N / (ROOT23 * xi_trial_eqv[:, np.newaxis])
+        deqps = (xi_trial_eqv - yn[plastic]) / (3.0 * G + H)
+        dps = 1. / ROOT23 * deqps[:, np.newaxis] * N
+
+        stress_final = (stress_trial[plastic]
+                        - (2.0 * G / ROOT23 * deqps)[:, np.newaxis] * N)
+        bs = bs[plastic] + (2.0 / 3.0 * H * BETA)[:, np.newaxis] * dps
+
+        stress_trial[plastic] = stress_final
+        sdv = statev[plastic]
+        sdv[:, ix.EQPS] += deqps
+        sdv[:, ix.Y] += H * (1.0 - BETA) * deqps
+        sdv[:, ix.BS] = bs[:, VOIGT_BS]
+        sdv[:, ix.SIGE] = self.eqv_batch(stress_final - bs)
+        statev[plastic] = sdv
+        return stress_trial, statev, None
+
+    def elastic_stiffness(self):
+        return (self.params['K'] * np.outer(I6, I6) +
+                2.0 * self.params['G'] * IDEV6)
 
     def eqv(self, sig):
         # Returns sqrt(3 * rootj2) = sig_eqv = q
-        s = sig - sig[:3].sum() / 3.0 * np.array([1.0, 1.0, 1.0, 0.0, 0.0, 0.0])
+        s = sig - sig[:3].sum() / 3.0 * I6
         return 1. / ROOT23 * np.sqrt(np.dot(s[:3], s[:3]) + 2 * np.dot(s[3:], s[3:]))
+
+    def eqv_batch(self, sig):
+        # eqv of each row of sig
+        s = sig - sig[:, :3].sum(axis=1)[:, np.newaxis] / 3.0 * I6
+        return 1. / ROOT23 * np.sqrt(np.sum(s[:, :3] ** 2, axis=1) +
+                                     2 * np.sum(s[:, 3:] ** 2, axis=1))
@@ -20,7 +20,7 @@ class UserMaterial:
                  depvar, user_ics, ordering, builtin):
         self.libname = libname
         self.mat_class = mat_info.mat_class
-        self.source_files = source_files
+        self.source_files = list(source_files)
         self.source_files.extend(self.mat_class.aux_files())
         if not user_ics:
             self.source_files.append(SDVINI)
@@ -0,0 +1,528 @@
+import logging
+import numpy as np
+from time import time as tt
+from collections import OrderedDict
+from numpy.linalg import solve, lstsq
+
+from ..constants import *
+from ..mml_siteenv import environ
+from ..utils import mmlabpack as mml
+from ..utils.errors import MatmodlabError
+from ..utils.logio import setup_logger
+from .material import Material
+from .simulator import (InitialStep, StrainStep, StrainRateStep, StressStep,
+                        StressRateStep, DisplacementStep, DefGradStep,
+                        MixedStep, sig2d, CB, MAX_CUTBACK_DEPTH)
+
+__all__ = ['BatchMaterialPointSimulator']
+
+class BatchMaterialPointSimulator(object):
+    '''Run N independent material points in lockstep
+
+    The points share the step and frame structure (increments, frames,
+    descriptors, kappa, temperature) but may differ in material parameters
+    and in the components of each step. The state of the points is kept in
+    arrays whose leading dimension is the number of points, i.e., F is
+    (N,9), stress and strain (N,6), and statev (N,nsdv).
+
+    If the material defines update_state_batch, all points are updated with
+    one call per frame. Otherwise, the material of each point is updated in
+    turn.
+
+    '''
+    def __init__(self, job, verbosity=None, d=None,
+                 initial_temperature=DEFAULT_TEMP, no_cutback=False):
+        self.job = job
+        self.materials = None
+        self.initialized = False
+        self.verbosity = verbosity
+        self.initial_temperature = initial_temperature
+        self.directory = d
+        self.failed = False
+        self.no_cutback = environ.no_cutback or no_cutback
+        self._time = 0.
+
+        logger = setup_logger('matmodlab.mmd.simulator', None,
+                              verbosity=verbosity)
+
+        self.steps = OrderedDict()
+        p = {'temperature': initial_temperature}
+        self.steps['Step-0'] = [InitialStep('Step-0', **p)]
+
+        logger.info('Setting up batch simulator for job {0!r}'.format(job))
+
+    @property
+    def num_points(self):
+        if self.materials is None:
+            return 0
+        return len(self.materials)
+
+    @property
+    def material(self):
+        return self.materials[0]
+
+    def Material(self, model, parameters, **kwargs):
+        '''Create the material for each point
+
+        Parameters
+        ----------
+        model : str
+            Material model name
+        parameters : list
+            Material parameters of each point. The number of points is
+            len(parameters).
+
+        '''
+        kwargs['initial_temp'] = self.initial_temperature
+        self.materials = [Material(model, p, **kwargs) for p in parameters]
+        if not self.materials:
+            raise MatmodlabError('expected at least one set of parameters')
+        if len(set([type(m) for m in self.materials])) != 1:
+            raise MatmodlabError('all points must have the same material model')
+        self.params = np.array([np.asarray(m.params) for m in self.materials])
+        return self.materials
+
+    def vectorized(self, sqa_stiff=False):
+        '''Can the materials of all points be updated in one call?'''
+        m = self.material
+        if getattr(m, 'update_state_batch', None) is None:
+            return False
+        if environ.sqa or sqa_stiff:
+            return False
+        for x in self.materials:
+            if x.sqa_stiff or x.xpan is not None or x.visco_model is not None:
+                return False
+        return True
+
+    # --- Factor methods for creating steps ---
+    def StrainStep(self, **kwargs):
+        '''Factory method for the steps.StrainStep class'''
+        self.create_step(StrainStep, **kwargs)
+
+    def StrainRateStep(self, **kwargs):
+        '''Factory method for the steps.StrainRateStep class'''
+        self.create_step(StrainRateStep, **kwargs)
+
+    def StressStep(self, **kwargs):
+        '''Factory method for the steps.StressStep class'''
+        self.create_step(StressStep, **kwargs)
+
+    def StressRateStep(self, **kwargs):
+        '''Factory method for the steps.StressRateStep class'''
+        self.create_step(StressRateStep, **kwargs)
+
+    def DisplacementStep(self, **kwargs):
+        '''Factory method for the steps.DisplacementStep class'''
+        self.create_step(DisplacementStep, **kwargs)
+
+    def DefGradStep(self, **kwargs):
+        '''Factory method for the steps.DefGradStep class'''
+        self.create_step(DefGradStep, **kwargs)
+
+    def MixedStep(self, **kwargs):
+        '''Factory method for the steps.MixedStep class'''
+        self.create_step(MixedStep, **kwargs)
+
+    def create_step(self, step_class, **kwargs):
+        '''Create the step for each point and run it
+
+        The keyword components may be given per point as a sequence of N
+        component arrays, otherwise all points share the components.
+
+        '''
+        if self.materials is None:
+            raise MatmodlabError('The material must be set before '
+                                 'any analysis steps are created')
+        name = kwargs.pop('name', None)
+        if name is None:
+            name = 'Step-{0}'.format(len(self.steps))
+        elif name in self.steps:
+            raise MatmodlabError('duplicate step name {0}'.format(name))
+
+        if kwargs.get('adaptive'):
+            raise MatmodlabError('adaptive frames are not supported by the '
+                                 'batch simulator, points run in lockstep')
+
+        N = self.num_points
+        previous = self.steps.values()[-1]
+        kwargs['mat_stiff'] = self.material.completions['E']
+        components = kwargs.pop('components', None)
+        if components is not None and np.asarray(components).ndim == 2:
+            if len(components) != N:
+                raise MatmodlabError('expected components for each of the '
+                                     '{0} points on step {1}'.format(N, name))
+            steps = [step_class(name, previous[i % len(previous)],
+                                components=components[i], **kwargs)
+                     for i in range(N)]
+        else:
+            steps = [step_class(name, p, components=components, **kwargs)
+                     for p in previous]
+
+        step = steps[0]
+        for other in steps[1:]:
+            if (len(other.frames) != len(step.frames) or
+                not np.array_equal(other.descriptors, step.descriptors) or
+                other.kappa != step.kappa or other.increment != step.increment):
+                raise MatmodlabError('points must share the step and frame '
+                                     'structure of step {0}'.format(name))
+
+        number = len(self.steps)
+        for s in steps:
+            s.number = number
+        self.steps[name] = steps
+        try:
+            self.run_step(steps)
+        except:
+            self.failed = True
+            raise
+
+    def initialize_simulation(self):
+        '''initialize everything for running the steps
+
+        '''
+        logger = logging.getLogger('matmodlab.mmd.simulator')
+        logger.info('Setting up calculations...')
+
+        N = self.num_points
+        self.sdv_keys = self.material.sdv_keys
+        nsdv = len(self.sdv_keys)
+        for m in self.materials:
+            if len(m.sdv_keys) != nsdv:
+                raise MatmodlabError('all points must have the same '
+                                     'number of state variables')
+
+        self.records = BatchRecords(N)
+        self.records.add('Step', SCALAR)
+        self.records.add('Frame', SCALAR)
+        self.records.add('Time', SCALAR)
+        self.records.add('DTime', SCALAR)
+        self.records.add('S', TENSOR_3D, per_point=True)
+        self.records.add('E', TENSOR_3D, per_point=True)
+        self.records.add('F', TENSOR_3D_FULL, per_point=True)
+        self.records.add('D', TENSOR_3D, per_point=True)
+        self.records.add('DS', TENSOR_3D, per_point=True)
+        self.records.add('EF', VECTOR)
+        self.records.add('T', SCALAR)
+        self.records.add('SDV', SDV, per_point=True, keys=self.sdv_keys)
+
+        step = self.steps.values()[0][0]
+        frame = step.frames[0]
+        sdv = np.array([m.initial_sdv for m in self.materials])
+        self.state = dict(F=np.tile(I9, (N, 1)), stress=np.zeros((N, 6)),
+                          strain=np.zeros((N, 6)), statev=sdv,
+                          temp=step.temperature,
+                          efield=np.array(step.elec_field))
+
+        self.records.reserve(1)
+        self.records.cache(Step=step.number, Frame=frame.number,
+                           Time=frame.value, DTime=frame.increment,
+                           S=self.state['stress'], E=self.state['strain'],
+                           F=self.state['F'], D=np.zeros((N, 6)),
+                           DS=np.zeros((N, 6)), SDV=sdv,
+                           T=step.temperature, EF=step.elec_field)
+        self.records.advance()
+        self.initialized = True
+
+    def run_step(self, steps):
+        if not self.initialized:
+            self.initialize_simulation()
+        self.state = self._run_step(steps)
+        self.records.advance()
+
+    def update_materials(self, time, dtime, temp, dtemp, kappa, F0, F,
+                         stran, d, elec_field, stress, statev, sqa_stiff,
+                         jacobian=None):
+        '''Update the state of every material point'''
+        if self.vectorized(sqa_stiff):
+            rho = energy = 1.
+            stress, statev, ddsdde = self.material.update_state_batch(
+                time, dtime, temp, dtemp, energy, rho, F0, F, stran, d,
+                elec_field, stress.copy(), statev.copy(), params=self.params)
+            return stress, statev
+        stress, statev = stress.copy(), statev.copy()
+        for (n, m) in enumerate(self.materials):
+            stress[n], statev[n] = m.compute_updated_state(
+                time, dtime, temp, dtemp, kappa, F0[n], F[n], stran[n], d[n],
+                elec_field, stress[n], statev[n], last=True,
+                sqa_stiff=sqa_stiff, disp=1, jacobian=jacobian)
+        return stress, statev
+
+    def _run_step(self, steps):
+        '''Process this step for all points
+
+        This is the array counterpart of MaterialPointSimulator._run_step
+
+        '''
+        step = steps[0]
+        N = self.num_points
+        F = self.state['F']
+        stress = self.state['stress']
+        strain = self.state['strain']
+        statev = self.state['statev']
+        temp = self.state['temp']
+        efield = self.state['efield']
+
+        step_start_time = tt()
+        logger = logging.getLogger('matmodlab.mmd.simulator')
+        num_frame = len(step.frames)
+        lsn = len(str(num_frame))
+        message = '{0}, Frame {{0:{1}d}}'.format(step.name, lsn)
+
+        kappa, proportional = step.kappa, step.proportional
+        components = np.array([s.components for s in steps])
+        if components.shape[0] == 1:
+            components = np.tile(components, (N, 1))
+
+        # the following variables have values at [begining, end, current] of step
+        time = np.array([step.frames[0].time,
+                         step.frames[-1].value, step.frames[0].time])
+        temp = np.array((temp, step.temperature, temp))
+        efield = np.array((efield, step.elec_field, efield))
+        strain = np.array((strain, strain, strain))
+        stress = np.array((stress, stress, stress))
+
+        # the following variables have values at [begining, current] of step
+        statev = np.array((statev, statev))
+        F = np.array((F, F))
+
+        nv = 0
+        v = np.zeros(6, dtype=np.int)
+        for (i, cij) in enumerate(components.T):
+            if step.descriptors[i] == 1:         # -- strain rate
+                strain[1, :, i] = strain[0, :, i] + cij * VOIGT[i] * step.increment
+
+            elif step.descriptors[i] == 2:       # -- strain
+                strain[1, :, i] = cij * VOIGT[i]
+
+            elif step.descriptors[i] == 3:       # -- stress rate
+                stress[1, :, i] = stress[0, :, i] + cij * step.increment
+                v[nv] = i
+                nv += 1
+
+            elif step.descriptors[i] == 4:       # -- stress
+                stress[1, :, i] = cij
+                v[nv] = i
+                nv += 1
+
+        v = v[:nv]
+        if step.increment < 1.e-14:
+            dedt = np.zeros_like(strain[1])
+            dtime = 1.
+        else:
+            dedt = (strain[1] - strain[0]) / step.increment
+            dtime = (time[1] - time[0]) / num_frame
+
+        dtemp = (temp[1] - temp[0]) / num_frame
+
+        # --- find current value of d: sym(velocity gradient)
+        if not nv:
+            if abs(kappa) > 1.e-14 or environ.sqa:
+                d = np.array([mml.deps2d(dtime, kappa, strain[2, n], dedt[n])
+                              for n in range(N)])
+            else:
+                d = np.array(dedt)
+
+        else:
+            # Initial guess for d[v]
+            work = (stress[1][:, v] - stress[0][:, v]) / step.increment
+            for (n, m) in enumerate(self.materials):
+                Jsub = m.J0[[[x] for x in v], v]
+                try:
+                    dedt[n, v] = solve(Jsub,  work[n])
+                except:
+                    dedt[n, v] -= lstsq(Jsub, work[n])[0]
+            d = np.array(dedt)
+
+        def update(a1, a2, dtime, dtemp, d):
+            """Advance the state of all points one frame, to the fraction a2
+            of the step. Returns d and the stress rate"""
+            # interpolate values to the target values for this step
+            efield[2] = a1 * efield[0] + a2 * efield[1]
+            strain[2] = a1 * strain[0] + a2 * strain[1]
+            pstress = a1 * stress[0] + a2 * stress[1]
+
+            if nv:
+                # One or more stresses prescribed
+                d = np.array([sig2d(m, time[2], dtime, temp[2], dtemp, kappa,
+                                    F[0, n], F[1, n], strain[2, n], dedt[n],
+                                    stress[2, n], statev[0, n], efield[2], v,
+                                    pstress[n, v], proportional,
+                                    jacobian=step.jacobian)
+                              for (n, m) in enumerate(self.materials)])
+
+            # compute the current deformation gradient and strain from
+            # previous values and the deformation rate
+            F[1], e = mml.update_deformation_batch(dtime, kappa, F[0], d)
+            strain[2][:, v] = e[:, v]
+
+            # update material state
+            s = np.array(stress[2])
+            stress[2], statev[1] = self.update_materials(
+                time[2], dtime, temp[2], dtemp, kappa, F[0], F[1], strain[2],
+                d, efield[2], stress[2], statev[0], step.sqa_stiff,
+                jacobian=step.jacobian)
+            dstress = (stress[2] - s) / dtime
+
+            F[0] = F[1]
+            time[2] = a1 * time[0] + a2 * time[1]
+            temp[2] = a1 * temp[0] + a2 * temp[1]
+            statev[0] = statev[1]
+
+            return d, dstress
+
+        state = (F, strain, stress, statev, efield, time, temp)
+        def substep(a0, a1, a2, dtime, dtemp, d, depth=0):
+            """Advance the state one frame from the fraction a0 to a2 of the
+            step. If the material of any point or the stress solver request a
+            cutback, the frame is retaken for all points from its starting
+            state in substeps, as in MaterialPointSimulator._run_step"""
+            saved = [x.copy() for x in state]
+            dsave = d
+            CB.clear()
+            d, dstress = update(a1, a2, dtime, dtemp, d)
+            if not CB or self.no_cutback:
+                CB.clear()
+                return d, dstress
+            if depth >= MAX_CUTBACK_DEPTH:
+                # accept whatever is calculated
+                logger.warn('{0}: maximum number of cutbacks exceeded at '
+                            'time {1}'.format(step.name, time[2]))
+                CB.clear()
+                return d, dstress
+
+            # retake the frame in n substeps
+            n = CB.substeps()
+            CB.clear()
+            for (x, y) in zip(state, saved):
+                x[:] = y
+            d = dsave
+            for x in steps:
+                x.num_cutbacks += 1
+            s = np.array(stress[2])
+            for i in range(n):
+                b0 = a0 + (a2 - a0) * i / float(n)
+                if i == n - 1:
+                    b1, b2 = a1, a2
+                else:
+                    b2 = a0 + (a2 - a0) * (i + 1) / float(n)
+                    b1 = 1. - b2
+                d, ds = substep(b0, b1, b2, dtime / n, dtemp / n, d,
+                                depth=depth+1)
+            dstress = (stress[2] - s) / dtime
+            return d, dstress
+
+        self.records.reserve(min(num_frame, step.num_dumps + 1))
+        for (iframe, frame) in enumerate(step.frames):
+
+            logger.info('\r' + message.format(iframe+1), extra={'continued':1})
+
+            a1 = float(num_frame - (iframe + 1)) / num_frame
+            a2 = float(iframe + 1) / num_frame
+            a0 = float(iframe) / num_frame
+            d, dstress = substep(a0, a1, a2, dtime, dtemp, d)
+
+            # --- update the state
+            if step.writes_frame(a0, a2):
+                self.records.cache(Step=step.number, Frame=frame.number,
+                     Time=frame.value, DTime=frame.increment,
+                     E=strain[2]/VOIGT, F=F[1], D=d/VOIGT, DS=dstress,
+                     S=stress[2], SDV=statev[1], T=temp[2], EF=efield[2])
+
+        self._time += tt() - step_start_time
+        logger.info('\r' + message.format(iframe+1) +
+                    ' ({0:.4f}s)'.format(self._time))
+
+        return dict(F=F[1], stress=stress[2], strain=strain[2],
+                    statev=statev[1], temp=temp[2], efield=efield[2])
+
+    def get(self, *variables, **kwargs):
+        '''Get the history of variables
+
+        Parameters
+        ----------
+        variables : str
+            Variable names, e.g., 'S.XX', 'Time', 'SDV_EQPS'
+        point : int or None
+            If given, return the history of only this point
+
+        Returns
+        -------
+        data : ndarray or list of ndarray
+            The history of each variable. Variables of individual points have
+            shape (num_frames, N), or (num_frames,) if point is given.
+
+        '''
+        point = kwargs.pop('point', None)
+        data = []
+        for var in variables:
+            a = self.records.get(var, self.sdv_keys)
+            if point is not None and a.ndim == 2:
+                a = a[:, point]
+            data.append(a)
+        if len(data) == 1:
+            return data[0]
+        return data
+
+class BatchRecords(OrderedDict):
+    '''Output records of a batch of material points
+
+    Each record is stored in an array of shape (rows, width) or, for records
+    of individual points, (rows, N, width). Rows are written in place and the
+    same cache/advance/clear_cache protocol as Records is followed.
+
+    '''
+    chunk = 512
+    def __init__(self, num_points):
+        super(BatchRecords, self).__init__()
+        self.num_points = num_points
+        self.rtypes = {}
+        self._n = self._m = 0
+
+    def add(self, name, rtype, per_point=False, keys=None):
+        if rtype == SDV:
+            width = len(keys)
+        else:
+            width = 1 if rtype == SCALAR else rtype
+        if per_point:
+            shape = (self.chunk, self.num_points, width)
+        else:
+            shape = (self.chunk, width)
+        self[name] = np.zeros(shape)
+        self.rtypes[name] = rtype
+
+    def reserve(self, n):
+        '''Make sure that there is room for n more rows to be cached'''
+        size = self._m + n
+        for (name, a) in self.items():
+            if size <= a.shape[0]:
+                continue
+            b = np.zeros((max(size, 2 * a.shape[0]),) + a.shape[1:])
+            b[:self._m] = a[:self._m]
+            self[name] = b
+
+    def cache(self, **kw):
+        self.reserve(1)
+        for (name, a) in self.items():
+            x = np.asarray(kw[name], dtype=np.float64)
+            a[self._m] = x.reshape(a.shape[1:])
+        self._m += 1
+
+    def advance(self):
+        self._n = self._m
+
+    def clear_cache(self):
+        self._m = self._n
+
+    def get(self, var, sdv_keys):
+        '''Get the committed history of var'''
+        if var.startswith('SDV_'):
+            key = var[4:].upper()
+            keys = [x.upper() for x in sdv_keys]
+            return self['SDV'][:self._n, :, keys.index(key)]
+        item = var.split('.', 1)
+        a = self[item[0]][:self._n]
+        if len(item) == 2:
+            return a[..., COMPONENT(item[1], self.rtypes[item[0]])]
+        if a.shape[-1] == 1:
+            return a[..., 0]
+        return a
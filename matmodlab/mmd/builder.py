@@ -15,13 +15,15 @@ from ..product import ROOT_D, PKG_D
 from ..utils.errors import MatmodlabError
 from ..utils.fortran.extbuilder import FortranExtBuilder
 from ..utils.fortran.product import *
+from ..utils.fortran.manifest import MANIFEST, rename_signature
 from ..utils.logio import setup_logger
 
 logger = setup_logger('matmodlab.mmd.builder')
 
 class Builder(object):
-    def __init__(self, name, fc=None, verbosity=1):
-        self.fb = FortranExtBuilder(name, fc=fc, verbosity=verbosity)
+    def __init__(self, name, fc=None, verbosity=1, nprocs=None):
+        self.fb = FortranExtBuilder(name, fc=fc, verbosity=verbosity,
+                                    nprocs=nprocs)
         pass
 
     def build_materials(self, mats_to_build='all'):
@@ -57,7 +59,8 @@ class Builder(object):
         return
 
     def fetch_fort_libs_to_build(self, mats_to_fetch='all', user_env=0, force=0):
-        '''Add the fortran utilities to items to be built
+        '''Add the fortran utilities to items to be built. Extension modules
+        built from the same sources are skipped, unless force
 
         '''
         fort_libs = {}
@@ -78,9 +81,6 @@ class Builder(object):
                     if name in fort_libs:
                         raise MatmodlabError('duplicate extension '
                                              'module {0}'.format(name))
-                    if (os.path.isfile(os.path.join(PKG_D, name + '.so'))
-                        and not force):
-                        continue
                     fort_libs.update({name: libs[name]})
 
         from .loader import MaterialLoader
@@ -128,15 +128,9 @@ class Builder(object):
                         break
                 else:
                     raise MatmodlabError('signature file not found')
-                lines = open(signature, 'r').read()
-                new_signature = os.path.join(PKG_D, libname + '.pyf')
                 libname_ = getattr(mat.mat_class, 'libname', mat.mat_class.name)
-                pat = r'(?is)python\s+module\s+{0}'.format(libname_)
-                repl = r'python module {0}'.format(libname)
-                lines = re.sub(pat, repl, lines)
-                with open(new_signature, 'w') as fh:
-                    fh.write(lines)
-                mat.source_files[i] = new_signature
+                mat.source_files[i] = rename_signature(signature, libname_,
+                                                       libname)
             else:
                 libname = getattr(mat.mat_class, 'libname', mat.mat_class.name)
 
@@ -166,7 +160,8 @@ class Builder(object):
             l = fort_libs[ext].get('lapack', False)
             I = fort_libs[ext].get('include_dirs', [])
             m = fort_libs[ext].get('mmlabpack', False)
-            self.fb.add_extension(ext, s, include_dirs=I, lapack=l, mmlabpack=m)
+            self.fb.add_extension(ext, s, include_dirs=I, lapack=l, mmlabpack=m,
+                                  force=force)
 
         return
 
@@ -187,10 +182,12 @@ def wipe_built_libs():
         remove(f)
     bld_d = os.path.join(PKG_D, 'build')
     remove(bld_d)
+    remove(MANIFEST)
 
-def build(what_to_build, wipe_and_build=False, verbosity=1, user_env=0):
+def build(what_to_build, wipe_and_build=False, verbosity=1, user_env=0,
+          nprocs=None):
 
-    builder = Builder('matmodlab', verbosity=verbosity)
+    builder = Builder('matmodlab', verbosity=verbosity, nprocs=nprocs)
 
     if wipe_and_build:
         wipe_built_libs()
@@ -229,6 +226,9 @@ def main(argv=None):
        help='Build auxiliary support files only [default: all]')
     parser.add_argument('-e', nargs='?', default=0, const=1, type=int,
        help='Build materials in user environment file [default: all]')
+    parser.add_argument('-j', default=None, type=int,
+       help='Number of extension modules to build in parallel, 0 for one '
+            'per cpu [default: environ.build_nprocs]')
     args = parser.parse_args(argv)
 
     if args.W:
@@ -244,7 +244,7 @@ def main(argv=None):
         what_to_build = ('material', args.m)
 
     return build(what_to_build, wipe_and_build=args.w,
-                 verbosity=args.v, user_env=args.e)
+                 verbosity=args.v, user_env=args.e, nprocs=args.j)
 
 if __name__ == '__main__':
     main()
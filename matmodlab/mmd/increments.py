@@ -0,0 +1,115 @@
+'''Adaptive frame sizing for analysis steps
+
+By default, a step is split into a fixed number of frames of equal size. With
+adaptive frames, the size of each frame is chosen from an estimate of the
+local error of the frame just taken. The frames of a step are integrated to
+first order: the stress and strain rates are held fixed over a frame, so the
+error of a frame is estimated by the change in rates from the previous frame,
+
+    err = max(|dsig - sdot * dt| / 3K, |deps - edot * dt|) / tolerance
+
+where dsig and deps are the changes in stress and strain over the frame,
+sdot and edot the rates over the previous frame (predicted from the elastic
+stiffness for the first frame of the step) and K the bulk modulus of the
+material. Frames with err > 1 are rejected and retaken with a smaller
+increment. Accepted frames set the next increment to
+
+    dt = dt * min(max_factor, max(min_factor, safety / sqrt(err)))
+
+bounded by the step's min and max increments. Smooth legs are run in a few
+frames, sharp transitions (e.g., yield) are refined. Frames always end at the
+output times requested for the step and at the end of the step.
+
+'''
+import numpy as np
+
+from ..utils.errors import MatmodlabError
+
+__all__ = ['AdaptiveFrames', 'frame_controller']
+
+class AdaptiveFrames(object):
+    '''Error controlled frame increments
+
+    Parameters
+    ----------
+    tolerance : float
+        Allowable error of a frame, in units of strain
+    min_increment, max_increment : float
+        Bounds on the frame increment. Default to 1e-6 times and 1 times the
+        step increment, respectively
+    output_times : list of float
+        Times, relative to the start of the step, at which frames must end
+    safety, min_factor, max_factor : float
+        Controls on the change of the increment from frame to frame
+
+    '''
+    def __init__(self, tolerance=1.e-4, min_increment=None, max_increment=None,
+                 output_times=None, safety=.9, min_factor=.2, max_factor=2.):
+        if tolerance <= 0.:
+            raise MatmodlabError('adaptive frame tolerance must be positive')
+        self.tolerance = tolerance
+        self.min_increment = min_increment
+        self.max_increment = max_increment
+        self.output_times = output_times
+        self.safety = safety
+        self.min_factor = min_factor
+        self.max_factor = max_factor
+        self.num_accepted = 0
+        self.num_rejected = 0
+
+    def __str__(self):
+        return 'adaptive ({0} frames accepted, {1} rejected)'.format(
+            self.num_accepted, self.num_rejected)
+
+    def bounds(self, increment):
+        '''The min and max frame increments of a step of length increment'''
+        hmin = self.min_increment
+        if hmin is None:
+            hmin = 1.e-6 * increment
+        hmax = self.max_increment
+        if hmax is None:
+            hmax = increment
+        return hmin, max(hmin, hmax)
+
+    def targets(self, start, end):
+        '''The (absolute) times at which frames of the step from start to end
+        must end'''
+        times = [start + t for t in (self.output_times or [])
+                 if 0. < t < end - start]
+        times = sorted(set(times))
+        times.append(end)
+        return times
+
+    def error(self, dsig, deps, sdot, edot, dt, K):
+        '''The scaled error of a frame, the frame is accepted if <= 1'''
+        es = np.sqrt(np.sum((dsig - sdot * dt) ** 2)) / (3. * K)
+        ee = np.sqrt(np.sum((deps - edot * dt) ** 2))
+        return max(es, ee) / self.tolerance
+
+    def factor(self, err):
+        '''Factor by which to scale the increment for a frame with error err'''
+        if err <= 0.:
+            return self.max_factor
+        f = self.safety / np.sqrt(err)
+        return min(self.max_factor, max(self.min_factor, f))
+
+def frame_controller(adaptive):
+    '''The frame controller for the adaptive keyword of a step
+
+    Parameters
+    ----------
+    adaptive : bool, dict, AdaptiveFrames instance, or None
+        If True, adaptive frames with default settings. A dict is passed as
+        keywords to AdaptiveFrames
+
+    '''
+    if adaptive is None or adaptive is False:
+        return None
+    if adaptive is True:
+        return AdaptiveFrames()
+    if isinstance(adaptive, dict):
+        return AdaptiveFrames(**adaptive)
+    if isinstance(adaptive, AdaptiveFrames):
+        return adaptive
+    raise MatmodlabError('adaptive must be True, False, a dict, '
+                         'or an AdaptiveFrames instance')
@@ -0,0 +1,92 @@
+'''Counters and timers of the work done by the simulator
+
+When a simulator is created with stats=True, the work done in each of its
+steps is tallied in a StepStats instance:
+
+    frames              frames of the step
+    material_calls      calls to the material's update_state
+    jacobian_numerical  Jacobians computed numerically
+    jacobian_analytic   Jacobians returned by the material
+    newton_iterations   iterations of the Newton stress solver
+    simplex_fallbacks   stress solves that fell back to the simplex method
+    cutbacks            frames retaken in substeps
+    time                wall time of the step, split in
+    time_kinematics       update of the deformation gradient and strain
+    time_material         the material's update_state
+    time_solve            the stress solver, less its material calls
+    time_records          caching of the output records
+
+While a step runs, its StepStats instance is the module's collector, which
+the code being instrumented increments. With statistics disabled the
+collector is None and instrumenting costs one comparison per site.
+
+'''
+from collections import OrderedDict
+
+__all__ = ['StepStats', 'SimulationStats']
+
+# the statistics of the step being run, or None
+collector = None
+
+class StepStats(object):
+    '''Counters and timers of one step'''
+    counters = ('frames', 'material_calls', 'jacobian_numerical',
+                'jacobian_analytic', 'newton_iterations', 'simplex_fallbacks',
+                'cutbacks')
+    timers = ('time', 'time_kinematics', 'time_material', 'time_solve',
+              'time_records')
+    def __init__(self, name):
+        self.name = name
+        for key in self.counters:
+            setattr(self, key, 0)
+        for key in self.timers:
+            setattr(self, key, 0.)
+
+    def __iadd__(self, other):
+        for key in self.counters + self.timers:
+            setattr(self, key, getattr(self, key) + getattr(other, key))
+        return self
+
+    def todict(self):
+        return OrderedDict((key, getattr(self, key))
+                           for key in self.counters + self.timers)
+
+class SimulationStats(OrderedDict):
+    '''The StepStats of each step run, by step name'''
+
+    def begin(self, name):
+        '''Start collecting the statistics of step name'''
+        global collector
+        collector = self[name] = StepStats(name)
+        return collector
+
+    def end(self):
+        global collector
+        collector = None
+
+    def total(self):
+        '''The statistics summed over all steps'''
+        total = StepStats('Total')
+        for item in self.values():
+            total += item
+        return total
+
+    def summary(self):
+        '''Table of the statistics of each step and their total'''
+        items = self.values() + [self.total()]
+        keys = StepStats.counters + StepStats.timers
+        width = max([len(x.name) for x in items] + [10])
+        head = ['frames', 'calls', 'jac num', 'jac ana', 'newton', 'simplex',
+                'cutbacks', 'time', 'kinem', 'material', 'solve', 'records']
+        lines = ['{0:{1}s} '.format('Step', width) +
+                 ' '.join('{0:>9s}'.format(x) for x in head)]
+        for item in items:
+            line = '{0:{1}s} '.format(item.name, width)
+            for key in keys:
+                value = getattr(item, key)
+                if key.startswith('time'):
+                    line += ' {0:9.4f}'.format(value)
+                else:
+                    line += ' {0:9d}'.format(value)
+            lines.append(line)
+        return '\n'.join(lines)
@@ -0,0 +1,210 @@
+'''Strategies for numerically computing the material Jacobian
+
+The material Jacobian submatrix Js = J[v, v], J = dsig/deps, is needed by
+the Newton solver for stress controlled components and by materials that do
+not return their stiffness. Js is computed by one of the strategies below:
+
+    centered  centered differences, two material calls per component
+    forward   forward differences, one material call per component plus one
+    complex   complex step differentiation of Python models, one material call
+              per component and no subtractive cancellation
+    broyden   centered differences for the first Newton iteration, followed
+              by rank-1 updates from the Newton iterates
+
+Each strategy counts the number of Jacobians it evaluates (num_evals) and the
+number of material calls it makes to do so (num_calls).
+
+'''
+import numpy as np
+from time import time as tt
+
+from ..utils import mmlabpack
+from ..utils.errors import MatmodlabError
+from . import instrumentation
+
+__all__ = ['JacobianStrategy', 'CenteredDifference', 'ForwardDifference',
+           'ComplexStep', 'Broyden']
+
+class CenteredDifference(object):
+    '''Centered differences about eps = epsold + d * dt'''
+    name = 'centered'
+    def __init__(self):
+        self.num_evals = 0
+        self.num_calls = 0
+
+    def __str__(self):
+        return '{0} ({1} evaluations, {2} material calls)'.format(
+            self.name, self.num_evals, self.num_calls)
+
+    def reset(self):
+        '''Called at the start of each Newton solve'''
+        pass
+
+    def finish(self):
+        '''Called at the end of each Newton solve'''
+        pass
+
+    def update(self, ds, dsig):
+        '''Called with the change in strain ds[v] and stress dsig[v] of each
+        Newton iteration. Returns the updated Jacobian, or None if the
+        strategy does not update its Jacobian'''
+        return None
+
+    def __call__(self, material, time, dtime, temp, dtemp, kappa, F0, F, stran,
+                 d, elec_field, stress, statev, v):
+        self.num_evals += 1
+        dtime = 1 if dtime < 1.e-12 else dtime
+        return self.compute(material, time, dtime, temp, dtemp, kappa, F0, F,
+                            stran, d, elec_field, stress, statev, v)
+
+    def stress(self, material, time, dtime, temp, dtemp, kappa, F0, F, d,
+               elec_field, stress, statev):
+        '''The stress for deformation rate d'''
+        self.num_calls += 1
+        Fp, Ep = mmlabpack.update_deformation(dtime, 0., F, d)
+        return material.compute_updated_state(time, dtime, temp, dtemp, kappa,
+                    F0, Fp, Ep, d, elec_field, stress.copy(), statev.copy(),
+                    disp=3)
+
+    def compute(self, material, time, dtime, temp, dtemp, kappa, F0, F, stran,
+                d, elec_field, stress, statev, v):
+        nv = len(v)
+        deps = np.sqrt(np.finfo(np.float64).eps)
+        Jsub = np.zeros((nv, nv))
+        args = (material, time, dtime, temp, dtemp, kappa, F0, F)
+        for i in range(nv):
+            # perturb forward
+            Dp = d.copy()
+            Dp[v[i]] = d[v[i]] + (deps / dtime) / 2.
+            sigp = self.stress(*(args + (Dp, elec_field, stress, statev)))
+
+            # perturb backward
+            Dm = d.copy()
+            Dm[v[i]] = d[v[i]] - (deps / dtime) / 2.
+            sigm = self.stress(*(args + (Dm, elec_field, stress, statev)))
+
+            # compute component of jacobian
+            Jsub[i, :] = (sigp[v] - sigm[v]) / deps
+
+        return Jsub
+
+class ForwardDifference(CenteredDifference):
+    '''Forward differences from eps = epsold + d * dt'''
+    name = 'forward'
+    def compute(self, material, time, dtime, temp, dtemp, kappa, F0, F, stran,
+                d, elec_field, stress, statev, v):
+        nv = len(v)
+        deps = np.sqrt(np.finfo(np.float64).eps)
+        Jsub = np.zeros((nv, nv))
+        args = (material, time, dtime, temp, dtemp, kappa, F0, F)
+        sig = self.stress(*(args + (d, elec_field, stress, statev)))
+        for i in range(nv):
+            Dp = d.copy()
+            Dp[v[i]] = d[v[i]] + deps / dtime
+            sigp = self.stress(*(args + (Dp, elec_field, stress, statev)))
+            Jsub[i, :] = (sigp[v] - sig[v]) / deps
+        return Jsub
+
+class ComplexStep(CenteredDifference):
+    '''Complex step differentiation, Js[i,:] = Im(sig(d + ih e_i)[v]) / h
+
+    The imaginary perturbation is carried through update_state of the model,
+    which must be written in Python with operations that are analytic in d
+    (the model's complex_step attribute is True). Rate form models compute
+    the stress from d, so F and the strain are not perturbed. Materials with
+    expansion or viscoelastic add ons fall back to centered differences.
+
+    '''
+    name = 'complex'
+    def compute(self, material, time, dtime, temp, dtemp, kappa, F0, F, stran,
+                d, elec_field, stress, statev, v):
+        if material.xpan is not None or material.visco_model is not None:
+            return super(ComplexStep, self).compute(material, time, dtime,
+                temp, dtemp, kappa, F0, F, stran, d, elec_field, stress,
+                statev, v)
+        nv = len(v)
+        h = 1.e-30
+        Jsub = np.zeros((nv, nv))
+        N = material.num_sdv
+        Fp, Ep = mmlabpack.update_deformation(dtime, 0., F, d)
+        stats = instrumentation.collector
+        for i in range(nv):
+            Dp = np.array(d, dtype=np.complex128)
+            Dp[v[i]] += 1j * h / dtime
+            self.num_calls += 1
+            if stats is not None:
+                t0 = tt()
+            sigp, xp, c = material.update_state(time, dtime, temp, dtemp,
+                1., 1., F0, Fp, Ep, Dp, elec_field,
+                np.array(stress, dtype=np.complex128),
+                np.array(statev[:N], dtype=np.complex128), mode=0)
+            if stats is not None:
+                stats.material_calls += 1
+                stats.time_material += tt() - t0
+            Jsub[i, :] = np.imag(sigp[v]) / h
+        return Jsub
+
+class Broyden(CenteredDifference):
+    '''Centered differences on the first Newton iteration and Broyden rank-1
+    updates on those that follow. Outside of Newton solves, this is the
+    centered difference strategy.'''
+    name = 'broyden'
+    def __init__(self):
+        super(Broyden, self).__init__()
+        self.Jsub = None
+        self.solving = False
+
+    def reset(self):
+        self.Jsub = None
+        self.solving = True
+
+    def finish(self):
+        self.Jsub = None
+        self.solving = False
+
+    def update(self, ds, dsig):
+        if self.Jsub is None or len(ds) != self.Jsub.shape[0]:
+            return None
+        dnom = np.dot(ds, ds)
+        if dnom > 1.e-30:
+            self.Jsub += np.outer(dsig - np.dot(self.Jsub, ds), ds) / dnom
+        return self.Jsub.copy()
+
+    def compute(self, material, time, dtime, temp, dtemp, kappa, F0, F, stran,
+                d, elec_field, stress, statev, v):
+        if self.Jsub is not None and self.Jsub.shape[0] == len(v):
+            return self.Jsub.copy()
+        Jsub = super(Broyden, self).compute(material, time, dtime, temp,
+            dtemp, kappa, F0, F, stran, d, elec_field, stress, statev, v)
+        if self.solving and self.Jsub is None:
+            self.Jsub = Jsub.copy()
+        return Jsub
+
+strategies = dict([(s.name, s) for s in (CenteredDifference, ForwardDifference,
+                                         ComplexStep, Broyden)])
+
+def JacobianStrategy(strategy=None, material=None):
+    '''Factory method for the Jacobian strategies
+
+    Parameters
+    ----------
+    strategy : str, strategy instance, or None
+        One of 'centered' (default), 'forward', 'complex', or 'broyden'
+    material : MaterialModel instance or None
+        If given, the material is checked to support the strategy
+
+    '''
+    if strategy is None:
+        strategy = 'centered'
+    if not isinstance(strategy, basestring):
+        return strategy
+    try:
+        strategy = strategies[strategy.lower()]()
+    except KeyError:
+        raise MatmodlabError('unknown Jacobian strategy {0!r}, choose from '
+                             '{1}'.format(strategy, ', '.join(strategies)))
+    if (material is not None and strategy.name == 'complex' and
+        not getattr(material, 'complex_step', False)):
+        raise MatmodlabError('complex step Jacobian not supported by '
+                             'model {0}'.format(material.name))
+    return strategy
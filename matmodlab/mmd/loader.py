@@ -1,13 +1,150 @@
+'''Discovery of the material models
+
+The material models are the subclasses of MaterialModel defined in the
+mat*.py files of the std_materials directories and the user materials of the
+environment's materials dict. Finding them means parsing each candidate file
+for its classes and importing those that derive from MaterialModel.
+
+The classes found in each file, and the names of the materials they define,
+are kept in a MaterialRegistry on disk, keyed by the file's path and
+validated by its mtime and size and, when these change, by the hash of its
+contents, so that only new or edited files are parsed. Files found in the
+registry are imported only when one of their materials is used. The
+MaterialLoader built from them is memoized for the process: it is rebuilt
+only when environ.std_materials or environ.materials change, or when
+cleared, making Material() O(1) after its first call.
+
+'''
 import re
 import os
+import json
+import hashlib
 import logging
+from ..product import VERSION
 from ..materials.product import *
 from ..utils import xpyclbr
 from ..mml_siteenv import environ
 from ..utils.errors import MatmodlabError
 from ..utils.misc import load_file, rand_id
 
+DEFAULT_REGISTRY = os.path.join(os.path.expanduser('~'), '.matmodlab',
+                                'materials.json')
+
+class MaterialInfo(xpyclbr.Class, object):
+    '''A material class found in a material file, imported on first use'''
+    _mat_class = None
+    def __init__(self, module, name, super, file, material_name=None):
+        xpyclbr.Class.__init__(self, module, name, super, file, {})
+        self.material_name = material_name
+
+    @property
+    def mat_class(self):
+        if self._mat_class is None:
+            module = load_file(self.file)
+            mat_class = getattr(module, self.class_name, None)
+            if mat_class is None or mat_class.name is None:
+                raise MatmodlabError('{0}: material name attribute '
+                                     'not defined'.format(self.class_name))
+            self._mat_class = mat_class
+            self.material_name = mat_class.name
+        return self._mat_class
+
+class MaterialRegistry(object):
+    '''The classes defined in material files, cached on disk
+
+    Parameters
+    ----------
+    filename : str
+        File holding the registry [default: ~/.matmodlab/materials.json]
+
+    '''
+    def __init__(self, filename=None):
+        self.filename = filename or DEFAULT_REGISTRY
+        self.entries = {}
+        self.modified = False
+        self.hits = 0
+        self.misses = 0
+        try:
+            with open(self.filename) as fh:
+                data = json.load(fh)
+        except (IOError, ValueError):
+            data = None
+        if data is not None and data.get('version') == list(VERSION):
+            self.entries = data['files']
+
+    def __str__(self):
+        return '{0} ({1} hits, {2} misses)'.format(
+            self.filename, self.hits, self.misses)
+
+    def readmodule(self, module, d, ancestors):
+        '''The classes of module in directory d deriving from one of
+        ancestors, a dict of MaterialInfo by class name'''
+        filename = os.path.join(d, module + '.py')
+        st = os.stat(filename)
+        entry = self.entries.get(filename)
+        if entry is not None and (entry['mtime'] != st.st_mtime or
+                                  entry['size'] != st.st_size):
+            # touched, but unchanged if its contents hash the same
+            if entry['sha1'] == self.digest(filename):
+                entry.update(mtime=st.st_mtime, size=st.st_size)
+                self.modified = True
+            else:
+                entry = None
+        if entry is None or entry['ancestors'] != ancestors:
+            self.misses += 1
+            libs = xpyclbr.readmodule(module, [d], ancestors=ancestors)
+            entry = self.entries[filename] = {
+                'mtime': st.st_mtime, 'size': st.st_size,
+                'sha1': self.digest(filename), 'ancestors': ancestors,
+                'classes': [[c.class_name, c.super, c.file, None]
+                            for c in libs.values()]}
+            self.modified = True
+        else:
+            self.hits += 1
+        return dict((name, MaterialInfo(module, name, supers, f, material))
+                    for (name, supers, f, material) in entry['classes'])
+
+    def set_material_name(self, filename, info):
+        '''Record the name of the material defined by the class of info, of
+        the file filename'''
+        entry = self.entries.get(filename)
+        if entry is None:
+            return
+        for item in entry['classes']:
+            if item[0] == info.class_name:
+                item[3] = info.material_name
+                self.modified = True
+
+    @staticmethod
+    def digest(filename):
+        with open(filename, 'rb') as fh:
+            return hashlib.sha1(fh.read()).hexdigest()
+
+    def save(self):
+        '''Write the registry, if modified. A registry that cannot be written
+        is not an error, the files are parsed again next time'''
+        if not self.modified:
+            return
+        data = {'version': list(VERSION), 'files': self.entries}
+        tmp = '{0}.{1}.tmp'.format(self.filename, os.getpid())
+        try:
+            d = os.path.dirname(self.filename)
+            if not os.path.isdir(d):
+                os.makedirs(d)
+            with open(tmp, 'w') as fh:
+                json.dump(data, fh)
+            os.rename(tmp, self.filename)
+        except (IOError, OSError):
+            logging.getLogger('matmodlab.mmd.simulator').debug(
+                'failed to write material registry {0}'.format(self.filename))
+            return
+        self.modified = False
+
 class MaterialLoader:
+    # the loader of the current environment, and the registry
+    memo = None
+    registry = None
+
     def __init__(self, std_libs, user_libs):
         self.std_libs = std_libs
         self.user_libs = user_libs
@@ -33,10 +170,41 @@ class MaterialLoader:
         if mat is None:
             raise KeyError(name)
 
+    @staticmethod
+    def environment_key():
+        '''The settings of the environment the loader is built from'''
+        materials = sorted((k, sorted(v.items()))
+                           for (k, v) in environ.materials.items())
+        return repr((list(environ.std_materials), materials))
+
+    @classmethod
+    def clear(cls):
+        '''Forget the loader, the next load_materials finds the models again'''
+        cls.memo = None
+
     @classmethod
     def load_materials(cls):
         '''Find material models
 
+        The loader is memoized, it is built again only if the std_materials
+        or materials of the environment changed since the last call.
+
+        '''
+        key = cls.environment_key()
+        if cls.memo is not None and cls.memo[0] == key:
+            return cls.memo[1]
+        if cls.registry is None:
+            cls.registry = MaterialRegistry()
+        loader = cls.find_materials(cls.registry)
+        cls.registry.save()
+        cls.memo = (key, loader)
+        return loader
+
+    @classmethod
+    def find_materials(cls, registry):
+        '''Find material models, reading the classes of material files from
+        registry
+
         '''
         errors = []
         std_libs = {}
@@ -67,23 +235,21 @@ class MaterialLoader:
             for f in files:
                 module = f[:-3]
                 try:
-                    libs = xpyclbr.readmodule(module, [d], ancestors=a)
+                    libs = registry.readmodule(module, d, a)
                 except AttributeError as e:
                     errors.append(e.args[0])
                     logging.error(e.args[0])
                     continue
-                for lib in libs:
+                for (lib, info) in libs.items():
                     if lib in std_libs:
                         logging.error('{0}: duplicate material'.format(lib))
                         errors.append(lib)
                         continue
-                    module = load_file(libs[lib].file)
-                    mat_class = getattr(module, libs[lib].class_name, None)
-                    if mat_class.name is None:
-                        raise MatmodlabError('{0}: material name attribute '
-                                             'not defined'.format(lib))
-                    libs[lib].mat_class = mat_class
-                    std_libs.update({mat_class.name: libs[lib]})
+                    if info.material_name is None:
+                        # a new or edited file, import it for the name
+                        info.mat_class
+                        registry.set_material_name(os.path.join(d, f), info)
+                    std_libs[info.material_name] = info
 
         # load materials in the materials dict
         user_libs = {}
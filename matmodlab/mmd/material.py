@@ -4,6 +4,7 @@ import sys
 import numpy as np
 from numpy.linalg import cholesky, LinAlgError
 import logging
+from time import time as tt
 
 from matmodlab.product import PKG_D, BIN_D, ROOT_D
 
@@ -12,6 +13,8 @@ from ..utils.errors import MatmodlabError
 from ..utils import mmlabpack
 from ..utils.misc import remove
 from ..mmd.loader import MaterialLoader
+from ..mmd.jacobian import JacobianStrategy
+from ..mmd import instrumentation
 
 from ..constants import *
 from ..materials.completion import *
@@ -19,7 +22,8 @@ from ..materials.addon_trs import TRS
 from ..materials.addon_expansion import Expansion
 from ..materials.addon_viscoelastic import Viscoelastic
 from ..materials.product import is_user_model, USER
-from ..utils.fortran.product import SDVINI
+from ..utils.fortran.product import SDVINI, IO_F90
+from ..utils.fortran.manifest import BuildManifest, rename_signature
 
 from ..constants import XX, YY, ZZ, XY, YZ, XZ, DEFAULT_TEMP
 
@@ -51,6 +55,7 @@ class MaterialModel(object):
     elastic_props = None
     lib = None
     libname = None
+    complex_step = False
 
     @classmethod
     def source_files(cls):
@@ -128,7 +133,9 @@ class MaterialModel(object):
         self.visco_model = None
         self.xpan = None
         self.trs_model = None
+        self.addons = []
         self.initial_temp = kwargs.get('initial_temp', DEFAULT_TEMP)
+        self.jacobian = JacobianStrategy(kwargs.get('jacobian'), self)
 
         # parameter arrays
         self.iparams = keyarray(self.parameter_names, self.iparray)
@@ -159,6 +166,7 @@ class MaterialModel(object):
             raise MatmodlabError('len(sdv_values) != len(sdv_keys)')
         self.sdv_keys = [s for s in sdv_keys]
         self.initial_sdv = np.array(sdv_vals, dtype=np.float64)
+        self.sdv_map = sdvmap(self.sdv_keys)
 
         # call model with zero strain rate to get initial jacobian
         time, dtime = 0, 1
@@ -221,11 +229,13 @@ class MaterialModel(object):
         self.visco_model = Viscoelastic(type, data)
         vk, vd = self.visco_model.setup(trs_model=self.trs_model)
         self.visco_slice = self.augment_sdv(vk, vd)
+        self.addons.append(('Viscoelastic', (type, data)))
 
     def TRS(self, definition, data):
         if self.trs_model is not None:
             raise MatmodlabError('Material supports only one TRS model')
         self.trs_model = TRS(definition, data)
+        self.addons.append(('TRS', (definition, data)))
 
     def Expansion(self, type, data):
         if self.xpan is not None:
@@ -233,6 +243,7 @@ class MaterialModel(object):
         self.xpan = Expansion(type, data)
         ek, ed = self.xpan.setup()
         self.xpan_slice = self.augment_sdv(ek, ed)
+        self.addons.append(('Expansion', (type, data)))
 
     @classmethod
     def from_other(cls, other_mat):
@@ -249,10 +260,11 @@ class MaterialModel(object):
         if len(values) != len(keys):
             raise MatmodlabError('len(values) != len(keys)')
         self.initial_sdv = np.append(self.initial_sdv, np.array(values))
+        self.sdv_map = sdvmap(self.sdv_keys)
         return slice(M, N)
 
     def numerical_jacobian(self, time, dtime, temp, dtemp, kappa, F0, F, stran, d,
-                           elec_field, stress, statev, v):
+                           elec_field, stress, statev, v, jacobian=None):
         '''Numerically compute material Jacobian by a centered difference scheme.
 
         Returns
@@ -269,7 +281,9 @@ class MaterialModel(object):
         elements in v. Note that in the special case v = [1,2,3,4,5,6], with
         nv = 6, the matrix that is returned is the full Jacobian matrix, J.
 
-        The components of Js are computed numerically using a centered
+        The components of Js are computed numerically by the jacobian
+        strategy, if given, otherwise by the material's strategy (see
+        matmodlab.mmd.jacobian). The default strategy is a centered
         differencing scheme which requires two calls to the material model
         subroutine for each element of v. The centering is about the point eps
         = epsold + d * dt, where d is the rate-of-strain array.
@@ -285,37 +299,11 @@ class MaterialModel(object):
         Tim Fuller, Sandial National Laboratories, tjfulle@sandia.gov
 
         '''
-        # local variables
-        nv = len(v)
-        deps =  np.sqrt(np.finfo(np.float64).eps)
-        Jsub = np.zeros((nv, nv))
-        dtime = 1 if dtime < 1.e-12 else dtime
-
-        for i in range(nv):
-            # perturb forward
-            Dp = d.copy()
-            Dp[v[i]] = d[v[i]] + (deps / dtime) / 2.
-            Fp, Ep = mmlabpack.update_deformation(dtime, 0., F, Dp)
-            sigp = stress.copy()
-            xp = statev.copy()
-            sigp = self.compute_updated_state(time, dtime, temp, dtemp, kappa,
-                      F0, Fp, Ep, Dp, elec_field, sigp, xp, disp=3)
-
-            # perturb backward
-            Dm = d.copy()
-            Dm[v[i]] = d[v[i]] - (deps / dtime) / 2.
-            Fm, Em = mmlabpack.update_deformation(dtime, 0., F, Dm)
-            sigm = stress.copy()
-            xm = statev.copy()
-            sigm = self.compute_updated_state(time, dtime, temp, dtemp, kappa,
-                      F0, Fm, Em, Dm, elec_field, sigm, xm, disp=3)
-
-            # compute component of jacobian
-            Jsub[i, :] = (sigp[v] - sigm[v]) / deps
-
-            continue
-
-        return Jsub
+        jacobian = jacobian or self.jacobian
+        if instrumentation.collector is not None:
+            instrumentation.collector.jacobian_numerical += 1
+        return jacobian(self, time, dtime, temp, dtemp, kappa, F0, F, stran, d,
+                        elec_field, stress, statev, v)
 
     @property
     def parameters(self):
@@ -331,6 +319,25 @@ class MaterialModel(object):
     def update_state(self, *args, **kwargs):
         raise NotImplementedError
 
+    # Models that can update N material points in one call define
+    #   update_state_batch(time, dtime, temp, dtemp, energy, rho, F0, F,
+    #                      stran, d, elec_field, stress, statev, params=None)
+    # where F0 and F are (N,9), stran, d, and stress are (N,6), statev is
+    # (N,nsdv), and params, if given, holds the parameters of each point
+    # (N,nprop).  The updated stress and statev are returned along with the
+    # (N,6,6) stiffness, or None.
+    update_state_batch = None
+
+    def batch_parameters(self, params, n):
+        '''The (n,nprop) array of parameters for a batch of n points'''
+        if params is None:
+            return np.tile(np.asarray(self.params), (n, 1))
+        params = np.asarray(params, dtype=np.float64)
+        if params.shape != (n, len(self.params)):
+            raise MatmodlabError('expected parameters to have shape '
+                                 '({0},{1})'.format(n, len(self.params)))
+        return params
+
     def tostr(self, obj='mps'):
         p = {}
         for (i, name) in enumerate(self.parameter_names):
@@ -371,9 +378,13 @@ class MaterialModel(object):
 
     def compute_updated_state(self, time, dtime, temp, dtemp, kappa, F0, F,
             stran, d, elec_field, stress, statev, disp=0, v=None, last=False,
-            sqa_stiff=False):
+            sqa_stiff=False, jacobian=None, jacobian_at=None):
         '''Update the material state
 
+        jacobian_at, if given, is the (F, stran) at the start of the increment
+        a numerical Jacobian is taken about, (F, stran) otherwise. The
+        Jacobian strategies advance it by d * dtime themselves
+
         '''
         V = v if v is not None else range(6)
 
@@ -396,12 +407,26 @@ class MaterialModel(object):
                 kappa, self.initial_temp, temp, dtemp, dtime, F, stran, d)
             sdv[n] = Em
 
+        # the mechanical deformation the numerical Jacobian is taken about
+        Fj, Ej = Fm, Em
+        if jacobian_at is not None:
+            Fj, Ej = jacobian_at
+            if self.xpan is not None:
+                Fj, Ej, _ = self.xpan.update_state(kappa, self.initial_temp,
+                                                   temp, dtemp, dtime, Fj, Ej, d)
+
         rho = 1.
         energy = 1.
         N = self.num_sdv
+        stats = instrumentation.collector
+        if stats is not None:
+            t0 = tt()
         sig, sdv[:N], ddsdde = self.update_state(time, dtime, temp, dtemp,
             energy, rho, F0, Fm, Em, dm, elec_field, sig,
             sdv[:N], last=last, mode=0)
+        if stats is not None:
+            stats.material_calls += 1
+            stats.time_material += tt() - t0
 
         if self.visco_model is not None:
             # get visco correction
@@ -412,10 +437,18 @@ class MaterialModel(object):
         if disp == 3:
             return sig
 
+        sqa_stiff = self.sqa_stiff or sqa_stiff
+        if disp == 1 and not (last and sqa_stiff):
+            # the stiffness is not needed
+            return sig, sdv
+
         if self.num_stiff or self.visco_model is not None:
             # force the use of a numerical stiffness
             ddsdde = None
 
+        if stats is not None and ddsdde is not None:
+            stats.jacobian_analytic += 1
+
         if ddsdde is None:
             # material models without an analytic jacobian send the Jacobian
             # back as None so that it is found numerically here. Likewise, we
@@ -425,19 +458,19 @@ class MaterialModel(object):
             # the visco correction, push it forward, and convert to Jaummann
             # rate. It's not as trivial as it sounds...
             ddsdde = self.numerical_jacobian(time, dtime, temp, dtemp, kappa, F0,
-                        Fm, Em, dm, elec_field, stress, sdv, V)
+                        Fj, Ej, dm, elec_field, stress, statev, V, jacobian)
 
         if v is not None and len(v) != ddsdde.shape[0]:
             # if the numerical Jacobian was called, ddsdde is already the
             # sub-Jacobian
             ddsdde = ddsdde[[[i] for i in v], v]
 
-        sqa_stiff = self.sqa_stiff or sqa_stiff
         if last and sqa_stiff:
             # check how close stiffness returned from material is to the numeric
             c = self.numerical_jacobian(time, dtime, temp, dtemp, kappa, F0,
-                        Fm, Em, dm, elec_field, stress, sdv, V)
-            err = np.amax(np.abs(ddsdde - c)) / np.amax(ddsdde)
+                        Fj, Ej, dm, elec_field, stress, statev, V)
+            scale = max(np.amax(np.abs(ddsdde)), np.amax(np.abs(c)))
+            err = np.amax(np.abs(ddsdde - c)) / scale if scale > 0. else 0.
             if err > 5.E-03: # .5 percent error
                 msg = 'error in material stiffness: {0:.4E} ({1:.2f})'.format(
                     err, time)
@@ -506,6 +539,10 @@ def Material(model, parameters, switch=None, response=None,
     fiber_dirs : ndarray
         Fiber directions, applicable only for model=USER,
         response=ANISOHYPERELASTIC
+    jacobian : str
+        Strategy used to compute the material Jacobian numerically. One of
+        'centered' (default), 'forward', 'complex', or 'broyden'. See
+        matmodlab.mmd.jacobian.
 
     Returns
     -------
@@ -590,15 +627,11 @@ def Material(model, parameters, switch=None, response=None,
                     break
             else:
                 raise MatmodlabError('signature file not found')
-            lines = open(signature, 'r').read()
-            new_signature = os.path.join(PKG_D, libname + '.pyf')
             libname_ = getattr(TheMaterial, 'libname', TheMaterial.name)
-            pat = r'(?is)python\s+module\s+{0}'.format(libname_)
-            repl = r'python module {0}'.format(libname)
-            lines = re.sub(pat, repl, lines)
-            with open(new_signature, 'w') as fh:
-                fh.write(lines)
-            source_files[i] = new_signature
+            if libname_ != libname:
+                # the module is built from the same sources as mml build
+                # builds it from, otherwise each would rebuild it
+                source_files[i] = rename_signature(signature, libname_, libname)
         else:
             libname = getattr(TheMaterial, 'libname', TheMaterial.name)
 
@@ -607,7 +640,15 @@ def Material(model, parameters, switch=None, response=None,
         if rebuild and libname not in environ.rebuild_mat_lib:
             remove(so_lib)
             environ.rebuild_mat_lib.append(libname)
-        if not os.path.isfile(so_lib):
+        # the library is rebuilt if its sources, compiler, or flags changed
+        # since it was built. without a compiler, an existing library is used
+        current = BuildManifest().is_current(libname, source_files + [IO_F90])
+        if os.path.isfile(so_lib) and not current and not environ.fc:
+            logging.getLogger('matmodlab.mmd.simulator').warn(
+                '{0}: material library may be out of date, no fortran '
+                'compiler to rebuild it'.format(libname))
+            current = True
+        if not current:
             logging.getLogger('matmodlab.mmd.simulator').info(
                 '{0}: rebuilding material library'.format(libname))
             from ..mmd import builder as bb
@@ -730,6 +771,60 @@ class keyarray(np.ndarray):
     def __array_finalize__(self, obj):
         self._map = getattr(obj, '_map', None)
 
+class sdvmap(object):
+    """Frozen map from state variable names to their slots in the statev
+    array, accessible by key or attribute. i.e. sdv_map['EQPS'] or
+    sdv_map.EQPS
+
+    Keys sharing a prefix, such as BS_XX, BS_YY, ..., BS_XZ, are also mapped by
+    the prefix (BS) to the slice spanning them, or to an index array if they
+    are not contiguous.
+
+    """
+    def __init__(self, keys):
+        slots = {}
+        groups = {}
+        for (i, key) in enumerate(keys):
+            key = key.upper()
+            slots[key] = i
+            prefix = re.split(r'[_.]', key[::-1], 1)
+            if len(prefix) == 2:
+                groups.setdefault(prefix[1][::-1], []).append(i)
+        for (prefix, idx) in groups.items():
+            if prefix in slots or len(idx) < 2:
+                continue
+            if idx == range(idx[0], idx[-1]+1):
+                slots[prefix] = slice(idx[0], idx[-1]+1)
+            else:
+                slots[prefix] = np.array(idx)
+        # slots are also stored as attributes so that sdv_map.EQPS is a plain
+        # attribute lookup
+        self.__dict__.update(slots)
+        self.__dict__['_map'] = slots
+
+    def __getitem__(self, key):
+        try:
+            return self._map[key.upper()]
+        except KeyError:
+            raise KeyError('{0!r} is not a state variable'.format(key))
+
+    def __getattr__(self, key):
+        if key.startswith('_'):
+            raise AttributeError(key)
+        try:
+            return self._map[key.upper()]
+        except KeyError:
+            raise AttributeError('{0!r} is not a state variable'.format(key))
+
+    def __setattr__(self, key, value):
+        raise AttributeError('sdvmap is read only')
+
+    def __contains__(self, key):
+        return key.upper() in self._map
+
+    def __len__(self):
+        return len(self._map)
+
 def grouper(seq, n=8):
     """
     >>> list(grouper(3, 'ABCDEFG'))
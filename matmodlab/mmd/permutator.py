@@ -8,7 +8,6 @@ import datetime
 import traceback
 import subprocess
 import numpy as np
-import multiprocessing as mp
 from random import shuffle
 from itertools import izip, product
 from collections import OrderedDict
@@ -33,12 +32,13 @@ ps.job_num = 0
 class Permutator(object):
     def __init__(self, job, func, xinit, method=ZIP, correlations=False,
                  verbosity=None, descriptors=None, nprocs=1, funcargs=[], d=None,
-                 shotgun=False, bu=0):
+                 shotgun=False, bu=0, chunksize=None):
 
         self.job = job
 
         self.func = func
         self.nprocs = nprocs
+        self.chunksize = chunksize
         self.correlations = correlations
         self.shotgun = shotgun
 
@@ -132,19 +132,29 @@ Variables:
         logger.info(summary)
 
     def run(self):
+        """Run the permutation jobs
 
+        Evaluations are run in the worker processes of a pool and their
+        results are sent back to this (the parent) process, which is the only
+        process that writes to the evaluation database. Jobs are handed to the
+        workers in chunks of chunksize to keep the cost of communication with
+        the workers small compared to that of short evaluations.
+
+        """
         logger = logging.getLogger('matmodlab.mmd.permutator')
         self.timing["start"] = time.time()
         logger.info("{0}: Starting permutation jobs...".format(self.job))
         args = [(self.func, x, self.funcargs, i, self.rootd, self.job,
-                 self.names, self.descriptors, self.tabular)
+                 self.names, self.descriptors)
                  for (i, x) in enumerate(self.data)]
+        import multiprocessing as mp
         nprocs = max(self.nprocs, environ.nprocs)
         nprocs = min(min(mp.cpu_count(), nprocs), len(self.data)-1)
 
         # run the first job to see if it fails or not, rebuild material (if
         # requested), etc.
-        self.statuses = [run_job(args[0])]
+        self.statuses = []
+        self.write_result(run_job(args[0]))
         if self.statuses[0] != 0:
             resp = raw_input("First job failed, continue? Y/N [N]  ")
             resp = "N" or resp.upper()
@@ -152,21 +162,34 @@ Variables:
                 self.finish()
                 return
 
-        if nprocs == 1:
+        if nprocs <= 1:
             for arg in args[1:]:
-                self.statuses.append(run_job(arg))
+                self.write_result(run_job(arg))
         else:
+            chunksize = self.chunksize
+            if chunksize is None:
+                chunksize = max(1, (len(args) - 1) // (4 * nprocs))
             pool = mp.Pool(processes=nprocs)
-            out = pool.map(run_job, args[1:])
-            pool.close()
-            pool.join()
-            self.statuses.extend(out)
+            try:
+                for result in pool.imap_unordered(run_job, args[1:],
+                                                  chunksize):
+                    self.write_result(result)
+            finally:
+                pool.close()
+                pool.join()
         logger.info("\nPermutation jobs complete")
 
         self.finish()
 
         return
 
+    def write_result(self, result):
+        """Write the result of a single job to the evaluation database"""
+        job_num, stat, evald, parameters, responses = result
+        self.tabular.write_eval_info(job_num, stat, evald, parameters,
+                                     responses)
+        self.statuses.append(stat)
+
     def finish(self):
 
         self.timing["end"] = time.time()
@@ -276,18 +299,26 @@ def catd(d, i):
 def run_job(args):
     """Run the single permutation job
 
+    The job is run in its own evaluation directory, which is passed to the
+    job function and made the default directory of simulators created by it.
+    The working directory of the process is not changed.
+
+    Returns
+    -------
+    result : tuple
+        (job number, status, evaluation directory, parameters, responses)
+
     """
     logger = logging.getLogger('matmodlab.mmd.permutator')
-    (func, x, funcargs, i, rootd, job, names, descriptors, tabular) = args
+    (func, x, funcargs, i, rootd, job, names, descriptors) = args
     #func = getattr(sys.modules[func[0]], func[1])
 
     job_num = i + 1
     ps.job_num = i + 1
     evald = catd(rootd, ps.job_num)
     os.makedirs(evald)
-    cwd = os.getcwd()
-    os.chdir(evald)
     environ.simulation_dir = evald
+    environ.evaluation_dir = evald
     nresp = 0 if descriptors is None else len(descriptors)
 
     # write the params.in for this run
@@ -317,6 +348,8 @@ def run_job(args):
         traceback.print_exception(exc_type, exc_value, exc_traceback)
         stat = 1
         resp = [np.nan for _ in range(nresp)] or None
+    finally:
+        environ.evaluation_dir = None
 
     responses = None
     if descriptors is not None:
@@ -327,7 +360,5 @@ def run_job(args):
                          "of response descriptors".format(ps.job_num))
         else:
             responses = zip(descriptors, resp)
-    tabular.write_eval_info(ps.job_num, stat, evald, parameters, responses)
-    os.chdir(cwd)
 
-    return stat
+    return job_num, stat, evald, parameters, responses
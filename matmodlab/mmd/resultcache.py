@@ -0,0 +1,297 @@
+'''On disk cache of simulation results
+
+Results are cached step by step. The entry of a step holds the output
+records written by the step and the state at its end, and is keyed by a hash
+of everything the results depend on: the material (model, library,
+parameters, initial state variables, and add ons), the options of the
+simulator that change the solution, and the definition of the step and of
+every step run before it. A simulation that repeats one already run reads
+each of its steps from the cache instead of integrating it. Keys are chained,
+
+    key[0] = hash(version, material, options)
+    key[n] = hash(key[n-1], step n)
+
+so that the key of a step is found from that of the previous step alone.
+
+Entries of the ResultCache are files in the cache directory. When the size
+of the directory exceeds its limit, the least recently used entries are
+removed. The StepMemo holds entries in memory, for the life of the process,
+so that simulators sharing a prefix of steps with one run before (a common
+preload, or the steps of a notebook not edited since they were last run)
+start after the prefix without reading from disk.
+
+'''
+import os
+import time
+import hashlib
+import logging
+import numpy as np
+from collections import OrderedDict
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from ..product import VERSION
+from ..utils.errors import MatmodlabError
+
+__all__ = ['ResultCache', 'StepMemo', 'result_cache', 'step_memo',
+           'material_key', 'step_key']
+
+DEFAULT_CACHE_D = os.path.join(os.path.expanduser('~'), '.matmodlab', 'cache')
+
+class ResultCache(object):
+    '''Least recently used cache of step results on disk
+
+    Parameters
+    ----------
+    directory : str
+        Directory holding the cache entries [default: ~/.matmodlab/cache]
+    max_size : int
+        Maximum size of the cache, in bytes [default: 256 MB]
+
+    '''
+    ext = '.mrc'
+    def __init__(self, directory=None, max_size=2**28):
+        self.directory = directory or DEFAULT_CACHE_D
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self.max_size = int(max_size)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = sum(os.path.getsize(f) for (f, t) in self.entries())
+
+    def __str__(self):
+        return '{0} ({1} hits, {2} misses, {3} evictions)'.format(
+            self.directory, self.hits, self.misses, self.evictions)
+
+    def __len__(self):
+        return len(self.entries())
+
+    def filename(self, key):
+        return os.path.join(self.directory, key + self.ext)
+
+    def entries(self):
+        '''The entries of the cache, (filename, mtime) pairs'''
+        entries = []
+        for f in os.listdir(self.directory):
+            if not f.endswith(self.ext):
+                continue
+            f = os.path.join(self.directory, f)
+            try:
+                entries.append((f, os.path.getmtime(f)))
+            except OSError:
+                # removed by another process
+                continue
+        return entries
+
+    def get(self, key):
+        '''The entry stored at key, or None'''
+        filename = self.filename(key)
+        try:
+            with open(filename, 'rb') as fh:
+                entry = pickle.load(fh)
+        except IOError:
+            self.misses += 1
+            return None
+        except Exception:
+            # a corrupt entry
+            logging.getLogger('matmodlab.mmd.simulator').warn(
+                'removing unreadable result cache entry {0}'.format(filename))
+            self.remove(filename)
+            self.misses += 1
+            return None
+        self.touch(filename)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        '''Store entry at key, evicting old entries to make room'''
+        filename = self.filename(key)
+        tmp = '{0}.{1}.tmp'.format(filename, os.getpid())
+        with open(tmp, 'wb') as fh:
+            pickle.dump(entry, fh, pickle.HIGHEST_PROTOCOL)
+        size = os.path.getsize(tmp)
+        if os.path.isfile(filename):
+            size -= os.path.getsize(filename)
+        os.rename(tmp, filename)
+        self.touch(filename)
+        self.size += size
+        if self.size > self.max_size:
+            self.evict()
+
+    def touch(self, filename):
+        '''Mark the entry in filename as the most recently used. Its mtime is
+        set explicitly, the mtime the file system stamps is coarser than
+        the time between uses of the cache'''
+        now = time.time()
+        try:
+            os.utime(filename, (now, now))
+        except OSError:
+            pass
+
+    def remove(self, filename):
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+    def evict(self):
+        '''Remove the least recently used entries until the cache fits in
+        max_size'''
+        entries = sorted(self.entries(), key=lambda x: x[1])
+        sizes = [os.path.getsize(f) for (f, t) in entries]
+        self.size = sum(sizes)
+        for ((f, t), size) in zip(entries, sizes):
+            if self.size <= self.max_size:
+                break
+            self.remove(f)
+            self.size -= size
+            self.evictions += 1
+
+    def clear(self):
+        '''Remove all entries'''
+        for (f, t) in self.entries():
+            self.remove(f)
+        self.size = 0
+
+class StepMemo(object):
+    '''Least recently used memo of step results in memory
+
+    Parameters
+    ----------
+    max_entries : int
+        Maximum number of steps held
+    max_size : int
+        Maximum size of the records held, in bytes [default: 64 MB]
+
+    '''
+    def __init__(self, max_entries=256, max_size=2**26):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __str__(self):
+        return 'memo of {0} steps ({1} hits, {2} misses, {3} evictions)'.format(
+            len(self), self.hits, self.misses, self.evictions)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        '''The entry stored at key, or None'''
+        try:
+            entry = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        # reinsert as the most recently used
+        self.entries[key] = entry
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        '''Store entry at key, evicting old entries to make room'''
+        if key in self.entries:
+            self.size -= self.entries.pop(key)['records'].nbytes
+        self.entries[key] = entry
+        self.size += entry['records'].nbytes
+        while self.entries and (len(self.entries) > self.max_entries or
+                                self.size > self.max_size):
+            key, old = self.entries.popitem(last=False)
+            self.size -= old['records'].nbytes
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+# the memo shared by simulators created with memo=True
+MEMO = StepMemo()
+
+def step_memo(memo):
+    '''The step memo for the memo keyword of the simulator
+
+    Parameters
+    ----------
+    memo : bool, StepMemo instance, or None
+        If True, the memo shared by all simulators of the process
+
+    '''
+    if memo is None or memo is False:
+        return None
+    if memo is True:
+        return MEMO
+    if isinstance(memo, StepMemo):
+        return memo
+    raise MatmodlabError('memo must be True, False, or a StepMemo instance')
+
+def result_cache(cache):
+    '''The result cache for the cache keyword of the simulator
+
+    Parameters
+    ----------
+    cache : bool, str, ResultCache instance, or None
+        If True, the cache in the default directory. A str is the directory
+        of the cache
+
+    '''
+    if cache is None or cache is False:
+        return None
+    if cache is True:
+        return ResultCache()
+    if isinstance(cache, basestring):
+        return ResultCache(cache)
+    if isinstance(cache, ResultCache):
+        return cache
+    raise MatmodlabError('cache must be True, False, a directory, '
+                         'or a ResultCache instance')
+
+def _digest(*items):
+    h = hashlib.sha1()
+    for item in items:
+        if isinstance(item, np.ndarray):
+            item = np.ascontiguousarray(item, dtype=np.float64).tobytes()
+        elif not isinstance(item, bytes):
+            item = repr(item)
+        h.update(item)
+        h.update(b'\0')
+    return h.hexdigest()
+
+def material_key(material, options):
+    '''The key of the material and the dict of simulator options, the root
+    of the keys of the steps run with them'''
+    # rebuilding or editing the material invalidates its results
+    import inspect
+    library = getattr(material.lib, '__file__', None)
+    try:
+        source = inspect.getfile(material.__class__)
+    except TypeError:
+        source = None
+    files = [(f, os.path.getmtime(f)) for f in (library, source)
+             if f is not None and os.path.isfile(f)]
+    jacobian = getattr(material.jacobian, 'name', None)
+    return _digest(VERSION, material.name, material.libname, files,
+                   material.parameter_names, np.array(material.parameters),
+                   material.sdv_keys, np.array(material.initial_sdv),
+                   material.addons, material.num_stiff, jacobian,
+                   *[x for item in sorted(options.items()) for x in item])
+
+def step_key(key, step):
+    '''The key of step, following the step with key'''
+    adaptive = step.adaptive
+    if adaptive is not None:
+        adaptive = sorted((k, v) for (k, v) in vars(adaptive).items()
+                          if not k.startswith('num_'))
+    jacobian = getattr(step.jacobian, 'name', None)
+    frames = np.array([(f.time, f.increment) for f in step.frames])
+    return _digest(key, step.kind, np.array(step.components),
+                   list(step.descriptors), step.increment, frames,
+                   step.kappa, step.temperature, np.array(step.elec_field),
+                   step.num_dumps, step.proportional, step.sqa_stiff,
+                   step.mat_stiff, jacobian, adaptive)
@@ -2,24 +2,35 @@ import os
 import sys
 import time
 import logging
-import inspect
 from math import sqrt
 import numpy as np
 from time import time as tt
 from collections import namedtuple, OrderedDict
 from numpy.linalg import solve, lstsq
 from numpy.linalg import LinAlgError as LinAlgError
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 
 from ..constants import *
 from ..mml_siteenv import environ
 from ..utils import mmlabpack as mml
+from ..utils.symeig import expm3
 from ..utils.errors import MatmodlabError
-from ..utils.fileio import loadfile, savefile
+from ..utils.fileio import loadfile, savefile, rec2arr, RecordStream
 from ..utils.logio import setup_logger
 from ..utils.plotting import create_figure
 from .material import MaterialModel, Material
+from .jacobian import JacobianStrategy
+from .increments import frame_controller
+from .resultcache import result_cache, step_memo, material_key, step_key
+from . import instrumentation
+from .instrumentation import SimulationStats
 
 EPS = np.finfo(np.float).eps
+MAX_CUTBACK_DEPTH = 5
+CHECKPOINT_VERSION = 1
 
 __all__ = ['MaterialPointSimulator', 'StrainStep', 'StressStep', 'MixedStep',
            'DefGradStep', 'DisplacementStep', 'piecewise_linear']
@@ -27,13 +38,50 @@ __all__ = ['MaterialPointSimulator', 'StrainStep', 'StressStep', 'MixedStep',
 class MaterialPointSimulator(object):
     def __init__(self, job, verbosity=None, d=None,
                  initial_temperature=DEFAULT_TEMP, termination_time=None,
-                 output_format=None, no_cutback=False):
-        """Initialize the MaterialPointSimulator object"""
+                 output_format=None, no_cutback=False, modified_newton=False,
+                 stream=False, flush_frames=None, checkpoint=None,
+                 cache=None, memo=None, stats=None):
+        """Initialize the MaterialPointSimulator object
+
+        With stream=True, output records are appended to job.rpk as each step
+        completes (and every flush_frames frames, if given) instead of being
+        held in memory until the simulation is dumped.
+
+        With checkpoint=n, a checkpoint is written to job.chk after every n
+        steps, see write_checkpoint and restart.
+
+        With cache=True (or a directory, or a ResultCache), the results of
+        each step are read from the result cache if the same material, step,
+        and steps before it were run before, and are stored otherwise. See
+        matmodlab.mmd.resultcache. With memo=True (or a StepMemo), step
+        results are also kept in memory, a simulator whose first steps match
+        those of one already run starts after them.
+
+        With stats=True, the frames, material calls, Jacobian evaluations,
+        solver iterations, and time spent in each part of the frame update are
+        counted for each step in self.stats and tabulated in the log when the
+        simulation finishes. See matmodlab.mmd.instrumentation.
+
+        """
         self.job = job
         self.material = None
         self.initialized = False
         self.termination_time = termination_time
         self.no_cutback = environ.no_cutback or no_cutback
+        self.modified_newton = modified_newton
+        self.stream = stream
+        self.flush_frames = flush_frames
+        self.checkpoint = int(checkpoint or 0)
+        if cache is None:
+            cache = environ.result_cache
+        self.cache = result_cache(cache)
+        self.memo = step_memo(memo)
+        self.cache_key = None
+        if stats is None:
+            stats = environ.stats
+        self.stats = SimulationStats() if stats else None
+        self.material_args = None
+        self.num_completed = 0
 
         self.output_format = output_format or environ.output_format
 
@@ -41,7 +89,7 @@ class MaterialPointSimulator(object):
         self.initial_temperature = initial_temperature
 
         # setup IO
-        d = d or os.getcwd()
+        d = d or environ.evaluation_dir or os.getcwd()
         environ.simulation_dir = d
         self.directory = environ.simulation_dir
         self.filename = None
@@ -93,6 +141,7 @@ class MaterialPointSimulator(object):
         '''
         kwargs['initial_temp'] = self.initial_temperature
         self.material = Material(model, parameters, **kwargs)
+        self.material_args = (model, parameters, kwargs)
         return self.material
 
     @property
@@ -228,6 +277,7 @@ class MaterialPointSimulator(object):
 
         num_frames = sum([len(s.frames) for s in self.steps.values()])
         s = '\n   '.join('{0}'.format(x) for x in environ.std_materials)
+        import inspect
         try:
             filename = inspect.getfile(self.material.__class__)
         except TypeError:
@@ -251,8 +301,9 @@ Material: {5}
            self.material.num_sdv)
         logging.getLogger('matmodlab.mmd.simulator').info(summary)
 
-    def initialize_simulation(self):
-        '''initialize everything for running the steps
+    def initialize_simulation(self, checkpoint=None):
+        '''initialize everything for running the steps, or for continuing
+        those of checkpoint
 
         '''
         logger = logging.getLogger('matmodlab.mmd.simulator')
@@ -283,6 +334,21 @@ Material: {5}
 
         self.write_summary()
 
+        if self.cache is not None or self.memo is not None:
+            # root of the keys of the steps in the result cache and memo
+            options = {'initial_stress': np.array(self.initial_stress),
+                       'initial_temperature': self.initial_temperature,
+                       'termination_time': self.termination_time,
+                       'no_cutback': self.no_cutback,
+                       'modified_newton': self.modified_newton}
+            self.cache_key = material_key(self.material, options)
+            self.steps.values()[0].cache_key = self.cache_key
+
+        if checkpoint is not None:
+            self.restore_checkpoint(checkpoint)
+            self.initialized = True
+            return
+
         step = self.steps.values()[0]
         frame = step.frames[0]
         S0 = self.initial_stress
@@ -295,9 +361,134 @@ Material: {5}
                  Time=frame.value, DTime=frame.increment,
                  E=Z6, F=I9, D=Z6, DS=Z6, S=S0,
                  SDV=sdv, T=step.temperature, EF=step.elec_field)
+        if self.stream:
+            filename = os.path.join(self.directory, self.job + '.' + REC)
+            self.records.open_stream(filename, self.flush_frames)
 
         self.initialized = True
 
+    def write_checkpoint(self, filename=None):
+        '''Write the state of the simulation at the end of the last completed
+        step to filename [default: job.chk]
+
+        The checkpoint holds the state database, the steps run so far, the
+        material and its parameters, and the output records (or, if they are
+        streamed, their number and file). Returns the name of the file.
+
+        '''
+        if not self.initialized:
+            raise MatmodlabError('no steps have been run, nothing to '
+                                 'checkpoint')
+        if filename is None:
+            filename = os.path.join(self.directory, self.job + '.chk')
+        if self.records.stream is not None:
+            self.records.flush()
+            records = (self.records.stream.filename,
+                       self.records.stream.num_rows)
+        else:
+            records = np.array(self.records.data)
+        steps = StepRepository(self.steps.items()[:self.num_completed+1])
+        step = steps.values()[-1]
+        model, parameters, kwargs = self.material_args
+        options = {'initial_temperature': self.initial_temperature,
+                   'termination_time': self.termination_time,
+                   'output_format': self.output_format,
+                   'no_cutback': self.no_cutback,
+                   'modified_newton': self.modified_newton,
+                   'stream': self.stream, 'flush_frames': self.flush_frames,
+                   'checkpoint': self.checkpoint}
+        chk = {'version': CHECKPOINT_VERSION, 'job': self.job,
+               'options': options,
+               'cursor': (step.name, step.number, step.frames[-1].value),
+               'material': (model, parameters, kwargs, self.material.addons),
+               'parameters': np.array(self.material.parameters),
+               'initial_stress': self.istress, 'steps': steps,
+               'state': self.state_db.db, 'time': self._time,
+               'records': records}
+
+        # write to a temporary file first so that a failure while writing
+        # does not clobber the previous checkpoint
+        tmp = filename + '.tmp'
+        with open(tmp, 'wb') as fh:
+            pickle.dump(chk, fh, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, filename)
+        logging.getLogger('matmodlab.mmd.simulator').debug(
+            'checkpoint written to {0} ({1}, time={2})'.format(
+                filename, step.name, step.frames[-1].value))
+        return filename
+
+    @classmethod
+    def restart(cls, filename, job=None, d=None, verbosity=None, **kwargs):
+        '''Continue the simulation checkpointed in filename from the end of
+        its last completed step
+
+        Steps created on the returned simulator are run from the checkpointed
+        state. job defaults to that of the checkpoint, give a new job name to
+        branch a new load history off of the checkpoint. Other keywords
+        override the checkpointed options of the simulator.
+
+        '''
+        try:
+            with open(filename, 'rb') as fh:
+                chk = pickle.load(fh)
+        except Exception as e:
+            raise MatmodlabError('{0}: unable to read checkpoint '
+                                 '({1})'.format(filename, e))
+        if not isinstance(chk, dict) or chk.get('version') != CHECKPOINT_VERSION:
+            raise MatmodlabError('{0}: not a checkpoint file'.format(filename))
+
+        options = dict(chk['options'])
+        options.update(kwargs)
+        self = cls(job or chk['job'], verbosity=verbosity, d=d, **options)
+        model, parameters, mat_kwargs, addons = chk['material']
+        material = self.Material(model, parameters, **mat_kwargs)
+        for (name, args) in addons:
+            getattr(material, name)(*args)
+        material.parameters[:] = chk['parameters']
+        self.steps = chk['steps']
+        self.istress = chk['initial_stress']
+        self.initialize_simulation(checkpoint=chk)
+        logging.getLogger('matmodlab.mmd.simulator').info(
+            'Restarting from {0} at the end of {1} (time={3})'.format(
+                filename, *chk['cursor']))
+        return self
+
+    def restore_checkpoint(self, chk):
+        '''Restore the state and output records of the checkpoint chk'''
+        self._time = chk['time']
+        self.num_completed = chk['cursor'][1]
+        if self.cache_key is not None:
+            # results are cached only if the steps checkpointed were
+            self.cache_key = getattr(self.steps.values()[-1], 'cache_key',
+                                     None)
+        self.state_db = StateDB(**chk['state'])
+        rows = chk['records']
+        filename = os.path.join(self.directory, self.job + '.' + REC)
+        if isinstance(rows, tuple):
+            source, n = rows
+            if (self.stream and os.path.isfile(source) and
+                os.path.realpath(source) == os.path.realpath(filename)):
+                # continue the stream in place
+                self.records.allocate()
+                self.records.open_stream(filename, self.flush_frames,
+                                         num_rows=n)
+                return
+            try:
+                rows = np.load(source, mmap_mode='r')[:n]
+            except IOError:
+                raise MatmodlabError('{0}: output records of the checkpoint '
+                                     'not found'.format(source))
+            if len(rows) != n:
+                raise MatmodlabError('{0}: expected {1} output records, '
+                                     'found {2}'.format(source, n, len(rows)))
+        if self.stream:
+            self.records.allocate()
+            self.records.open_stream(filename, self.flush_frames)
+            for i in range(0, len(rows), Records.chunk):
+                self.records.stream.write(rows[i:i+Records.chunk])
+        else:
+            self.records.allocate(rows)
+
     def run(self):
         # at this point, all steps have run (they are run when created),
         # now finish the simulation up
@@ -309,8 +500,24 @@ Material: {5}
     def finish(self):
         logger = logging.getLogger('matmodlab.mmd.simulator')
         logger.info('\n...calculations completed ({0:.4f}s)\n'.format(self._time))
+        jacobians = [self.material.jacobian]
+        jacobians.extend([s.jacobian for s in self.steps.values()
+                          if s.jacobian is not None])
+        for jacobian in jacobians:
+            if jacobian.num_evals:
+                logger.info('Jacobian: {0}'.format(jacobian))
+        for step in self.steps.values():
+            if step.adaptive is not None:
+                logger.info('{0}: {1}'.format(step.name, step.adaptive))
+        if self.cache is not None:
+            logger.info('Result cache: {0}'.format(self.cache))
+        if self.memo is not None:
+            logger.info('Step memo: {0}'.format(self.memo))
+        if self.stats is not None:
+            logger.info('Statistics:\n{0}\n'.format(self.stats.summary()))
         if not environ.notebook:
             self.dump()
+        self.records.close_stream()
         self.ran = True
 
     def dump(self, format=None, ffmt='%.18e', abaqus_kwds=0):
@@ -322,7 +529,11 @@ Material: {5}
         output_format = format or self.output_format
         ext = '.' + output_format
         self.filename = os.path.join(self.directory, self.job + ext)
-        if output_format == REC:
+        if output_format == REC and self.records.stream is not None:
+            # the records are already in the file
+            self.records.flush()
+
+        elif output_format == REC:
             self.records.data.dump(self.filename)
 
         elif output_format in (TXT, CSV):
@@ -346,7 +557,9 @@ Material: {5}
             # Retrieve all SDVs from the record
             keys = [x for x in self.records.data.dtype.names
                     if x.startswith('SDV_')]
-            a = rec2arr(self.records.data[keys])
+            # a copy: the view rec2arr returns is read only and aliases the
+            # records buffer
+            a = np.array(rec2arr(self.records.data[keys]))
             names = [x.replace('SDV_', '').strip() for x in keys]
         else:
             a = self.records.data[var]
@@ -363,7 +576,7 @@ Material: {5}
 
         if not variables:
             names = self.records.keys(expand=1)
-            data = rec2arr(self.records.data, rows=at_step)
+            data = np.array(rec2arr(self.records.data, rows=at_step))
             if disp:
                 return names, data
             return data
@@ -441,52 +654,102 @@ Material: {5}
         if not self.initialized:
             self.initialize_simulation()
 
-        if step.num_cutbacks >= 4:
-            self.failed = True
-            raise MatmodlabError('number of cutbacks for step {0} exceeds '
-                                 'the maximum allowable'.format(step.number))
-
         try:
-            while 1:
-                state = self._run_step(step)
-                if not CB:
-                    # no cutbacks requested
-                    break
-
-                if self.no_cutback:
-                    break
-
-                #raise SystemExit('trying to cut back')
-                if step.num_cutbacks > 3:
-                    # accept whatever is calculated
-                    break
-
-                # the strain increment was too large, cut it
-                if CB.pnewdt is not None:
-                    # a suggested time step size was given
-                    step.cutback(pnewdt=CB.pnewdt)
-
-                elif CB.cutfac:
-                    logger.warn('increasing frames on step {0}'.format(step.number))
-                    step.cutback(cutfac=CB.cutfac)
-
+            entry = None
+            if self.cache_key is not None:
+                step.cache_key = step_key(self.cache_key, step)
+                entry = self.find_cache_entry(step.cache_key)
+
+            if entry is not None:
+                logger.info('{0}: results read from the result '
+                            'cache'.format(step.name))
+                state = self.load_cache_entry(step, entry)
+            else:
+                num_rows = self.records.num_rows
+                if self.stats is None:
+                    state = self._run_step(step)
                 else:
-                    raise ValueError('unrecognized cutback parameter')
-
-                CB.clear()
-                self.records.clear_cache()
+                    stats = self.stats.begin(step.name)
+                    ti = tt()
+                    try:
+                        state = self._run_step(step)
+                    finally:
+                        self.stats.end()
+                        stats.time = tt() - ti
+                        stats.frames = len(step.frames)
+                        stats.cutbacks = step.num_cutbacks
 
             # Save the state for next steps
             time, temp, F, strain, stress, efield, statev = state
             self.records.advance()
+            if self.cache_key is not None:
+                if entry is None:
+                    entry = self.cache_entry(step, state, num_rows)
+                    for cache in (self.memo, self.cache):
+                        if cache is not None:
+                            cache.put(step.cache_key, entry)
+                self.cache_key = step.cache_key
             self.state_db.advance(F=F, time=time, temp=temp, stress=stress,
                                   strain=strain, efield=efield, statev=statev)
+            self.num_completed = step.number
+            if self.checkpoint and step.number % self.checkpoint == 0:
+                self.write_checkpoint()
 
         except StopSteps:
             self.finish()
 
         return
 
+    def find_cache_entry(self, key):
+        '''The results of the step with key from the memo or, failing that,
+        the result cache'''
+        entry = None
+        if self.memo is not None:
+            entry = self.memo.get(key)
+        if entry is None and self.cache is not None:
+            entry = self.cache.get(key)
+            if entry is not None and self.memo is not None:
+                self.memo.put(key, entry)
+        return entry
+
+    def cache_entry(self, step, state, num_rows):
+        '''The cache entry of step, whose records start at row num_rows: the
+        state at the end of the step, its records, and the record offset at
+        its end'''
+        return {'state': tuple(np.array(x) for x in state),
+                'records': np.array(self.records.data[num_rows:]),
+                'offset': self.records.num_rows,
+                'frames': [(f.time, f.increment, f.value) for f in step.frames],
+                'num_cutbacks': step.num_cutbacks}
+
+    def load_cache_entry(self, step, entry):
+        '''Write the records of the cached step and return its final state'''
+        offset = entry.get('offset')
+        if (offset is not None and
+            self.records.num_rows + len(entry['records']) != offset):
+            raise MatmodlabError('{0}: cached records do not follow those of '
+                                 'the previous step'.format(step.name))
+        step.frames = []
+        for (time, increment, value) in entry['frames']:
+            frame = step.Frame(time, increment)
+            frame.value = value
+        step.num_cutbacks = entry['num_cutbacks']
+        self.records.extend(entry['records'])
+        return entry['state']
+
+    def cache_frame(self, step, frame, strain, F, d, dstress, stress, statev,
+                    temp, efield):
+        '''Cache the output record of frame'''
+        stats = instrumentation.collector
+        if stats is not None:
+            ti = tt()
+        self.records.cache(Step=step.number, Frame=frame.number,
+            Time=frame.value, DTime=frame.increment,
+            E=strain[2]/VOIGT, F=F[1], D=d/VOIGT, DS=dstress,
+            S=stress[2], SDV=statev[1], T=temp[2], EF=efield[2])
+        if stats is not None:
+            stats.time_records += tt() - ti
+
     def _run_step(self, step):
         '''Process this step '''
 
@@ -582,41 +845,70 @@ Material: {5}
                 dedt[v] = solve(Jsub,  work)
             except:
                 dedt[v] -= lstsq(Jsub, work)[0]
+            d = np.array(dedt)
 
-        # process this leg
-        for (iframe, frame) in enumerate(step.frames):
-
-            logger.info('\r' + message.format(iframe+1), extra={'continued':1})
+        # with modified Newton, the factorized Jacobian is kept across frames
+        newton_cache = ModifiedNewton() if self.modified_newton else None
 
+        # with no stresses prescribed, d is constant over the step and F is
+        # advanced by the incremental operator exp(d dt), computed once for
+        # each frame increment. The compiled update_deformation is cheaper
+        # than the cached product and is used whenever it is available
+        kinematics = {}
+        def advance_deformation(dtime, F0, d):
+            try:
+                A = kinematics[dtime]
+            except KeyError:
+                A = kinematics[dtime] = expm3(mml.as3x3(d / VOIGT) * dtime)
+            return np.dot(A, F0.reshape((3, 3))).reshape(9)
+
+        def update(a1, a2, dtime, dtemp, d):
+            """Advance the state one frame, to the fraction a2 of the step.
+            Returns d, the stress rate, and the prescribed stress"""
             # interpolate values to the target values for this step
-            a1 = float(num_frame - (iframe + 1)) / num_frame
-            a2 = float(iframe + 1) / num_frame
             efield[2] = a1 * efield[0] + a2 * efield[1]
             strain[2] = a1 * strain[0] + a2 * strain[1]
             pstress = a1 * stress[0] + a2 * stress[1]
+            stats = instrumentation.collector
 
             if nv:
                 # One or more stresses prescribed
+                if stats is not None:
+                    ti, tm = tt(), stats.time_material
                 d = sig2d(self.material, time[2], dtime, temp[2], dtemp,
                           kappa, F[0], F[1], strain[2], dedt, stress[2],
                           statev[0], efield[2], v, pstress[v],
-                          proportional)
-
-            # compute the current deformation gradient and strain from
-            # previous values and the deformation rate
-            F[1], e = mml.update_deformation(dtime, kappa, F[0], d)
-            strain[2,v] = e[v]
-            if environ.sqa:
-                if not np.allclose(strain[2,vx], e[vx]):
-                    logger.info('sqa: error computing strain '
-                                '(step={0})'.format(step.name))
+                          proportional, jacobian=step.jacobian,
+                          newton_cache=newton_cache)
+                if stats is not None:
+                    # time in the material is counted separately
+                    stats.time_solve += (tt() - ti -
+                                         (stats.time_material - tm))
+
+            if stats is not None:
+                ti = tt()
+
+            if nv or environ.sqa or mml.compiled:
+                # compute the current deformation gradient and strain from
+                # previous values and the deformation rate
+                F[1], e = mml.update_deformation(dtime, kappa, F[0], d)
+                strain[2,v] = e[v]
+                if environ.sqa:
+                    if not np.allclose(strain[2,vx], e[vx]):
+                        logger.info('sqa: error computing strain '
+                                    '(step={0})'.format(step.name))
+            else:
+                # the strain is prescribed, only F is updated
+                F[1] = advance_deformation(dtime, F[0], d)
+            if stats is not None:
+                stats.time_kinematics += tt() - ti
 
             # update material state
             s = np.array(stress[2])
             stress[2], statev[1] = self.material.compute_updated_state(
                 time[2], dtime, temp[2], dtemp, kappa, F[0], F[1], strain[2], d,
                 efield[2], stress[2], statev[0], last=True,
-                sqa_stiff=step.sqa_stiff, disp=1)
+                sqa_stiff=step.sqa_stiff, disp=1, jacobian=step.jacobian)
             dstress = (stress[2] - s) / dtime
 
             F[0] = F[1]
@@ -624,35 +916,103 @@ Material: {5}
             temp[2] = a1 * temp[0] + a2 * temp[1]
             statev[0] = statev[1]
 
-            # --- update the state
-            self.records.cache(Step=step.number, Frame=frame.number,
-                 Time=frame.value, DTime=frame.increment,
-                 E=strain[2]/VOIGT, F=F[1], D=d/VOIGT, DS=dstress, S=stress[2],
-                 SDV=statev[1], T=temp[2], EF=efield[2])
-
-            if iframe > 1 and nv and not warned:
-                sigmag = np.sqrt(np.sum(stress[2,v] ** 2))
-                sigerr = np.sqrt(np.sum((stress[2,v] - pstress[v]) ** 2))
-                warned = True
-                _tol = np.amax(np.abs(stress[2,v]))
-                _tol /= self.material.completions['K']
-                _tol = max(_tol, 1e-4)
-                if sigerr > _tol:
-                    logger.warn('{0}, frame {1}, '
-                                'prescribed stress error: {2: .5f}. '
-                                '(% err: {3: .5f}) '
-                                'consider increasing number of '
-                                'steps'.format(step.name, iframe, sigerr,
-                                               sigerr/sigmag*100.0))
-
-            if termination_time is not None and time[2] >= termination_time:
-                step_duration = tt() - step_start_time
-                self._time += step_duration
+            return d, dstress, pstress
+
+        state = (F, strain, stress, statev, efield, time, temp)
+        def substep(a0, a1, a2, dtime, dtemp, d, depth=0):
+            """Advance the state one frame from the fraction a0 to a2 of the
+            step. If the material or the stress solver request a cutback, the
+            frame is retaken from its starting state in substeps, recursively
+            up to MAX_CUTBACK_DEPTH times"""
+            saved = [x.copy() for x in state]
+            dsave = d
+            CB.clear()
+            d, dstress, pstress = update(a1, a2, dtime, dtemp, d)
+            if not CB or self.no_cutback:
+                CB.clear()
+                return d, dstress, pstress
+            if depth >= MAX_CUTBACK_DEPTH:
+                # accept whatever is calculated
+                logger.warn('{0}: maximum number of cutbacks exceeded at '
+                            'time {1}'.format(step.name, time[2]))
+                CB.clear()
+                return d, dstress, pstress
+
+            # retake the frame in n substeps, keeping the frames before it
+            n = CB.substeps()
+            CB.clear()
+            for (x, y) in zip(state, saved):
+                x[:] = y
+            d = dsave
+            if newton_cache is not None:
+                newton_cache.clear()
+            step.num_cutbacks += 1
+            s = np.array(stress[2])
+            for i in range(n):
+                b0 = a0 + (a2 - a0) * i / float(n)
+                if i == n - 1:
+                    b1, b2 = a1, a2
+                else:
+                    b2 = a0 + (a2 - a0) * (i + 1) / float(n)
+                    b1 = 1. - b2
+                d, ds, pstress = substep(b0, b1, b2, dtime / n, dtemp / n, d,
+                                         depth=depth+1)
+            dstress = (stress[2] - s) / dtime
+            return d, dstress, pstress
+
+        if step.adaptive is not None and step.increment >= 1.e-14:
+            iframe, terminated = self._run_adaptive_frames(step, update, time,
+                temp, F, strain, stress, statev, efield, d, dedt, J0,
+                newton_cache, message)
+            if terminated:
+                self._time += tt() - step_start_time
                 logger.info('\r' + message.format(iframe+1) +
                             ' ({0:.4f}s)'.format(self._time))
                 raise StopSteps
 
-            continue  # continue to next frame
+        else:
+            # make room for this step's frames in the output records
+            self.records.reserve(min(num_frame, step.num_dumps + 1))
+
+            # process this leg
+            for (iframe, frame) in enumerate(step.frames):
+
+                logger.info('\r' + message.format(iframe+1),
+                            extra={'continued':1})
+
+                a1 = float(num_frame - (iframe + 1)) / num_frame
+                a2 = float(iframe + 1) / num_frame
+                a0 = float(iframe) / num_frame
+                d, dstress, pstress = substep(a0, a1, a2, dtime, dtemp, d)
+
+                # --- update the state
+                if step.writes_frame(a0, a2):
+                    self.cache_frame(step, frame, strain, F, d, dstress,
+                                     stress, statev, temp, efield)
+
+                if iframe > 1 and nv and not warned:
+                    sigmag = np.sqrt(np.sum(stress[2,v] ** 2))
+                    sigerr = np.sqrt(np.sum((stress[2,v] - pstress[v]) ** 2))
+                    warned = True
+                    _tol = np.amax(np.abs(stress[2,v]))
+                    _tol /= self.material.completions['K']
+                    _tol = max(_tol, 1e-4)
+                    if sigerr > _tol:
+                        logger.warn('{0}, frame {1}, '
+                                    'prescribed stress error: {2: .5f}. '
+                                    '(% err: {3: .5f}) '
+                                    'consider increasing number of '
+                                    'steps'.format(step.name, iframe, sigerr,
+                                                   sigerr/sigmag*100.0))
+
+                if termination_time is not None and time[2] >= termination_time:
+                    step_duration = tt() - step_start_time
+                    self._time += step_duration
+                    logger.info('\r' + message.format(iframe+1) +
+                                ' ({0:.4f}s)'.format(self._time))
+                    raise StopSteps
+
+                continue  # continue to next frame
 
         step_duration = tt() - step_start_time
         self._time += step_duration
@@ -662,6 +1022,95 @@ Material: {5}
 
         return time[2], temp[2], F[1], strain[2], stress[2], efield[2], statev[1]
 
+    def _run_adaptive_frames(self, step, update, time, temp, F, strain,
+                             stress, statev, efield, d, dedt, J0,
+                             newton_cache, message):
+        """Run the frames of step with increments chosen by the step's frame
+        controller. The frames of the step are replaced by those accepted.
+        Returns the index of the last frame and whether the termination time
+        was reached"""
+        logger = logging.getLogger('matmodlab.mmd.simulator')
+        controller = step.adaptive
+        t0, increment = time[0], time[1] - time[0]
+        hmin, hmax = controller.bounds(increment)
+        h = min(max(step.frames[0].increment, hmin), hmax)
+        targets = controller.targets(t0, time[1])
+        K = self.material.completions['K']
+
+        # rates over the previous frame, predicted from the elastic stiffness
+        # for the first frame
+        edot = np.array(dedt)
+        sdot = np.dot(J0, dedt)
+
+        state = (F, strain, stress, statev, efield, time, temp)
+        step.frames = []
+        t, itarget = t0, 0
+        while itarget < len(targets):
+            # the increment is cut short at output times
+            target = targets[itarget]
+            dt, reached = h, False
+            if t + dt > target - hmin:
+                dt, reached = target - t, True
+            if reached and itarget == len(targets) - 1:
+                a2 = 1.
+            else:
+                a2 = (t + dt - t0) / increment
+            a1 = 1. - a2
+            dtemp = (temp[1] - temp[0]) * dt / increment
+
+            saved = [x.copy() for x in state]
+            dsave = d
+            CB.clear()
+            d, dstress, pstress = update(a1, a2, dt, dtemp, d)
+            deps = strain[2] - saved[1][2]
+            if CB and not self.no_cutback:
+                # the material or stress solver requested a cutback
+                err, factor = np.inf, 1. / CB.substeps()
+                step.num_cutbacks += 1
+            else:
+                err = controller.error(dstress * dt, deps, sdot, edot, dt, K)
+                factor = controller.factor(err)
+            CB.clear()
+
+            if err > 1. and dt > hmin:
+                # reject the frame and retake it with a smaller increment
+                for (x, y) in zip(state, saved):
+                    x[:] = y
+                d = dsave
+                if newton_cache is not None:
+                    newton_cache.clear()
+                controller.num_rejected += 1
+                h = max(hmin, dt * factor)
+                continue
+
+            controller.num_accepted += 1
+            frame = step.Frame(t, dt)
+            if reached:
+                frame.value = target
+            iframe = len(step.frames) - 1
+            logger.info('\r' + message.format(iframe+1), extra={'continued':1})
+            if step.writes_frame((t - t0) / increment, a2):
+                self.cache_frame(step, frame, strain, F, d, dstress,
+                                 stress, statev, temp, efield)
+
+            if dt < h and factor >= 1.:
+                # frames cut short at output times do not grow the increment
+                pass
+            else:
+                h = dt * factor
+            h = min(hmax, max(hmin, h))
+            edot, sdot = deps / dt, dstress
+
+            t = frame.value
+            if reached:
+                itarget += 1
+
+            if (self.termination_time is not None and
+                time[2] >= self.termination_time):
+                return iframe, True
+
+        return iframe, False
+
     def visualize_results(self, overlay=None):
         from ..tpl import tsviewer
         if self.filename is None:
@@ -673,7 +1122,7 @@ Material: {5}
 
 
 def sig2d(material, t, dt, temp, dtemp, kappa, f0, f, stran, d, sig, statev,
-          efield, v, sigspec, proportional):
+          efield, v, sigspec, proportional, jacobian=None, newton_cache=None):
     '''Determine the symmetric part of the velocity gradient given stress
 
     Parameters
@@ -705,7 +1154,8 @@ def sig2d(material, t, dt, temp, dtemp, kappa, f0, f, stran, d, sig, statev,
 
     if not proportional:
         d = newton(material, t, dt, temp, dtemp, kappa, f0, f, stran, d,
-                   sig, statev, efield, v, sigspec, proportional)
+                   sig, statev, efield, v, sigspec, proportional,
+                   jacobian=jacobian, newton_cache=newton_cache)
         if d is not None:
             return d
 
@@ -714,7 +1164,8 @@ def sig2d(material, t, dt, temp, dtemp, kappa, f0, f, stran, d, sig, statev,
         d = dsave.copy()
         d[v] = np.zeros(len(v))
         d = newton(material, t, dt, temp, dtemp, kappa, f0, f, stran, d,
-                   sig, statev, efield, v, sigspec, proportional)
+                   sig, statev, efield, v, sigspec, proportional,
+                   jacobian=jacobian, newton_cache=newton_cache)
         if d is not None:
             return d
 
@@ -722,13 +1173,17 @@ def sig2d(material, t, dt, temp, dtemp, kappa, f0, f, stran, d, sig, statev,
 
     # --- Still didn't converge. Try downhill simplex method and accept
     #     whatever answer it returns:
+    if instrumentation.collector is not None:
+        instrumentation.collector.simplex_fallbacks += 1
     d = dsave.copy()
     return simplex(material, t, dt, temp, dtemp, kappa, f0, f, stran, d,
-                   sig, statev, efield, v, sigspec, proportional)
+                   sig, statev, efield, v, sigspec, proportional,
+                   jacobian=jacobian)
 
 
 def newton(material, t, dt, temp, dtemp, kappa, f0, farg, stran, darg,
-           sigarg, statev_arg, efield, v, sigspec, proportional):
+           sigarg, statev_arg, efield, v, sigspec, proportional,
+           jacobian=None, newton_cache=None):
     '''Seek to determine the unknown components of the symmetric part of velocity
     gradient d[v] satisfying
 
@@ -754,6 +1209,13 @@ def newton(material, t, dt, temp, dtemp, kappa, f0, farg, stran, darg,
         stresses (or stress rates) are specified
     sigspec : ndarray
         Prescribed stress
+    jacobian : Jacobian strategy or None
+        Strategy used to compute the Jacobian numerically. Defaults to that
+        of the material.
+    newton_cache : ModifiedNewton or None
+        If given, the factorized Jacobian in newton_cache is reused across
+        iterations (and calls), and is only refreshed when convergence
+        degrades (modified Newton)
 
     Returns
     -------
@@ -781,6 +1243,9 @@ def newton(material, t, dt, temp, dtemp, kappa, f0, farg, stran, darg,
     argument converged is a flag indicat- ing whether or not the procedure
     converged:
 
+    The stress, state, and Jacobian are found from one call to the material
+    on each iteration. In modified Newton, only the stress and state are.
+
     '''
     logger = logging.getLogger('matmodlab.mmd.simulator')
     depsmag = lambda a: sqrt(sum(a[:3] ** 2) + 2. * sum(a[3:] ** 2)) * dt
@@ -801,65 +1266,143 @@ def newton(material, t, dt, temp, dtemp, kappa, f0, farg, stran, darg,
     if (depsmag(d) > depsmax):
         return None
 
-    # update the material state to get the first guess at the new stress
-    sig, statev, stif = material.compute_updated_state(t, dt, temp, dtemp, kappa,
-        f0, f, stran, d, efield, sig, statev)
+    jacobian = jacobian or material.jacobian
+    modified = newton_cache is not None
+    fresh = not modified or not newton_cache.valid(v)
+
+    # update the material state to get the first guess at the new stress and,
+    # unless a factorized Jacobian is reused, the Jacobian
+    sig, statev, Jsub = evaluate(material, t, dt, temp, dtemp, kappa, f0, f,
+        stran, d, efield, sig, statev, v, jacobian, fresh)
     sigerr = sig[v] - sigspec
+    relerr = np.inf
 
     # --- Perform Newton iteration
-    for i in range(maxit2):
-        sig = sigsave.copy()
-        statev = statev_save.copy()
-        Jsub = material.compute_updated_state(t, dt, temp, dtemp, kappa,
-            f0, f, stran, d, efield, sig, statev, v=v, disp=2)
+    jacobian.reset()
+    stats = instrumentation.collector
+    try:
+        for i in range(maxit2):
+            if stats is not None:
+                stats.newton_iterations += 1
+
+            if fresh and environ.sqa:
+                try:
+                    evals = np.linalg.eigvalsh(Jsub)
+                except LinAlgError:
+                    raise MatmodlabError('failed to determine elastic '
+                                         'stiffness eigenvalues')
+                else:
+                    if np.any(evals < 0.):
+                        negevals = evals[np.where(evals < 0.)]
+                        logger.warn('negative eigen value[s] encountered in material '
+                                    'Jacobian: {0} ({1:.2f})'.format(negevals, t))
+            dsave = d[v].copy()
+            if modified:
+                if fresh:
+                    newton_cache.factor(Jsub, v)
+                d[v] -= newton_cache.solve(sigerr) / dt
 
-        if environ.sqa:
-            try:
-                evals = np.linalg.eigvalsh(Jsub)
-            except LinAlgError:
-                raise MatmodlabError('failed to determine elastic '
-                                     'stiffness eigenvalues')
             else:
-                if np.any(evals < 0.):
-                    negevals = evals[np.where(evals < 0.)]
-                    logger.warn('negative eigen value[s] encountered in material '
-                                'Jacobian: {0} ({1:.2f})'.format(negevals, t))
-        try:
-            d[v] -= np.linalg.solve(Jsub, sigerr) / dt
+                try:
+                    d[v] -= np.linalg.solve(Jsub, sigerr) / dt
+
+                except LinAlgError:
+                    d[v] -= np.linalg.lstsq(Jsub, sigerr)[0] / dt
+                    if environ.Wall:
+                        logger.warn('using least squares approximation to '
+                                    'matrix inverse')
+
+            if (depsmag(d) > depsmax or  np.any(np.isnan(d)) or np.any(np.isinf(d))):
+                # increment too large
+                if modified:
+                    newton_cache.clear()
+                return None
+
+            # with the updated rate of deformation, update stress and check
+            fp, ep = mml.update_deformation(dt, 0., f, d)
+            sig, statev, J = evaluate(material, t, dt, temp, dtemp, kappa, f0,
+                fp, ep, d, efield, sigsave.copy(), statev_save.copy(), v,
+                jacobian, not modified, jacobian_at=(f, stran))
+            sigerr, errsave = sig[v] - sigspec, sigerr
+            dnom = max(np.amax(np.abs(sigspec)), 1.)
+            relerr, relsave = np.amax(np.abs(sigerr) / dnom), relerr
+
+            if i <= maxit1 and relerr < tol1:
+                return d
+
+            elif i > maxit1 and relerr < tol2:
+                return d
+
+            if not modified:
+                Jsub = J
+                J = jacobian.update((d[v] - dsave) * dt, sigerr - errsave)
+                if J is not None:
+                    Jsub = J
+            elif relerr > newton_cache.rate * relsave:
+                # convergence has degraded, refresh the Jacobian
+                Jsub = material.compute_updated_state(t, dt, temp, dtemp,
+                    kappa, f0, fp, ep, d, efield, sigsave.copy(),
+                    statev_save.copy(), v=v, disp=2, jacobian=jacobian,
+                    jacobian_at=(f, stran))
+                fresh = True
+            else:
+                fresh = False
 
+            continue
+    finally:
+        jacobian.finish()
 
-        except LinAlgError:
-            d[v] -= np.linalg.lstsq(Jsub, sigerr)[0] / dt
-            if environ.Wall:
-                logger.warn('using least squares approximation to '
-                            'matrix inverse')
+    if modified:
+        newton_cache.clear()
 
-        if (depsmag(d) > depsmax or  np.any(np.isnan(d)) or np.any(np.isinf(d))):
-            # increment too large
-            return None
+    # didn't converge, restore restore data and exit
+    return None
 
-        # with the updated rate of deformation, update stress and check
-        fp, ep = mml.update_deformation(dt, 0., f, d)
-        sig, statev, stif = material.compute_updated_state(t, dt, temp, dtemp,
-            kappa, f0, fp, ep, d, efield, sig, statev)
-        sigerr = sig[v] - sigspec
-        dnom = max(np.amax(np.abs(sigspec)), 1.)
-        relerr = np.amax(np.abs(sigerr) / dnom)
+def evaluate(material, t, dt, temp, dtemp, kappa, f0, f, stran, d, efield,
+             sig, statev, v, jacobian, stiff=True, jacobian_at=None):
+    '''Evaluate the material stress and state, and, if stiff, the Jacobian
+    submatrix J[v, v], with one call to the material. A numerical Jacobian
+    is taken about jacobian_at, the (f, stran) at the start of the increment,
+    if given'''
+    if not stiff:
+        sig, statev = material.compute_updated_state(t, dt, temp, dtemp, kappa,
+            f0, f, stran, d, efield, sig, statev, disp=1, jacobian=jacobian)
+        return sig, statev, None
+    return material.compute_updated_state(t, dt, temp, dtemp, kappa, f0, f,
+        stran, d, efield, sig, statev, v=v, jacobian=jacobian,
+        jacobian_at=jacobian_at)
+
+class ModifiedNewton(object):
+    '''The factorized Jacobian submatrix kept across the iterations of
+    modified Newton. The Jacobian is refreshed when the error of an iteration
+    is not reduced by at least the factor rate.
 
-        if i <= maxit1 and relerr < tol1:
-            return d
+    '''
+    rate = .5
+    def __init__(self):
+        self.v = None
+        self.lu = None
+        self.num_factorizations = 0
 
-        elif i > maxit1 and relerr < tol2:
-            return d
+    def valid(self, v):
+        return self.lu is not None and np.array_equal(self.v, v)
 
-        continue
+    def factor(self, Jsub, v):
+        from scipy.linalg import lu_factor
+        self.lu = lu_factor(Jsub)
+        self.v = np.array(v)
+        self.num_factorizations += 1
 
-    # didn't converge, restore restore data and exit
-    return None
+    def solve(self, b):
+        from scipy.linalg import lu_solve
+        return lu_solve(self.lu, b)
+
+    def clear(self):
+        self.lu = None
 
 
 def simplex(material, t, dt, temp, dtemp, kappa, f0, farg, stran, darg, sigarg,
-            statev_arg, efield, v, sigspec, proportional):
+            statev_arg, efield, v, sigspec, proportional, jacobian=None):
     '''Perform a downhill simplex search to find sym_velgrad[v] such that
 
                         sig(sym_velgrad[v]) = sigspec[v]
@@ -893,13 +1436,13 @@ def simplex(material, t, dt, temp, dtemp, kappa, f0, farg, stran, darg, sigarg,
     sig = sigarg.copy()
     statev = statev_arg.copy()
     args = (material, t, dt, temp, dtemp, kappa, f0, f, stran, d,
-            sig, statev, efield, v, sigspec, proportional)
+            sig, statev, efield, v, sigspec, proportional, jacobian)
     d[v] = scipy.optimize.fmin(_func, d[v], args=args, maxiter=20, disp=False)
     return d
 
 
 def _func(x, material, t, dt, temp, dtemp, kappa, f0, farg, stran, darg,
-          sigarg, statev_arg, efield, v, sigspec, proportional):
+          sigarg, statev_arg, efield, v, sigspec, proportional, jacobian=None):
     '''Objective function to be optimized by simplex
 
     '''
@@ -914,7 +1457,7 @@ def _func(x, material, t, dt, temp, dtemp, kappa, f0, farg, stran, darg,
 
     # store the best guesses
     sig, statev, stif = material.compute_updated_state(t, dt, temp, dtemp,
-        kappa, f0, fp, ep, d, efield, sig, statev)
+        kappa, f0, fp, ep, d, efield, sig, statev, jacobian=jacobian)
 
     # check the error
     error = 0.
@@ -960,31 +1503,6 @@ class Step(object):
         self.frames.append(Frame(len(self.frames)+1, time, increment))
         return self.frames[-1]
 
-    def cutback(self, cutfac=None, pnewdt=None):
-        if cutfac is None and pnewdt is None:
-            raise MatmodlabError('cutback requires cutfac or pnewdt')
-
-        nframe = len(self.frames)
-        start = self.frames[0].time
-        end = self.frames[-1].value
-        dtime = end - start
-        self.num_cutbacks += 1
-
-        if pnewdt is not None:
-            nframe = int(1. / pnewdt)
-
-        elif cutfac == -1:
-            nframe *= self.num_cutbacks * 4
-
-        else:
-            nframe *= cutfac
-
-        # 5000 frames is probably excessive
-        nframe = min(nframe, 5000)
-
-        inc = (end - start) / float(nframe)
-        self.frames = [Frame(i+1, start+i*inc, inc) for i in range(nframe)]
-
 class Frame:
     def __init__(self, number, time, increment):
         self.number = number
@@ -996,7 +1514,8 @@ class AnalysisStep(Step):
 
     def __init__(self, kind, name, previous, increment, frames, components,
                  descriptors, kappa, temperature, elec_field, num_dumps,
-                 sqa_stiff, mat_stiff, start=None):
+                 sqa_stiff, mat_stiff, start=None, jacobian=None,
+                 adaptive=None):
 
         super(AnalysisStep, self).__init__(name)
         logger = logging.getLogger('matmodlab.mmd.simulator')
@@ -1005,7 +1524,8 @@ class AnalysisStep(Step):
                              components=components, descriptors=descriptors,
                              kappa=kappa, temperature=temperature,
                              elec_field=elec_field, num_dumps=num_dumps,
-                             sqa_stiff=sqa_stiff, mat_stiff=mat_stiff)
+                             sqa_stiff=sqa_stiff, mat_stiff=mat_stiff,
+                             jacobian=jacobian, adaptive=adaptive)
         self.kind = kind
         self.previous = previous
         self.components = components
@@ -1023,9 +1543,19 @@ class AnalysisStep(Step):
         set_default('temperature', temperature, DEFAULT_TEMP, float)
         set_default('elec_field', elec_field, [0.,0.,0.], np.array)
         set_default('num_dumps', num_dumps, 100000000, int)
+        if self.num_dumps < 1:
+            raise MatmodlabError('num_dumps must be a positive integer')
         set_default('sqa_stiff', sqa_stiff, False, bool)
         set_default('mat_stiff', mat_stiff, 1, float)
 
+        # Jacobian strategy for this step, the material's if None
+        self.jacobian = None
+        if jacobian is not None:
+            self.jacobian = JacobianStrategy(jacobian)
+
+        # frame controller, frames are of equal size if None
+        self.adaptive = frame_controller(adaptive)
+
         if increment is None:
             increment = 1.
         self.increment = increment
@@ -1048,6 +1578,16 @@ class AnalysisStep(Step):
             self.Frame(start, frame_increment)
             start += frame_increment
 
+    def writes_frame(self, a0, a2):
+        '''Is the frame spanning the fractions a0 to a2 of the step written to
+        the output? Of the frames of a step, those ending at or after each of
+        num_dumps equally spaced fractions of the step are written, the last
+        frame always is.'''
+        if a2 >= 1.:
+            return True
+        n = self.num_dumps
+        return int(a2 * n + 1.e-6) > int(a0 * n + 1.e-6)
+
     @property
     def kappa(self):
         try:
@@ -1074,10 +1614,13 @@ class AnalysisStep(Step):
     def proportional(self, value):
         self._proportional = bool(value)
 
+# the 'previous' step of the initial step, at module level to be picklable
+_Origin = namedtuple('_Origin', 'value')
+
 def InitialStep(name, kappa=0., temperature=None):
     increment, frames, scale = 0., 1, 1.
     elec_field = np.zeros(3)
-    previous = namedtuple('previous', 'value')(value=0.)
+    previous = _Origin(value=0.)
     num_dumps = None
 
     components = np.zeros(TENSOR_3D, dtype=np.float64)
@@ -1091,7 +1634,8 @@ def InitialStep(name, kappa=0., temperature=None):
 
 def StrainStep(name, previous, components=None, frames=None, scale=1.,
                  increment=1., kappa=None, temperature=None, elec_field=None,
-                 num_dumps=None, sqa_stiff=False, mat_stiff=1):
+                 num_dumps=None, sqa_stiff=False, mat_stiff=1,
+                 jacobian=None, adaptive=None):
 
     if components is None:
         components = np.zeros(TENSOR_3D)
@@ -1129,11 +1673,13 @@ def StrainStep(name, previous, components=None, frames=None, scale=1.,
 
     return AnalysisStep('StrainStep', name, previous, increment, frames,
                         components, descriptors, kappa, temperature, elec_field,
-                        num_dumps, sqa_stiff, mat_stiff)
+                        num_dumps, sqa_stiff, mat_stiff, jacobian=jacobian,
+                        adaptive=adaptive)
 
 def StrainRateStep(name, previous, components=None, frames=None, scale=1.,
                    increment=1., kappa=None, temperature=None, elec_field=None,
-                   num_dumps=None, sqa_stiff=False, mat_stiff=1):
+                   num_dumps=None, sqa_stiff=False, mat_stiff=1,
+                   jacobian=None, adaptive=None):
 
     if components is None:
         components = np.zeros(TENSOR_3D)
@@ -1165,11 +1711,13 @@ def StrainRateStep(name, previous, components=None, frames=None, scale=1.,
 
     return AnalysisStep('StrainRateStep', name, previous, increment, frames,
                         components, descriptors, kappa, temperature, elec_field,
-                        num_dumps, sqa_stiff, mat_stiff)
+                        num_dumps, sqa_stiff, mat_stiff, jacobian=jacobian,
+                        adaptive=adaptive)
 
 def StressStep(name, previous, components=None, frames=None, scale=1.,
                increment=1., temperature=None, elec_field=None,
-               num_dumps=None, sqa_stiff=False, mat_stiff=1):
+               num_dumps=None, sqa_stiff=False, mat_stiff=1,
+               jacobian=None, adaptive=None):
 
     kappa = 0.
 
@@ -1191,11 +1739,13 @@ def StressStep(name, previous, components=None, frames=None, scale=1.,
 
     return AnalysisStep('StressStep', name, previous, increment, frames,
                         components, descriptors, kappa, temperature, elec_field,
-                        num_dumps, sqa_stiff, mat_stiff)
+                        num_dumps, sqa_stiff, mat_stiff, jacobian=jacobian,
+                        adaptive=adaptive)
 
 def StressRateStep(name, previous, components=None, frames=None, scale=1.,
                    increment=1., temperature=None, elec_field=None,
-                   num_dumps=None, sqa_stiff=False, mat_stiff=1):
+                   num_dumps=None, sqa_stiff=False, mat_stiff=1,
+                   jacobian=None, adaptive=None):
 
     kappa = 0.
     if components is None:
@@ -1217,11 +1767,13 @@ def StressRateStep(name, previous, components=None, frames=None, scale=1.,
 
     return AnalysisStep('StressRateStep', name, previous, increment, frames,
                         components, descriptors, kappa, temperature, elec_field,
-                        num_dumps, sqa_stiff, mat_stiff)
+                        num_dumps, sqa_stiff, mat_stiff, jacobian=jacobian,
+                        adaptive=adaptive)
 
 def DisplacementStep(name, previous, components=None, frames=None, scale=1.,
                      increment=1., kappa=None, temperature=None, elec_field=None,
-                     num_dumps=None, sqa_stiff=False, mat_stiff=1):
+                     num_dumps=None, sqa_stiff=False, mat_stiff=1,
+                     jacobian=None, adaptive=None):
 
     if components is None:
         components = np.zeros(3)
@@ -1242,11 +1794,13 @@ def DisplacementStep(name, previous, components=None, frames=None, scale=1.,
 
     return AnalysisStep('DisplacementStep', name, previous, increment, frames,
                         components, descriptors, kappa, temperature, elec_field,
-                        num_dumps, sqa_stiff, mat_stiff)
+                        num_dumps, sqa_stiff, mat_stiff, jacobian=jacobian,
+                        adaptive=adaptive)
 
 def DefGradStep(name, previous, components=None, frames=None, scale=1.,
                 increment=1., kappa=None, temperature=None, elec_field=None,
-                num_dumps=None, sqa_stiff=False, mat_stiff=1):
+                num_dumps=None, sqa_stiff=False, mat_stiff=1,
+                jacobian=None, adaptive=None):
 
     if kappa is None:
         kappa = previous.kappa
@@ -1280,11 +1834,13 @@ def DefGradStep(name, previous, components=None, frames=None, scale=1.,
 
     return AnalysisStep('DefGradStep', name, previous, increment, frames,
                         components, descriptors, kappa, temperature, elec_field,
-                        num_dumps, sqa_stiff, mat_stiff)
+                        num_dumps, sqa_stiff, mat_stiff, jacobian=jacobian,
+                        adaptive=adaptive)
 
 def MixedStep(name, previous, components=None, descriptors=None,
               frames=None, scale=1., increment=1., temperature=None,
-              elec_field=None, num_dumps=None, sqa_stiff=False, mat_stiff=1):
+              elec_field=None, num_dumps=None, sqa_stiff=False, mat_stiff=1,
+              jacobian=None, adaptive=None):
 
     if components is None:
         components = np.zeros(TENSOR_3D)
@@ -1338,7 +1894,8 @@ def MixedStep(name, previous, components=None, descriptors=None,
 
     return AnalysisStep('MixedStep', name, previous, increment, frames,
                         components, descriptors, kappa, temperature, elec_field,
-                        num_dumps, sqa_stiff, mat_stiff)
+                        num_dumps, sqa_stiff, mat_stiff, jacobian=jacobian,
+                        adaptive=adaptive)
 
 def DataSteps(filename, previous, tc=0, descriptors=None, time_format='total',
               scale=1., frames=None, steps=None, time_scale=1., **kw):
@@ -1515,28 +2072,12 @@ def piecewise_linear(xp, fp):
         return np.interp(x, xp, fp)
     return interp
 
-def flatten(a):
-    flat = []
-    for x in a:
-        try: flat.extend(x)
-        except TypeError: flat.append(x)
-    return flat
-
 def unique_step_index(a):
     d = {}
     for (i, x) in enumerate(a):
         d.setdefault(int(x), []).append(i)
     return [x[-1] for x in sorted(d.values())]
 
-def rec2arr(recarr, rows=None):
-    arr = []
-    for row in recarr:
-        arr.append(flatten(row.tolist()))
-    arr = np.array(arr)
-    if rows is not None:
-        arr = arr[rows]
-    return arr
-
 class attrarr(np.ndarray):
     """Subclass an ndarray to return attributes stored as the array columns"""
     def __new__(cls, arr, names):
@@ -1572,11 +2113,41 @@ class Record:
             self.keys = ['%s.%s' % (self.name, x) for x in components]
 
 class Records(OrderedDict):
+    '''Output records for the simulation
+
+    Rows are written in place to a preallocated structured buffer. The buffer
+    holds the committed rows (those of completed steps) followed by the cached
+    rows of the step currently being run. Committing the cache (advance) and
+    discarding it (clear_cache) only move the row counters, no data is copied.
+
+    If the records are streamed to a file, committed rows are appended to the
+    file and dropped from the buffer each time the cache is committed, and,
+    if flush_frames is given, whenever flush_frames rows are held in memory
+    (cached rows written this way can no longer be discarded). The buffer
+    then never grows past the larger of flush_frames and the frames of one
+    step and data is a memory mapped view of the file.
+
+    '''
     _i = 0
+    chunk = 512
+    stream = None
+    flush_frames = None
     @property
     def num_rec(self):
         return len(super(Records, self).keys())
 
+    @property
+    def data(self):
+        '''Structured view of the committed rows'''
+        if self.stream is not None:
+            self.flush()
+            return self.stream.load()
+        return self._buf[:self._n]
+
+    @property
+    def num_cached(self):
+        return self._m - self._n
+
     def add(self, name, rtype, **kw):
         if rtype == SDV:
             keys = kw['keys']
@@ -1601,34 +2172,100 @@ class Records(OrderedDict):
         except TypeError:
             return a
 
+    @property
+    def dtype(self):
+        return np.dtype([(r.name, r.dtype, r.shape) for r in self.values()])
+
     def init(self, **kw):
-        dtype = [(r.name, r.dtype, r.shape) for r in self.values()]
-        self.data = np.empty((1,), dtype=dtype)
-        sdv = kw.pop('SDV', None)
-        row = [self.totuple(kw[key]) for key in self.keys(expand=-1)]
-        if sdv is not None:
-            row.extend(sdv)
-        self.data[0] = tuple(row)
-        self._cache = None
+        self.allocate()
+        self.cache(**kw)
+        self.advance()
+
+    def allocate(self, rows=None):
+        '''Allocate the buffer, committing rows to it if given'''
+        self._keys = self.keys(expand=-1)
+        n = 0 if rows is None else len(rows)
+        self._buf = np.empty((max(n, self.chunk),), dtype=self.dtype)
+        if n:
+            self._buf[:n] = rows
+        # _n: number of committed rows, _m: committed + cached rows
+        self._n = self._m = n
+
+    def open_stream(self, filename, flush_frames=None, num_rows=None):
+        '''Stream the committed rows to filename. If num_rows is given, the
+        stream in filename is continued after its first num_rows rows'''
+        self.close_stream()
+        self.stream = RecordStream(filename, self._buf.dtype,
+                                   num_rows=num_rows)
+        self.flush_frames = flush_frames
+        self.flush()
+
+    def close_stream(self):
+        if self.stream is not None:
+            self.flush()
+            self.stream.close()
+
+    @property
+    def num_rows(self):
+        '''The number of committed rows, including those streamed'''
+        if self.stream is not None:
+            return self.stream.num_rows + self._n
+        return self._n
+
+    def extend(self, rows):
+        '''Commit rows, following those already committed'''
+        self.clear_cache()
+        size = self.flush_frames or len(rows) or 1
+        for i in range(0, len(rows), size):
+            block = rows[i:i+size]
+            n = len(block)
+            self.reserve(n)
+            self._buf[self._m:self._m+n] = block
+            self._m += n
+            self.advance()
+
+    def flush(self):
+        '''Write the committed rows to the stream and drop them from the
+        buffer'''
+        if self.stream is None or not self._n:
+            return
+        self.stream.write(self._buf[:self._n])
+        n = self._m - self._n
+        self._buf[:n] = self._buf[self._n:self._m]
+        self._n, self._m = 0, n
+
+    def reserve(self, n):
+        '''Make sure that there is room for n more rows to be cached'''
+        if self.flush_frames:
+            n = min(n, self.flush_frames)
+        size = self._m + n
+        if size <= self._buf.shape[0]:
+            return
+        size = max(size, 2 * self._buf.shape[0])
+        if self.flush_frames:
+            size = min(size, max(self._m + n, self.flush_frames))
+        buf = np.empty((size,), dtype=self._buf.dtype)
+        buf[:self._m] = self._buf[:self._m]
+        self._buf = buf
 
     def cache(self, **kw):
-        data = np.empty((1,), dtype=self.data.dtype)
+        if self.flush_frames and self._m >= self.flush_frames:
+            self.advance()
+        if self._m == self._buf.shape[0]:
+            self.reserve(self.chunk)
         sdv = kw.pop('SDV', None)
-        row = [self.totuple(kw[key]) for key in self.keys(expand=-1)]
+        row = [self.totuple(kw[key]) for key in self._keys]
         if sdv is not None:
             row.extend(sdv)
-        data[0] = tuple(row)
-        if self._cache is None:
-            self._cache = data
-        else:
-            self._cache = np.append(self._cache, data)
+        self._buf[self._m] = tuple(row)
+        self._m += 1
 
     def advance(self):
-        self.data = np.append(self.data, self._cache, axis=0)
-        self.clear_cache()
+        self._n = self._m
+        self.flush()
 
     def clear_cache(self):
-        self._cache = None
+        self._m = self._n
 
 class StateDB:
     def __init__(self, **kwds):
@@ -1655,8 +2292,14 @@ class CutbackManager:
         return self.db.get(key)
 
     def request_cutback(self, **kwargs):
-        #self.db.update(kwargs)
-        pass
+        self.db.update(kwargs)
+
+    def substeps(self):
+        '''The number of substeps in which to retake the current frame'''
+        pnewdt = self.db.get('pnewdt')
+        if pnewdt is not None and 0. < pnewdt < 1.:
+            return max(2, int(np.ceil(1. / pnewdt)))
+        return 2
 
     def clear(self):
         self.db = {}
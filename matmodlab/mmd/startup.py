@@ -1,6 +1,7 @@
 # set up python environment
 import os
 import re
+import imp
 import sys
 import glob
 import shutil
@@ -28,8 +29,8 @@ errors = []
 try: import numpy
 except ImportError: errors.append('numpy not found')
 
-# --- scipy
-try: import scipy
+# --- scipy, imported by the few functions that use it
+try: imp.find_module('scipy')
 except ImportError: errors.append('scipy not found')
 
 # check prerequisites
@@ -23,6 +23,8 @@ class Environment(object):
 
     # --- Performance
     nprocs = 1
+    # processes building extension modules, 0 for one per cpu
+    build_nprocs = 0
 
     # --- IPython notebook
     notebook = 0
@@ -54,6 +56,16 @@ class Environment(object):
 
     simulation_dir = None
 
+    # output directory of the current permutation evaluation, simulators
+    # created without a directory write their output to it
+    evaluation_dir = None
+
+    # directory of the result cache used by simulators created without one
+    result_cache = None
+
+    # --- Per step statistics of the simulator
+    stats = False
+
     plotter = MATPLOTLIB
     output_format = REC
 
@@ -91,6 +91,31 @@ class TestAbaqusModels(StandardMatmodlabTest):
         assert allclose(J, j)
         self.completed_jobs.append(mps.job)
 
+    @pytest.mark.umat
+    def test_workspace(self):
+        '''The umat is called with the work arrays of the material, reused,
+        and returns the results of allocating its arguments on every call'''
+        from matmodlab.mmd.material import Material
+        from matmodlab.benchmarks.bench_abaqus import (update_state_alloc,
+                                                       run_increments)
+        param_names = ('E', 'Nu')
+        parameters = dict(zip(param_names, (self.E, self.Nu)))
+        material = Material(UMAT, parameters, libname='umat_t',
+                            source_files=[join(MAT_D, 'src/umat_neohooke.f90')],
+                            param_names=param_names)
+        ws = material.workspace
+        arrays = [ws.stress, ws.ddsdde, ws.dfgrd0, ws.dfgrd1]
+        update_state = type(material).update_state.im_func
+        a = run_increments(update_state_alloc, material, 10)
+        b = run_increments(update_state, material, 10)
+        for (x, y) in zip(a, b):
+            assert allclose(x, y)
+        assert not np.shares_memory(b[0], ws.stress)
+        assert not np.shares_memory(b[2], ws.ddsdde)
+        assert all(x is y for (x, y) in zip(arrays, [ws.stress, ws.ddsdde,
+                                                     ws.dfgrd0, ws.dfgrd1]))
+        assert ws.dfgrd1.flags.f_contiguous and ws.ddsdde.flags.f_contiguous
+
     #@pytest.mark.uanisohyper_inv
     #@pytest.mark.skipif(True, reason='baseline not established')
     def xtest_uanisohyper_inv(self):
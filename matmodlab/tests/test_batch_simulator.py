@@ -0,0 +1,176 @@
+from testconf import *
+from matmodlab.mmd.material import Material
+from matmodlab.mmd.batch import BatchMaterialPointSimulator
+
+K, G = 9.980040E+09, 3.750938E+09
+EF = np.zeros(3)
+PARAMETERS = [[K, G, 1.E+07, 0., 0.],
+              [K, G, 2.E+07, 1.E+08, 0.],
+              [K, G, 1.E+07, 1.E+08, .5],
+              [K/2., G/2., 1.E+07, 1.E+08, 1.]]
+
+def scalar_run(job, parameters, steps):
+    mps = MaterialPointSimulator(job, verbosity=0, d=this_directory)
+    mps.Material('vonmises', parameters)
+    for (step_class, kwds) in steps:
+        getattr(mps, step_class)(**kwds)
+    return mps
+
+@pytest.mark.fast
+@pytest.mark.batch
+class TestBatchSimulator(object):
+
+    def test_strain_control(self):
+        '''Batch results agree with those of the scalar driver'''
+        steps = [('StrainStep', dict(components=(.01, 0., 0.), frames=25)),
+                 ('StrainStep', dict(components=(.02, .005, 0.), frames=25)),
+                 ('StrainStep', dict(components=(0., 0., 0.), frames=25))]
+        batch = BatchMaterialPointSimulator('batch', verbosity=0)
+        batch.Material('vonmises', PARAMETERS)
+        for (step_class, kwds) in steps:
+            getattr(batch, step_class)(**kwds)
+        for (n, parameters) in enumerate(PARAMETERS):
+            mps = scalar_run('batch', parameters, steps)
+            for var in ('Time', 'S.XX', 'S.YY', 'E.XY', 'SDV_EQPS'):
+                a = batch.get(var, point=n)
+                b = mps.get(var)
+                assert np.allclose(a, b, rtol=1e-6, atol=1e-6*np.amax(abs(b)))
+
+    def test_stress_control_per_point(self):
+        '''Each point may be driven by its own components'''
+        components = [(1.E+06, 0., 0.), (2.E+06, 0., 0.),
+                      (3.E+06, 0., 0.), (4.E+06, 0., 0.)]
+        batch = BatchMaterialPointSimulator('batch', verbosity=0)
+        batch.Material('vonmises', PARAMETERS)
+        batch.StressStep(components=components, frames=10)
+        assert batch.get('S.XX').shape == (11, 4)
+        for (n, parameters) in enumerate(PARAMETERS):
+            steps = [('StressStep', dict(components=components[n], frames=10))]
+            mps = scalar_run('batch', parameters, steps)
+            assert np.allclose(batch.get('E.XX', point=n), mps.get('E.XX'))
+
+    def test_step_jacobian(self):
+        '''The Jacobian strategy of a stress controlled step is used'''
+        batch = BatchMaterialPointSimulator('batch', verbosity=0)
+        batch.Material('vonmises', PARAMETERS, num_stiff=True)
+        batch.StressStep(components=(2.E+07, 0., 0.), frames=10,
+                         jacobian='forward')
+        step = batch.steps.values()[-1][0]
+        assert step.jacobian.name == 'forward'
+        assert step.jacobian.num_evals > 0
+        for (n, parameters) in enumerate(PARAMETERS):
+            mps = MaterialPointSimulator('batch', verbosity=0,
+                                         d=this_directory)
+            mps.Material('vonmises', parameters, num_stiff=True)
+            mps.StressStep(components=(2.E+07, 0., 0.), frames=10,
+                           jacobian='forward')
+            assert np.allclose(batch.get('E.XX', point=n), mps.get('E.XX'),
+                               rtol=1.E-6)
+
+    def test_cutback(self):
+        '''A cutback requested by the material retakes the frame in substeps,
+        as in the scalar driver'''
+        from matmodlab.mmd.simulator import CB
+        def request_cutbacks(material, calls):
+            update_state = material.update_state
+            def wrapper(time, dtime, *args, **kwargs):
+                calls.append((time, dtime))
+                if time < .6 < time + dtime and dtime > .06:
+                    CB.request_cutback(pnewdt=.5)
+                return update_state(time, dtime, *args, **kwargs)
+            material.update_state = wrapper
+        batch = BatchMaterialPointSimulator('batch', verbosity=0)
+        batch.Material('vonmises', PARAMETERS)
+        # update each point in turn, through the wrapped update_state
+        batch.material.update_state_batch = None
+        batch_calls = [[] for m in batch.materials]
+        for (m, calls) in zip(batch.materials, batch_calls):
+            request_cutbacks(m, calls)
+        batch.StrainStep(components=(.02, 0., 0.), frames=4)
+        assert not CB
+        assert batch.steps.values()[-1][0].num_cutbacks == 3
+        for (n, parameters) in enumerate(PARAMETERS):
+            mps = MaterialPointSimulator('batch', verbosity=0,
+                                         d=this_directory)
+            mat = mps.Material('vonmises', parameters)
+            calls = []
+            request_cutbacks(mat, calls)
+            mps.StrainStep(components=(.02, 0., 0.), frames=4)
+            assert len(calls) == 10
+            assert batch_calls[n] == calls
+            for var in ('Time', 'S.XX', 'S.YY', 'SDV_EQPS'):
+                a = batch.get(var, point=n)
+                b = mps.get(var)
+                assert np.allclose(a, b, rtol=1e-6, atol=1e-6*np.amax(abs(b)))
+
+    def test_num_dumps(self):
+        '''Only num_dumps frames of a step are written, as by the scalar
+        driver'''
+        batch = BatchMaterialPointSimulator('batch', verbosity=0)
+        batch.Material('vonmises', PARAMETERS)
+        batch.StrainStep(components=(.02, 0., 0.), frames=20, num_dumps=4)
+        mps = scalar_run('batch', PARAMETERS[0],
+                         [('StrainStep', dict(components=(.02, 0., 0.),
+                                              frames=20, num_dumps=4))])
+        assert batch.get('Time').shape == (5,)
+        assert np.allclose(batch.get('Time'), mps.get('Time'))
+        assert np.allclose(batch.get('S.XX', point=0), mps.get('S.XX'))
+
+    def test_mismatched_steps(self):
+        '''Points must share the frame structure'''
+        batch = BatchMaterialPointSimulator('batch', verbosity=0)
+        batch.Material('vonmises', PARAMETERS[:2])
+        with pytest.raises(SystemExit):
+            batch.StrainStep(components=[(.01, 0, 0)] * 3)
+
+@pytest.mark.fast
+@pytest.mark.batch
+class TestUpdateStateBatch(object):
+
+    def check_batch(self, model, parameters, d):
+        '''update_state_batch agrees with update_state of each point'''
+        materials = [Material(model, p) for p in parameters]
+        params = np.array([np.asarray(m.params) for m in materials])
+        N = len(parameters)
+        stress, statev = np.zeros((N, 6)), np.array([m.initial_sdv
+                                                     for m in materials])
+        F = np.tile(I9, (N, 1))
+        for i in range(5):
+            sig, sdv, c = materials[0].update_state_batch(0., 1., 0., 0., 1.,
+                1., F, F, stress, d, EF, stress.copy(), statev.copy(),
+                params=params)
+            for (n, m) in enumerate(materials):
+                s1, x1, c1 = m.update_state(0., 1., 0., 0., 1., 1., I9, I9,
+                    stress[n], d[n], EF, stress[n].copy(), statev[n].copy())
+                assert np.allclose(sig[n], s1)
+                assert np.allclose(sdv[n], x1)
+                if c is not None:
+                    assert np.allclose(c[n], c1)
+            stress, statev = sig, sdv
+
+    def test_vonmises(self):
+        d = np.array([[1., 0., 0., 0., 0., 0.], [0., 0., 0., 1., 0., 0.],
+                      [1., -.5, -.5, 0., 0., 0.], [0., 0., 0., 0., 0., 0.]])
+        self.check_batch('vonmises', PARAMETERS, 1.E-3 * d)
+
+    def test_pyplastic(self):
+        parameters = [[K, G, 1.E+07, 0.], [K, G, 1.E+07, .1],
+                      [K, G, 2.E+07, .3], [K, G, 1.E+99, 0.]]
+        d = np.array([[1., 0., 0., 0., 0., 0.], [0., 0., 0., 1., 0., 0.],
+                      [1., .5, .5, 0., 0., 0.], [1., -.5, -.5, 0., 0., 0.]])
+        self.check_batch('pyplastic', parameters, 1.E-3 * d)
+
+    def test_pyelastic(self):
+        parameters = [[K, G], [K/2., G/2.], [K, G/3.]]
+        d = np.random.uniform(-1.E-3, 1.E-3, (3, 6))
+        self.check_batch('pyelastic', parameters, d)
+
+    def test_transisoelas(self):
+        lam, mu = K - 2. * G / 3., G
+        parameters = [[0., 0., 2.*mu, .2*mu, lam, .1*mu, .1*mu, .1*mu,
+                       1., 0., 0., 0., 0.],
+                      [0., 0., 2.*mu, .2*mu, lam, .1*mu, .1*mu, .1*mu,
+                       1., 1., 0., 0., 0.],
+                      [0., 0., 2.*mu, 0., lam, 0., 0., 0., 0., 0., 1., 0., 0.]]
+        d = np.random.uniform(-1.E-3, 1.E-3, (3, 6))
+        self.check_batch('transisoelas', parameters, d)
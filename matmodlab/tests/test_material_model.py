@@ -0,0 +1,266 @@
+from testconf import *
+from matmodlab.mmd.material import Material, sdvmap
+from matmodlab.mmd.loader import MaterialLoader, MaterialRegistry
+
+@pytest.mark.fast
+@pytest.mark.material
+class TestSDVMap(object):
+
+    def test_keys_and_groups(self):
+        '''Keys map to slots and key prefixes to the slots they span'''
+        ix = sdvmap(['EQPS', 'BS_XX', 'BS_YY', 'BS_ZZ', 'EE.XX', 'Y', 'EE.YY'])
+        assert ix.EQPS == 0 and ix['eqps'] == 0 and ix.y == 5
+        assert ix.BS == slice(1, 4)
+        assert np.array_equal(ix['EE'], [4, 6])
+        assert ix['EE.YY'] == 6
+        assert 'BS_XX' in ix and 'BS_XY' not in ix
+        with pytest.raises(AttributeError):
+            ix.EQPS = 1
+        with pytest.raises(AttributeError):
+            ix.BS_XY
+
+    def test_augmented(self):
+        '''The map is rebuilt when state variables are augmented'''
+        mat = Material('vonmises', [1.E+10, 3.75E+09, 1.E+07, 0., 0.])
+        assert mat.sdv_map.SIGE == 8
+        assert mat.sdv_map.BS == slice(2, 8)
+        mat.Expansion(ISOTROPIC, [1.E-5])
+        assert mat.sdv_map.SIGE == 8
+        n = len(mat.sdv_keys)
+        assert mat.sdv_map[mat.sdv_keys[-1]] == n - 1
+
+@pytest.mark.fast
+@pytest.mark.material
+class TestJacobianStrategies(object):
+    parameters = [1.E+10, 3.75E+09, 1.E+07, 1.E+08, .5]
+
+    def jacobian(self, strategy, v):
+        '''Jacobian of a von Mises material at a plastic state'''
+        mat = Material('vonmises', self.parameters, jacobian=strategy,
+                       num_stiff=True)
+        d = np.array([.01, -.005, -.005, 0., 0., 0.])
+        stress, statev = np.zeros(6), np.array(mat.initial_sdv)
+        stress, statev = mat.compute_updated_state(0., 1., 0., 0., 0., I9, I9,
+            Z6, d, np.zeros(3), stress, statev, disp=1)
+        jac = mat.jacobian
+        n = jac.num_calls
+        J = mat.numerical_jacobian(0., .01, 0., 0., 0., I9, I9, Z6, d / 10.,
+                                   np.zeros(3), stress, statev, v)
+        return J, jac.num_calls - n
+
+    def test_strategies(self):
+        '''Strategies agree with centered differences'''
+        v = np.array([0, 1, 3])
+        J1, n = self.jacobian('centered', v)
+        assert n == 2 * len(v)
+        J2, n = self.jacobian('forward', v)
+        assert n == len(v) + 1
+        assert np.allclose(J1, J2, atol=1.E-5*np.amax(J1))
+        J3, n = self.jacobian('complex', v)
+        assert n == len(v)
+        assert np.allclose(J1, J3, atol=1.E-6*np.amax(J1))
+
+    def test_stress_control(self):
+        '''Stress controlled steps converge with each strategy'''
+        results = []
+        for strategy in ('centered', 'forward', 'complex', 'broyden'):
+            mps = MaterialPointSimulator('jacobian', verbosity=0,
+                                         d=this_directory)
+            mps.Material('vonmises', self.parameters, num_stiff=True)
+            mps.MixedStep(components=(2.E+07, 0., 0.), descriptors='SSS',
+                          frames=20, jacobian=strategy)
+            assert mps.steps.values()[-1].jacobian.name == strategy
+            assert mps.steps.values()[-1].jacobian.num_evals > 0
+            results.append(mps.get('E.XX'))
+        for result in results[1:]:
+            assert np.allclose(result, results[0], rtol=1.E-6)
+
+    def test_newton_jacobian_about_start(self):
+        '''newton takes numerical Jacobians about the deformation at the start
+        of the increment, not the deformation of its iterate'''
+        from matmodlab.mmd.simulator import newton, ModifiedNewton
+        for cache in (None, ModifiedNewton()):
+            mat = Material('vonmises', self.parameters, num_stiff=True)
+            about = []
+            numerical_jacobian = mat.numerical_jacobian
+            def wrapper(time, dtime, temp, dtemp, kappa, F0, F, stran, *args):
+                about.append((np.array(F), np.array(stran)))
+                return numerical_jacobian(time, dtime, temp, dtemp, kappa,
+                                          F0, F, stran, *args)
+            mat.numerical_jacobian = wrapper
+            f = np.array([1.001, 0., 0., 0., 1., 0., 0., 0., 1.])
+            stran = np.array([np.log(1.001), 0., 0., 0., 0., 0.])
+            d = np.array([.01, 0., 0., 0., 0., 0.])
+            v = np.array([1, 2])
+            d = newton(mat, 0., 1., 0., 0., 0., I9, f, stran, d, np.zeros(6),
+                       np.array(mat.initial_sdv), np.zeros(3), v,
+                       np.zeros(2), False, newton_cache=cache)
+            assert d is not None
+            assert len(about) > 0
+            for (F, e) in about:
+                assert np.allclose(F, f) and np.allclose(e, stran)
+
+    def test_unsupported(self):
+        '''Complex step requires a model that supports it'''
+        mat = Material('vonmises', self.parameters)
+        type(mat).complex_step = False
+        try:
+            with pytest.raises(SystemExit):
+                Material('vonmises', self.parameters, jacobian='complex')
+        finally:
+            type(mat).complex_step = True
+
+@pytest.mark.fast
+@pytest.mark.material
+class TestModifiedNewton(object):
+    parameters = [1.E+10, 3.75E+09, 1.E+07, 1.E+08, .5]
+
+    def run(self, modified_newton):
+        mps = MaterialPointSimulator('jacobian', verbosity=0, d=this_directory,
+                                     modified_newton=modified_newton)
+        mat = mps.Material('vonmises', self.parameters, num_stiff=True)
+        mps.MixedStep(components=(2.E+07, 0., 0.), descriptors='SSS',
+                      frames=20)
+        mps.MixedStep(components=(.02, 0., 0.), descriptors='ESS', frames=20)
+        return mps, mat.jacobian.num_calls
+
+    def test_modified_newton(self):
+        '''Modified Newton converges to the full Newton solution with fewer
+        Jacobian evaluations'''
+        mps1, n1 = self.run(False)
+        mps2, n2 = self.run(True)
+        assert n2 < n1
+        for var in ('E.XX', 'E.YY', 'S.XX'):
+            a, b = mps1.get(var), mps2.get(var)
+            assert np.allclose(a, b, rtol=1.E-6, atol=1.E-6*np.amax(abs(a)))
+
+    def test_factorization(self):
+        '''The factored Jacobian is reused until it is invalidated'''
+        from matmodlab.mmd.simulator import ModifiedNewton
+        cache = ModifiedNewton()
+        v = np.array([0, 1])
+        assert not cache.valid(v)
+        J = np.array([[2., 1.], [1., 3.]])
+        cache.factor(J, v)
+        assert cache.valid(v) and not cache.valid(np.array([0, 2]))
+        assert np.allclose(cache.solve(np.array([1., 2.])),
+                           np.linalg.solve(J, [1., 2.]))
+        assert cache.num_factorizations == 1
+        cache.clear()
+        assert not cache.valid(v)
+
+@pytest.mark.fast
+@pytest.mark.material
+class TestConsistentTangents(object):
+    K, G = 1.0667E+09, 1.E+08
+    parameters = {
+        'vonmises': [K, G, 1.E+06, 1.E+08, .5],
+        'pyplastic': [K, G, 7.0711E+05, .288675],
+        'transisoelas': [0., 0., 2.*G, .2*G, K-2.*G/3., .1*G, .1*G, .1*G,
+                         1., 1., 0., 0., 0.]}
+
+    def tangent(self, model, d, v=range(6)):
+        '''The stiffness returned by the model and the numerical Jacobian
+        from zero stress'''
+        mat = Material(model, self.parameters[model])
+        d = np.array(d)
+        stress, statev = np.zeros(6), np.array(mat.initial_sdv)
+        sig, sdv, ddsdde = mat.update_state(0., 1., 0., 0., 1., 1., I9, I9,
+            Z6, d, np.zeros(3), stress.copy(), statev.copy())
+        J = mat.numerical_jacobian(0., 1., 0., 0., 0., I9, I9, Z6, d,
+                                   np.zeros(3), stress, statev, v)
+        return ddsdde, J
+
+    @pytest.mark.parametrize('model', ['vonmises', 'pyplastic',
+                                       'transisoelas'])
+    def test_tangent(self, model):
+        '''The elastic and plastic tangents are the numerical Jacobians'''
+        for d in ([1.E-5, 0., 0., 0., 0., 0.],
+                  [.01, -.004, -.003, .002, .001, -.003]):
+            ddsdde, J = self.tangent(model, d)
+            assert np.allclose(ddsdde, J, atol=1.E-6*np.amax(abs(J)))
+
+    def test_vertex(self):
+        '''Trial stresses beyond the Drucker-Prager vertex return to it
+        with zero stiffness'''
+        ddsdde, J = self.tangent('pyplastic', [.01, .01, .01, .001, 0., 0.])
+        assert np.allclose(ddsdde, 0.) and np.allclose(J, 0.)
+
+    @pytest.mark.parametrize('model', ['vonmises', 'pyplastic',
+                                       'transisoelas'])
+    def test_sqa_stiff(self, model):
+        '''The stiffness passes the sqa_stiff check along stress controlled
+        paths and replaces the numerical Jacobian'''
+        mps = MaterialPointSimulator('tangent', verbosity=0, d=this_directory,
+                                     stats=True)
+        mat = mps.Material(model, self.parameters[model], sqa_stiff=True)
+        mps.MixedStep(components=(.01, 0., 0.), descriptors='ESS', frames=20)
+        mps.MixedStep(components=(.02, 1.E+05, 0.), descriptors='ESS',
+                      frames=20)
+        mps.MixedStep(components=(0., 0., 0.), descriptors='ESS', frames=20)
+        assert mat.iwarn_stiff == 0
+        total = mps.stats.total()
+        assert total.newton_iterations > 0
+        assert total.jacobian_analytic > 0
+        # numerical Jacobians are only those of the sqa check, one a frame
+        assert total.jacobian_numerical == total.frames
+
+@pytest.mark.fast
+@pytest.mark.material
+class TestMaterialRegistry(object):
+    source = """\
+class {0}(MaterialModel):
+    name = '{1}'
+"""
+
+    def test_registry(self, tmpdir):
+        '''Files are parsed again only if their contents change'''
+        registry = str(tmpdir.join('materials.json'))
+        f = tmpdir.join('mat_reg.py')
+        f.write(self.source.format('Reg', 'reg'))
+        r = MaterialRegistry(registry)
+        libs = r.readmodule('mat_reg', str(tmpdir), ['MaterialModel'])
+        assert (r.hits, r.misses) == (0, 1)
+        assert libs['Reg'].material_name is None
+        libs['Reg'].material_name = 'reg'
+        r.set_material_name(str(f), libs['Reg'])
+        r.save()
+
+        r = MaterialRegistry(registry)
+        libs = r.readmodule('mat_reg', str(tmpdir), ['MaterialModel'])
+        assert (r.hits, r.misses) == (1, 0)
+        assert libs['Reg'].material_name == 'reg'
+
+        # touched, but not edited
+        mtime = f.mtime()
+        f.setmtime(mtime + 10)
+        r = MaterialRegistry(registry)
+        r.readmodule('mat_reg', str(tmpdir), ['MaterialModel'])
+        assert (r.hits, r.misses) == (1, 0)
+        r.save()
+
+        # edited, with the same mtime
+        f.write(self.source.format('Other', 'other'))
+        f.setmtime(mtime + 10)
+        r = MaterialRegistry(registry)
+        libs = r.readmodule('mat_reg', str(tmpdir), ['MaterialModel'])
+        assert (r.hits, r.misses) == (0, 1)
+        assert list(libs.keys()) == ['Other']
+
+    def test_loader_memo(self, tmpdir, monkeypatch):
+        '''The loader is built again only if the environment changes'''
+        registry = MaterialRegistry(str(tmpdir.join('materials.json')))
+        monkeypatch.setattr(MaterialLoader, 'registry', registry)
+        monkeypatch.setattr(MaterialLoader, 'memo', None)
+        loader = MaterialLoader.load_materials()
+        assert MaterialLoader.load_materials() is loader
+        assert registry.misses > 0 and registry.hits == 0
+        assert loader.get('elastic').mat_class.name == 'elastic'
+
+        monkeypatch.setattr(environ, 'std_materials',
+                            environ.std_materials + [str(tmpdir)])
+        new = MaterialLoader.load_materials()
+        assert new is not loader
+        assert registry.hits > 0
+        MaterialLoader.clear()
+        assert MaterialLoader.load_materials() is not new
@@ -1,6 +1,8 @@
 from testconf import *
-from matmodlab.mmd.simulator import StrainStep
+from matmodlab.mmd.simulator import StrainStep, Records
 from matmodlab.utils.fileio import loadfile
+from matmodlab.mmd import instrumentation
+from matmodlab.utils.numerix import SAME, DIFF, NOT_SAME
 try: import matmodlab.lib.elastic as el
 except ImportError: el = None
 
@@ -62,6 +64,427 @@ class TestStepFactories(StandardMatmodlabTest):
         assert status == 0
         self.completed_jobs.append(mps.job)
 
+@pytest.mark.fast
+@pytest.mark.adaptive
+class TestAdaptiveFrames(object):
+    parameters = [1.E+10, 3.75E+09, 1.E+07, 1.E+08, .5]
+
+    def run(self, adaptive, frames=10):
+        mps = MaterialPointSimulator('adaptive', verbosity=0, d=this_directory)
+        mps.Material('vonmises', self.parameters)
+        mps.MixedStep(components=(2.E+07, 0., 0.), descriptors='SSS',
+                      frames=frames, adaptive=adaptive)
+        mps.MixedStep(components=(0., 0., 0.), descriptors='SSS',
+                      frames=frames, adaptive=adaptive)
+        return mps
+
+    def test_adaptive(self):
+        '''Smooth legs run in few frames, the yield transition is refined'''
+        ref = self.run(None, frames=200)
+        mps = self.run(True)
+        loading, unloading = mps.steps.values()[1:]
+        assert loading.adaptive.num_rejected > 0
+        assert len(unloading.frames) < 10
+        assert abs(loading.frames[-1].value - 1.) < 1.E-12
+        assert abs(unloading.frames[-1].value - 2.) < 1.E-12
+        time = mps.get('Time')
+        assert np.all(np.diff(time) > 0.)
+        for var in ('E.XX', 'S.XX', 'SDV_EQPS'):
+            a = np.interp(time, ref.get('Time'), ref.get(var))
+            b = mps.get(var)
+            assert np.allclose(a, b, rtol=1.E-5, atol=1.E-5*np.amax(abs(a)))
+
+    def test_output_times(self):
+        '''Frames end at the requested output times and the increment stays
+        within its bounds'''
+        adaptive = dict(output_times=[.25, .5, .75], max_increment=.2,
+                        min_increment=.01)
+        mps = self.run(adaptive)
+        time = mps.get('Time')
+        for t in (.25, .5, .75, 1., 1.25, 1.5, 1.75, 2.):
+            assert np.amin(abs(time - t)) < 1.E-12
+        increments = mps.get('DTime')[1:]
+        assert np.all(increments <= .2 + 1.E-12)
+        assert np.all(increments >= .01 - 1.E-12)
+
+    def test_bad_adaptive(self):
+        with pytest.raises(SystemExit):
+            self.run('yes')
+
+@pytest.mark.fast
+@pytest.mark.cutback
+class TestSubstepping(object):
+
+    def run(self, frames, no_cutback=False):
+        '''A strain step of a material that requests a cutback for any
+        increment longer than .06 that spans t=.6'''
+        from matmodlab.mmd.simulator import CB
+        mps = MaterialPointSimulator('substep', verbosity=0, d=this_directory,
+                                     no_cutback=no_cutback)
+        mat = mps.Material('vonmises', [1.E+10, 3.75E+09, 1.E+07, 1.E+08, .5])
+        calls = []
+        update_state = mat.update_state
+        def wrapper(time, dtime, *args, **kwargs):
+            calls.append((time, dtime))
+            if time < .6 < time + dtime and dtime > .06:
+                CB.request_cutback(pnewdt=.5)
+            return update_state(time, dtime, *args, **kwargs)
+        mat.update_state = wrapper
+        mps.StrainStep(components=(.02, 0., 0.), frames=frames)
+        return mps, calls
+
+    def test_substepping(self):
+        '''Only the frame requesting a cutback is retaken, in substeps'''
+        mps, calls = self.run(4)
+        step = mps.steps.values()[-1]
+        assert step.num_cutbacks == 3
+        assert len(calls) == 10
+        assert [t for (t, dt) in calls].count(0.) == 1
+        assert [t for (t, dt) in calls].count(.25) == 1
+        assert [dt for (t, dt) in calls if t < .6 < t + dt][-1] < .06
+        assert len(mps.get('Time')) == 5
+        ref, calls = self.run(32)
+        for var in ('E.XX', 'S.XX', 'S.YY', 'SDV_EQPS'):
+            a = ref.get(var)[::8]
+            assert np.allclose(mps.get(var), a, atol=1.E-8*np.amax(abs(a)))
+
+    def test_no_cutback(self):
+        mps, calls = self.run(4, no_cutback=True)
+        assert mps.steps.values()[-1].num_cutbacks == 0
+        assert len(calls) == 4
+
+@pytest.mark.fast
+@pytest.mark.kinematics
+class TestStrainKinematics(object):
+
+    def run(self, compiled, monkeypatch):
+        from matmodlab.utils import mmlabpack
+        monkeypatch.setattr(mmlabpack, 'compiled', compiled)
+        mps = MaterialPointSimulator('kinematics', verbosity=0,
+                                     d=this_directory)
+        mps.Material('vonmises', [1.E+10, 3.75E+09, 1.E+07, 1.E+08, .5])
+        mps.StrainStep(components=(.1, -.02, .03), frames=10, kappa=0)
+        mps.StrainStep(components=(.05, .01, .03, .02, 0, .01), frames=10,
+                       kappa=0)
+        return mps
+
+    def test_cached_operator(self, monkeypatch):
+        '''F advanced by the step's cached exp(d dt) agrees with
+        update_deformation'''
+        a = self.run(True, monkeypatch)
+        b = self.run(False, monkeypatch)
+        for var in ('F.XX', 'F.YY', 'F.XY', 'E.XX', 'E.XY', 'S.XX'):
+            x, y = a.get(var), b.get(var)
+            assert np.allclose(x, y, rtol=1.E-10, atol=1.E-10*np.amax(abs(x)))
+
+@pytest.mark.fast
+@pytest.mark.stream
+class TestStreaming(object):
+    parameters = [1.E+10, 3.75E+09, 1.E+07, 1.E+08, .5]
+
+    def run(self, job, fail=False, **kwargs):
+        mps = MaterialPointSimulator(job, verbosity=0, d=this_directory,
+                                     **kwargs)
+        mat = mps.Material('vonmises', self.parameters)
+        mps.StrainStep(components=(.02, 0., 0.), frames=600)
+        if fail:
+            def update_state(*args, **kwargs):
+                raise ValueError('material failure')
+            mat.update_state = update_state
+            with pytest.raises(ValueError):
+                mps.StressStep(components=(0., 0., 0.), frames=600)
+            return mps
+        mps.StressStep(components=(0., 0., 0.), frames=600)
+        mps.finish()
+        return mps
+
+    def test_stream(self):
+        '''Streamed records match those held in memory, in a bounded
+        buffer'''
+        a = self.run('stream_memory')
+        b = self.run('stream', stream=True, flush_frames=100)
+        assert b.records._buf.shape[0] <= Records.chunk
+        assert b.records.data.shape == a.records.data.shape
+        for var in ('Time', 'E.XX', 'S.XX', 'SDV_EQPS'):
+            assert np.allclose(a.get(var), b.get(var))
+        names, data = loadfile(b.filename)
+        assert np.allclose(data, a.get())
+
+    def test_crash(self):
+        '''Rows flushed before a failure are kept on disk'''
+        mps = self.run('stream_crash', fail=True, stream=True)
+        names, data = loadfile(os.path.join(this_directory, 'stream_crash.rpk'))
+        assert data.shape[0] == 601
+        assert data[-1, names.index('TIME')] == mps.get('Time')[-1]
+
+    def test_num_dumps(self):
+        '''Only num_dumps frames of a step are written, ending with the
+        last'''
+        mps = MaterialPointSimulator('num_dumps', verbosity=0,
+                                     d=this_directory)
+        mps.Material('vonmises', self.parameters)
+        mps.StrainStep(components=(.02, 0., 0.), frames=100, num_dumps=8)
+        mps.StrainStep(components=(0., 0., 0.), frames=5, num_dumps=10)
+        mps.StrainStep(components=(.01, 0., 0.), increment=2., frames=2,
+                       adaptive=True, num_dumps=4)
+        time = mps.get('Time')
+        assert len(time) == 1 + 8 + 5 + 4
+        assert abs(time[8] - 1.) < 1.E-12 and abs(time[13] - 2.) < 1.E-12
+        # adaptive frames are written on crossing each dump time
+        frames = [f.value for f in mps.steps.values()[-1].frames]
+        for (t, dump) in zip(time[14:], [2.5, 3., 3.5, 4.]):
+            assert np.isclose(t, min(x for x in frames if x >= dump - 1e-12))
+        ref = MaterialPointSimulator('num_dumps', verbosity=0,
+                                     d=this_directory)
+        ref.Material('vonmises', self.parameters)
+        ref.StrainStep(components=(.02, 0., 0.), frames=100)
+        assert np.allclose(mps.get('S.XX')[8], ref.get('S.XX')[-1])
+        with pytest.raises(SystemExit):
+            mps.StrainStep(components=(0., 0., 0.), num_dumps=0)
+
+@pytest.mark.fast
+@pytest.mark.restart
+class TestCheckpoint(object):
+    parameters = [1.E+10, 3.75E+09, 1.E+07, 1.E+08, .5]
+
+    def preload(self, job, **kwargs):
+        mps = MaterialPointSimulator(job, verbosity=0, d=this_directory,
+                                     checkpoint=1, **kwargs)
+        mat = mps.Material('vonmises', self.parameters)
+        mat.Expansion(ISOTROPIC, [1.E-5])
+        mps.StrainStep(components=(.02, 0., 0.), frames=50, temperature=300.)
+        mps.StressStep(components=(0., 0., 0.), frames=50)
+        return mps
+
+    def unload(self, mps):
+        mps.StrainStep(components=(-.01, 0., 0.), frames=50)
+
+    def compare(self, a, b):
+        assert a.get('Time').shape == b.get('Time').shape
+        for var in ('Time', 'Step', 'E.XX', 'S.XX', 'SDV_EQPS'):
+            assert np.allclose(a.get(var), b.get(var))
+
+    @pytest.mark.parametrize('stream', [False, True])
+    def test_restart(self, stream):
+        '''A restarted simulation continues from the last completed step'''
+        filename = os.path.join(this_directory, 'checkpoint.chk')
+        ref = self.preload('checkpoint_ref')
+        self.unload(ref)
+        self.preload('checkpoint', stream=stream)
+        mps = MaterialPointSimulator.restart(filename, verbosity=0)
+        assert mps.steps.keys() == ['Step-0', 'Step-1', 'Step-2']
+        assert mps.material.xpan is not None
+        self.unload(mps)
+        self.compare(ref, mps)
+
+    def test_branch(self):
+        '''Load histories branch off of a shared preload'''
+        mps = self.preload('checkpoint_preload', stream=True)
+        filename = mps.write_checkpoint()
+        a = MaterialPointSimulator.restart(filename, job='checkpoint_a',
+                                           verbosity=0)
+        b = MaterialPointSimulator.restart(filename, job='checkpoint_b',
+                                           verbosity=0, stream=False)
+        self.unload(a)
+        b.StrainStep(components=(.04, 0., 0.), frames=50)
+        self.unload(mps)
+        self.compare(mps, a)
+        assert np.allclose(mps.get('S.XX')[:101], b.get('S.XX')[:101])
+        assert not np.allclose(mps.get('S.XX')[101:], b.get('S.XX')[101:])
+
+    def test_preempted(self):
+        '''A run that dies is continued from its last checkpoint'''
+        ref = self.preload('checkpoint_ref')
+        self.unload(ref)
+        mps = self.preload('checkpoint_crash', stream=True)
+        def fail(*args, **kwargs):
+            raise ValueError('preempted')
+        mps.material.update_state = fail
+        with pytest.raises(ValueError):
+            self.unload(mps)
+        mps = MaterialPointSimulator.restart(
+            os.path.join(this_directory, 'checkpoint_crash.chk'), verbosity=0)
+        self.unload(mps)
+        self.compare(ref, mps)
+
+    def test_bad_file(self):
+        filename = os.path.join(this_directory, 'checkpoint_bad.chk')
+        with open(filename, 'w') as fh:
+            fh.write('not a checkpoint')
+        with pytest.raises(SystemExit):
+            MaterialPointSimulator.restart(filename)
+
+class CachedSimulation(object):
+    parameters = [1.E+10, 3.75E+09, 1.E+07, 1.E+08, .5]
+
+    def run(self, cache, parameters=None, unload=0., adaptive=True,
+            **kwargs):
+        mps = MaterialPointSimulator('result_cache', verbosity=0,
+                                     d=this_directory, cache=cache, **kwargs)
+        mat = mps.Material('vonmises', parameters or self.parameters)
+        calls = []
+        update_state = mat.update_state
+        def wrapper(*args, **kwargs):
+            calls.append(1)
+            return update_state(*args, **kwargs)
+        mat.update_state = wrapper
+        mps.StrainStep(components=(.02, 0., 0.), frames=50)
+        mps.StressStep(components=(0., 0., 0.), frames=50)
+        mps.StrainStep(components=(unload, 0., 0.), frames=50,
+                       adaptive=adaptive)
+        return mps, len(calls)
+
+@pytest.mark.fast
+@pytest.mark.cache
+class TestResultCache(CachedSimulation):
+
+    def test_hits(self, tmpdir):
+        '''Repeated simulations are read from the cache'''
+        cache = ResultCache(str(tmpdir))
+        a, n = self.run(cache)
+        assert n > 0 and cache.misses == 3 and cache.hits == 0
+        b, n = self.run(cache)
+        assert n == 0 and cache.hits == 3
+        for var in ('Time', 'Frame', 'E.XX', 'S.XX', 'SDV_EQPS'):
+            assert np.allclose(a.get(var), b.get(var))
+        frames = lambda m: [len(s.frames) for s in m.steps.values()]
+        assert frames(a) == frames(b)
+        c, n = self.run(str(tmpdir), stream=True, flush_frames=20)
+        assert n == 0
+        assert np.allclose(a.get('S.XX'), c.get('S.XX'))
+
+    def test_keys(self, tmpdir):
+        '''Changes to the material or steps miss, a shared prefix hits'''
+        cache = ResultCache(str(tmpdir))
+        self.run(cache)
+        parameters = list(self.parameters)
+        parameters[2] *= 1.01
+        self.run(cache, parameters=parameters)
+        assert cache.hits == 0 and cache.misses == 6
+        self.run(cache, unload=-.01)
+        assert cache.hits == 2 and cache.misses == 7
+        self.run(cache, modified_newton=True)
+        assert cache.hits == 2 and cache.misses == 10
+
+    def test_eviction(self, tmpdir):
+        '''The least recently used entries are evicted'''
+        cache = ResultCache(str(tmpdir))
+        self.run(cache, adaptive=False)
+        size = cache.size
+        cache = ResultCache(str(tmpdir), max_size=int(1.2*size))
+        assert cache.size == size and len(cache) == 3
+        self.run(cache, adaptive=False)
+        self.run(cache, unload=-.01, adaptive=False)
+        assert cache.evictions == 1 and len(cache) == 3
+        assert cache.size <= cache.max_size
+        # the first steps were used most recently, the old last step went
+        n = cache.hits
+        self.run(cache, adaptive=False)
+        assert cache.hits == n + 2
+        cache.clear()
+        assert len(cache) == 0
+
+@pytest.mark.fast
+@pytest.mark.cache
+class TestStepMemo(CachedSimulation):
+
+    def test_prefix(self):
+        '''A simulator sharing its first steps with one already run starts
+        after them'''
+        memo = StepMemo()
+        a, n = self.run(None, memo=memo, unload=-.01)
+        assert memo.misses == 3 and len(memo) == 3
+        b, n = self.run(None, memo=memo)
+        assert memo.hits == 2 and memo.misses == 4
+        ref, m = self.run(None)
+        assert 0 < n < m
+        for var in ('Time', 'E.XX', 'S.XX', 'SDV_EQPS'):
+            assert np.allclose(ref.get(var), b.get(var))
+        assert not np.allclose(a.get('E.XX'), b.get('E.XX'))
+
+    def test_tiers(self, tmpdir):
+        '''Steps read from the result cache are memoized'''
+        cache = ResultCache(str(tmpdir))
+        self.run(cache)
+        memo = StepMemo()
+        b, n = self.run(cache, memo=memo)
+        assert n == 0 and cache.hits == 3 and len(memo) == 3
+        c, n = self.run(cache, memo=memo)
+        assert n == 0 and cache.hits == 3 and memo.hits == 3
+
+    def test_eviction(self):
+        memo = StepMemo(max_entries=4)
+        self.run(None, memo=memo)
+        self.run(None, memo=memo, unload=-.01)
+        assert len(memo) == 4 and memo.evictions == 0
+        self.run(None, memo=memo, unload=-.02)
+        assert len(memo) == 4 and memo.evictions == 1
+        with pytest.raises(SystemExit):
+            MaterialPointSimulator('memo', memo='yes')
+
+@pytest.mark.fast
+@pytest.mark.stats
+class TestInstrumentation(CachedSimulation):
+
+    def test_counts(self):
+        mps, calls = self.run(None, stats=True)
+        assert instrumentation.collector is None
+        assert mps.stats.keys() == ['Step-1', 'Step-2', 'Step-3']
+        total = mps.stats.total()
+        assert total.material_calls == calls
+        assert total.frames == sum(len(s.frames) for s in mps.steps.values()
+                                   if s.name != 'Step-0')
+        strain, stress = mps.stats['Step-1'], mps.stats['Step-2']
+        assert strain.newton_iterations == 0
+        assert stress.newton_iterations > 0
+        assert stress.material_calls > stress.frames
+        for item in (strain, stress):
+            assert item.time >= (item.time_kinematics + item.time_material +
+                                 item.time_solve + item.time_records)
+        assert 'Total' in mps.stats.summary()
+
+    def test_disabled(self):
+        mps, calls = self.run(None)
+        assert mps.stats is None
+        assert instrumentation.collector is None
+
+@pytest.mark.fast
+@pytest.mark.benchmark
+class TestBenchmarkSuite(object):
+
+    def test_compare_timing(self):
+        from matmodlab.benchmarks.suite import compare_timing
+        assert compare_timing(1., None) is None
+        assert compare_timing(.5, 1.) == SAME
+        assert compare_timing(1.1, 1.) == SAME
+        assert compare_timing(1.5, 1.) == DIFF
+        assert compare_timing(2.5, 1.) == NOT_SAME
+
+    def test_baseline(self, tmpdir):
+        from matmodlab.benchmarks.suite import run_suite, write_baseline
+        baseline = str(tmpdir.join('baseline.json'))
+        stream = StringIO()
+        status, timings = run_suite(baseline=baseline, pattern='^kinematics',
+                                    scale=.01, save=True, stream=stream)
+        assert status == SAME
+        assert 'kinematics/deps2d/python' in timings
+        assert 'no baseline' in stream.getvalue()
+        # a baseline ten times faster than the machine flags a regression
+        write_baseline(baseline, dict((k, v / 10.) for (k, v) in
+                                      timings.items()))
+        stream = StringIO()
+        status, timings = run_suite(baseline=baseline, pattern='^kinematics',
+                                    scale=.01, stream=stream)
+        assert status == NOT_SAME
+        assert 'Timings are different' in stream.getvalue()
+
+    def test_lazy_imports(self):
+        '''import matmodlab does not import the modules it defers'''
+        from matmodlab.benchmarks.bench_import import eager_imports
+        assert eager_imports() == []
+        # the check sees modules that are imported
+        assert eager_imports(('numpy', 'matmodlab.mmd')) != []
+
 @pytest.mark.slow
 @pytest.mark.permutate
 @pytest.mark.skipif(el is None, reason='elastic model not imported')
@@ -112,6 +535,114 @@ class TestPermutation(StandardMatmodlabTest):
             raise Exception('permutate_combination failed to run')
         self.completed_jobs.append('permutate_combination')
 
+def sum_of_squares(x, xnames, d, job, *args):
+    assert environ.evaluation_dir == d
+    assert not os.path.samefile(os.getcwd(), d)
+    return np.sum(np.asarray(x) ** 2)
+
+@pytest.mark.fast
+@pytest.mark.build
+class TestBuildManifest(object):
+
+    def test_manifest(self, tmpdir):
+        '''Modules are current until their sources or flags change'''
+        from matmodlab.utils.fortran.manifest import BuildManifest
+        from matmodlab.utils.fortran.product import IO_F90
+        src = tmpdir.join('umat.f90')
+        src.write('subroutine umat\nend subroutine umat\n')
+        so = tmpdir.join('umat_x.so')
+        so.write('')
+        sources, filename = [str(src)], str(so)
+        manifest = BuildManifest(str(tmpdir.join('manifest.json')))
+        assert not manifest.is_current('umat_x', sources, filename=filename)
+        manifest.record('umat_x', sources)
+        assert manifest.is_current('umat_x', sources, filename=filename)
+        assert not manifest.is_current('umat_x', sources, filename=filename,
+                                       fflags=['-O0'])
+        assert not manifest.is_current('umat_x', sources + [IO_F90],
+                                       filename=filename)
+        # touched, but not edited
+        src.setmtime(src.mtime() + 10)
+        assert manifest.is_current('umat_x', sources, filename=filename)
+        assert manifest.entries['umat_x']['sources'][str(src)][0] == \
+            src.mtime()
+        src.write('subroutine umat\n  return\nend subroutine umat\n')
+        assert not manifest.is_current('umat_x', sources, filename=filename)
+        manifest.record('umat_x', sources)
+        so.remove()
+        assert not manifest.is_current('umat_x', sources, filename=filename)
+
+    def test_signature(self):
+        '''Signatures are written only if their contents change'''
+        from matmodlab.utils.fortran.manifest import rename_signature
+        from matmodlab.materials.product import ABA_UMAT_PYF
+        filename = rename_signature(ABA_UMAT_PYF, 'umat', 'umat_manifest_t')
+        try:
+            assert 'python module umat_manifest_t' in open(filename).read()
+            os.utime(filename, (1., 1.))
+            assert rename_signature(ABA_UMAT_PYF, 'umat',
+                                    'umat_manifest_t') == filename
+            assert os.path.getmtime(filename) == 1.
+        finally:
+            remove(filename)
+
+    def test_parallel_build(self, tmpdir):
+        '''Modules are built in parallel and failures are reported with their
+        logs'''
+        from matmodlab.utils.fortran.extbuilder import (FortranExtBuilder,
+                                                        ExtModuleNotBuilt)
+        good = tmpdir.join('good.f90')
+        good.write('subroutine good(x)\n  real x\n  x = 1\nend subroutine good\n')
+        bad = tmpdir.join('bad.f90')
+        bad.write('subroutine bad(x)\n  real x\n  x = = 1\nend subroutine bad\n')
+        names = ('good_build_t', 'bad_build_t')
+        fb = FortranExtBuilder('matmodlab', verbosity=0, nprocs=2)
+        fb.add_extension(names[0], [str(good)], force=1)
+        fb.add_extension(names[1], [str(bad)], force=1)
+        try:
+            with pytest.raises(ExtModuleNotBuilt):
+                fb.build_extension_modules()
+            assert fb.exts_built == [names[0]]
+            assert fb.exts_failed == [names[1]]
+            log = os.path.join(PKG_D, 'build', names[1] + '.log')
+            assert str(bad) in open(log).read()
+        finally:
+            for name in names:
+                fb.manifest.remove(name)
+                remove(os.path.join(PKG_D, name + '.so'))
+                remove(os.path.join(PKG_D, 'build', name))
+                remove(os.path.join(PKG_D, 'build', name + '.log'))
+
+@pytest.mark.fast
+@pytest.mark.permutate
+class TestPermutatorPool(StandardMatmodlabTest):
+
+    def test_permutate_pool(self, monkeypatch):
+        '''Short jobs run in a pool write one evaluation database'''
+        import xml.dom.minidom as xdom
+        import multiprocessing as mp
+        monkeypatch.setattr(mp, 'cpu_count', lambda: 2)
+        cwd = os.getcwd()
+        K = PermutateVariable('K', range(1, 9))
+        G = PermutateVariable('G', range(1, 6))
+        permutator = Permutator('permutate_pool', sum_of_squares, [K, G],
+                                method=COMBINATION, descriptors=['SS'],
+                                nprocs=2, chunksize=4, d=this_directory,
+                                verbosity=0)
+        permutator.run()
+        assert os.getcwd() == cwd
+        assert permutator.statuses == [0] * 40
+        doc = xdom.parse(permutator.output)
+        evaluations = doc.getElementsByTagName('Evaluation')
+        assert sorted(int(e.getAttribute('n')) for e in evaluations) == \
+            range(1, 41)
+        for e in evaluations:
+            p = e.getElementsByTagName('Parameters')[0]
+            r = e.getElementsByTagName('Responses')[0]
+            ss = float(p.getAttribute('K')) ** 2 + float(p.getAttribute('G')) ** 2
+            assert float(r.getAttribute('SS')) == ss
+        self.completed_jobs.append('permutate_pool')
+
 @pytest.mark.slow
 @pytest.mark.optimize
 @pytest.mark.skipif(el is None, reason='elastic model not imported')
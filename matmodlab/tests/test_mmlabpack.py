@@ -0,0 +1,109 @@
+from testconf import *
+import numpy as np
+import scipy.linalg
+from matmodlab.utils import _mmlabpack
+from matmodlab.utils.symeig import *
+
+def random_sym(n, seed=7):
+    rs = np.random.RandomState(seed)
+    a = rs.uniform(-1., 1., (n, 3, 3))
+    return a + a.transpose(0, 2, 1)
+
+def degenerate(eigenvalues, seed=7):
+    '''Symmetric matrices with the given (nearly) repeated eigenvalues'''
+    Q = np.linalg.qr(np.random.RandomState(seed).uniform(-1, 1, (3, 3)))[0]
+    a = [np.dot(Q * np.array(w, dtype=float), Q.T) for w in eigenvalues]
+    return np.array([(x + x.T) / 2. for x in a])
+
+DEGENERATE = ([1., 1., 2.], [1., 2., 2.], [3., 3., 3.], [1., 1. + 1e-9, 2.],
+              [1., 1. + 1e-14, 1. + 2e-14], [1e-5, 2e-5, 1e-5])
+
+@pytest.mark.fast
+@pytest.mark.mmlabpack
+class TestSymmetricEigen(object):
+
+    def check(self, a, w, Q):
+        scale = max(abs(a).max(), 1e-300)
+        assert np.allclose(w, np.linalg.eigvalsh(a), rtol=0, atol=1e-13*scale)
+        assert np.allclose(np.dot(Q.T, Q), np.eye(3), rtol=0, atol=1e-13)
+        assert np.allclose(np.dot(Q * w, Q.T), a, rtol=0, atol=1e-13*scale)
+
+    def test_eigh3(self):
+        '''Closed form eigendecomposition of random, degenerate and diagonal
+        matrices'''
+        for a in random_sym(200):
+            self.check(a, *eigh3(a))
+        for a in degenerate(DEGENERATE):
+            self.check(a, *eigh3(a))
+        self.check(np.diag([3., 1., 2.]), *eigh3(np.diag([3., 1., 2.])))
+        self.check(np.zeros((3, 3)), *eigh3(np.zeros((3, 3))))
+
+    def test_eigh3_batch(self):
+        '''The batched decomposition agrees with the single matrix one'''
+        a = np.concatenate((random_sym(50), degenerate(DEGENERATE),
+                            [np.diag([3., 1., 2.]), np.zeros((3, 3))]))
+        W, Q = eigh3_batch(a)
+        for (n, x) in enumerate(a):
+            self.check(x, W[n], Q[n])
+            assert np.allclose(W[n], eigh3(x)[0], rtol=0, atol=1e-14)
+
+    def test_matrix_functions(self):
+        '''Spectral matrix functions agree with SciPy'''
+        a = np.eye(3) + .2 * random_sym(20)
+        a = np.einsum('nki,nkj->nij', a, a)
+        for (func, ref) in ((expm3, scipy.linalg.expm),
+                            (sqrtm3, scipy.linalg.sqrtm),
+                            (logm3, scipy.linalg.logm)):
+            for x in a:
+                assert np.allclose(func(x), ref(x))
+        assert np.allclose(powm3(a[0], 3), np.linalg.matrix_power(a[0], 3))
+        assert np.allclose(expm3_batch(a), [scipy.linalg.expm(x) for x in a])
+        assert np.allclose(sqrtm3_batch(a), [scipy.linalg.sqrtm(x) for x in a])
+        assert np.allclose(logm3_batch(a), [scipy.linalg.logm(x) for x in a])
+        assert np.allclose(powm3_batch(a, -.5),
+                           [np.linalg.inv(scipy.linalg.sqrtm(x)) for x in a])
+
+    def test_update_deformation(self):
+        '''The Python update_deformation agrees with the SciPy path'''
+        F, d = np.eye(3).flatten(), np.array([1., .1, -.2, .3, 0., .05])
+        for i in range(10):
+            F, E = _mmlabpack.update_deformation(.1, 0., F, d)
+        ff = np.eye(3)
+        for i in range(10):
+            ff = np.dot(scipy.linalg.expm(_mmlabpack.as3x3(d / VOIGT) * .1), ff)
+        e = scipy.linalg.logm(scipy.linalg.sqrtm(np.dot(ff.T, ff)))
+        assert np.allclose(F, ff.flatten())
+        assert np.allclose(E, _mmlabpack.symarray(e) * VOIGT)
+        assert np.allclose(_mmlabpack.e_from_f(2., F),
+                           _mmlabpack.symarray(.5 * (np.dot(ff.T, ff) -
+                                                      np.eye(3))) * VOIGT)
+
+@pytest.mark.fast
+@pytest.mark.mmlabpack
+class TestBatchedKinematics(object):
+
+    def test_update_deformation_batch(self):
+        '''Batched kinematics agree with the scalar routines'''
+        from matmodlab.utils import mmlabpack
+        rs = np.random.RandomState(3)
+        N = 20
+        F = np.tile(np.eye(3).flatten(), (N, 1))
+        for kappa in (0., 1., -2., .5):
+            for i in range(5):
+                d = rs.uniform(-.5, .5, (N, 6))
+                f, e = mmlabpack.update_deformation_batch(.1, kappa, F, d)
+                for n in range(N):
+                    fn, en = mmlabpack.update_deformation(.1, kappa, F[n], d[n])
+                    assert np.allclose(f[n], fn, rtol=1e-12, atol=1e-14)
+                    assert np.allclose(e[n], en, rtol=1e-10, atol=1e-13)
+                    en = mmlabpack.e_from_f(kappa, f[n])
+                    assert np.allclose(e[n], en, rtol=1e-10, atol=1e-13)
+                assert np.allclose(mmlabpack.e_from_f_batch(kappa, f), e,
+                                   rtol=1e-12, atol=1e-14)
+                F = f
+
+    def test_negative_jacobian(self):
+        from matmodlab.utils import mmlabpack
+        F = np.array([np.eye(3).flatten(), -np.eye(3).flatten()])
+        with pytest.raises(Exception):
+            mmlabpack.e_from_f_batch(0., F)
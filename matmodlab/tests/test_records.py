@@ -0,0 +1,93 @@
+from testconf import *
+from matmodlab.mmd.simulator import Records
+from matmodlab.utils.fileio import rec2arr
+
+def make_records():
+    records = Records()
+    records.add('Step', SCALAR, dtype='i4')
+    records.add('Time', SCALAR)
+    records.add('S', TENSOR_3D)
+    records.add('SDV', SDV, keys=['EQPS', 'Y'])
+    records.init(Step=0, Time=0., S=Z6, SDV=[0., 1.])
+    return records
+
+@pytest.mark.fast
+@pytest.mark.records
+class TestRecords(object):
+
+    def test_cache_and_advance(self):
+        '''Cached rows are visible only after advance'''
+        records = make_records()
+        records.reserve(3)
+        for i in range(3):
+            records.cache(Step=1, Time=i+1., S=Z6+i, SDV=[i, 1.])
+        assert records.data.shape[0] == 1
+        assert records.num_cached == 3
+        records.advance()
+        assert records.data.shape[0] == 4
+        assert np.allclose(records.data['Time'], [0, 1, 2, 3])
+        assert np.allclose(records.data['S'][-1], 2.)
+        assert np.allclose(records.data['SDV_EQPS'], [0, 0, 1, 2])
+
+    def test_clear_cache(self):
+        '''Cutback retries discard the cached rows'''
+        records = make_records()
+        records.cache(Step=1, Time=1., S=Z6, SDV=[1., 1.])
+        records.clear_cache()
+        records.cache(Step=1, Time=.5, S=Z6, SDV=[2., 1.])
+        records.advance()
+        assert records.data.shape[0] == 2
+        assert np.allclose(records.data['Time'], [0., .5])
+        assert np.allclose(records.data['SDV_EQPS'], [0., 2.])
+
+    def test_growth(self):
+        '''Buffer grows past its initial size without losing rows'''
+        records = make_records()
+        n = 3 * Records.chunk + 7
+        for i in range(n):
+            records.cache(Step=1, Time=i+1., S=Z6, SDV=[i, 1.])
+        records.advance()
+        assert records.data.shape[0] == n + 1
+        assert np.allclose(records.data['Time'], np.arange(n+1))
+
+@pytest.mark.fast
+@pytest.mark.records
+class TestRec2Arr(object):
+
+    @staticmethod
+    def rec2arr_loop(recarr):
+        flat = lambda row: [x for a in row for x in np.atleast_1d(a)]
+        return np.array([flat(row.tolist()) for row in recarr])
+
+    def test_mixed_fields(self):
+        '''Records with integer and float fields are copied to floats'''
+        records = make_records()
+        for i in range(5):
+            records.cache(Step=1, Time=i+1., S=Z6+i, SDV=[i, 1.])
+        records.advance()
+        arr = rec2arr(records.data)
+        assert arr.shape == (6, 10)
+        assert np.allclose(arr, self.rec2arr_loop(records.data))
+        assert np.allclose(rec2arr(records.data, rows=[0, 5]), arr[[0, 5]])
+
+    def test_view(self):
+        '''Records with fields of one type are flattened without a copy'''
+        records = make_records()
+        records.cache(Step=1, Time=1., S=Z6+1, SDV=[2., 3.])
+        records.advance()
+        arr = rec2arr(records.data[['S', 'SDV_EQPS', 'SDV_Y']])
+        assert arr.shape == (2, 8)
+        assert not arr.flags.writeable
+        assert np.allclose(arr[1], [1, 1, 1, 1, 1, 1, 2, 3])
+
+    def test_simulator_copies(self):
+        '''Arrays the simulator returns are writable copies of its records'''
+        mps = MaterialPointSimulator('rec2arr', verbosity=0, d=this_directory)
+        mps.Material('vonmises', [1.E+10, 3.75E+09, 1.E+07, 1.E+08, .5])
+        mps.StrainStep(components=(.01, 0., 0.), frames=5)
+        sdv = mps.SDV
+        sdv[0, 0] = 1.
+        assert mps.records.data['SDV_EQPS'][0] == 0.
+        data = mps.get()
+        data[0, 0] = 1.
+        assert not np.shares_memory(data, mps.records.data)
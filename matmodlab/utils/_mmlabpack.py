@@ -1,6 +1,7 @@
 import numpy
 import scipy.linalg
 from ..constants import VOIGT
+from .symeig import issym3, funcm3, expm3, sqrtm3, logm3, powm3
 
 def epsilon(a):
     """Find the machine precision for a float of type 'a'"""
@@ -72,21 +73,29 @@ def asmat(a):
 
 def expm(a):
     """Compute the matrix exponential of a 3x3 matrix"""
+    if issym3(a):
+        return expm3(a)
     return scipy.linalg.expm(a)
 
 
 def powm(a, m):
     """Compute the matrix power of a 3x3 matrix"""
+    if issym3(a):
+        return powm3(a, m)
     return funcm(a, lambda x: x ** m)
 
 
 def sqrtm(a):
     """Compute the square root of a 3x3 matrix"""
+    if issym3(a):
+        return sqrtm3(a)
     return scipy.linalg.sqrtm(a)
 
 
 def logm(a):
     """Compute the matrix logarithm of a 3x3 matrix"""
+    if issym3(a):
+        return logm3(a)
     return scipy.linalg.logm(a)
 
 
@@ -109,6 +118,9 @@ def funcm(a, f):
                             [       0.0, f(a[1, 1]),        0.0],
                             [       0.0,        0.0, f(a[2, 2])]])
 
+    if issym3(a):
+        return funcm3(a, numpy.vectorize(f))
+
     vals, vecs = numpy.linalg.eig(a)
 
     # Compute eigenprojections
@@ -153,9 +165,9 @@ def deps2d(dt, k, e, de):
 
     # stretch and its rate
     if k == 0:
-        u = expm(epsf)
+        u = expm3(epsf)
     else:
-        u = powm(k * epsf + numpy.eye(3, 3), 1.0 / k)
+        u = powm3(k * epsf + numpy.eye(3, 3), 1.0 / k)
 
     x = 1.0 / 2.0 * (numpy.linalg.inv(k * epsf + numpy.eye(3, 3)) +
                      numpy.linalg.inv(k * eps + numpy.eye(3, 3)))
@@ -201,12 +213,8 @@ def update_deformation(dt, k, farg, darg):
     """
     f0 = farg.reshape((3, 3))
     d = as3x3(darg / VOIGT)
-    ff = numpy.dot(expm(d * dt), f0)
-    u = sqrtm(numpy.dot(ff.T, ff))
-    if k == 0:
-        eps = logm(u)
-    else:
-        eps = 1.0 / k * (powm(u, k) - numpy.eye(3, 3))
+    ff = numpy.dot(expm3(d * dt), f0)
+    eps = _c2e(k, numpy.dot(ff.T, ff))
 
     if numpy.linalg.det(ff) <= 0.0:
         raise Exception("negative jacobian encountered")
@@ -216,6 +224,13 @@ def update_deformation(dt, k, farg, darg):
 
     return f, e
 
+def _c2e(k, c):
+    """Seth-Hill strain of the right Cauchy-Green tensor c = U**2, from a
+    single eigendecomposition of c"""
+    if k == 0:
+        return funcm3(c, lambda x: .5 * numpy.log(x))
+    return funcm3(c, lambda x: (x ** (.5 * k) - 1.) / k)
+
 def e_from_f(k, farg):
     """
     Update strain by
@@ -225,11 +240,7 @@ def e_from_f(k, farg):
     where k is the Seth-Hill strain parameter.
     """
     f = farg.reshape((3, 3))
-    u = sqrtm(numpy.dot(f.T, f))
-    if k == 0:
-        eps = logm(u)
-    else:
-        eps = 1.0 / k * (powm(u, k) - numpy.eye(3, 3))
+    eps = _c2e(k, numpy.dot(f.T, f))
 
     if numpy.linalg.det(f) <= 0.0:
         raise Exception("negative jacobian encountered")
@@ -243,9 +254,9 @@ def f_from_e(kappa, E):
     I = numpy.eye(3)
     E = asmat(E / VOIGT)
     if kappa == 0:
-        U = expm(E)
+        U = expm3(E)
     else:
-        U = powm(k * E + I, 1. / k)
+        U = powm3(kappa * E + I, 1. / kappa)
     F = numpy.dot(R, U)
     if numpy.linalg.det(F) <= 0.0:
         raise Exception("negative jacobian encountered")
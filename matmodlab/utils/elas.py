@@ -88,12 +88,7 @@ constformulas="""
 import sys
 import os
 import re
-import argparse
 from math import sqrt
-try:
-   import readline
-except ImportError:
-   pass
 
 LAME, G, E, NU, K, H = 'Lame', 'G', 'E', 'Nu', 'K', 'H'
 C10, D1 = 'C10', 'D1'
@@ -368,6 +363,10 @@ class ElasticConstants(object):
         return
 
     def get_input(self, query, args, optional=0):
+        try:
+            import readline
+        except ImportError:
+            pass
 
         while True:
 
@@ -422,6 +421,7 @@ def main(argv=None):
     """ Fetches user input and sends in right format to compute_elastic_constants
 
     """
+    import argparse
     argv = argv or sys.argv[1:]
 
     # -- command line option parsing
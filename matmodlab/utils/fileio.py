@@ -1,18 +1,16 @@
 import os
 import sys
-import argparse
 import warnings
 import numpy as np
 from numpy.compat import asbytes
-import xml.dom.minidom as xdom
 from os.path import isfile, splitext, basename, join
 
 from .numerix import *
 from ..constants import *
-from ..tpl import tabfileio
 
 def savefile(filename, names, data):
     """Save the file using tabfileio"""
+    from ..tpl import tabfileio
     tabfileio.write_file(filename, names, data)
 
 def loadfile(filename, disp=1, skiprows=0, sheetname="MML", columns=None,
@@ -52,6 +50,7 @@ def loadfile(filename, disp=1, skiprows=0, sheetname="MML", columns=None,
 
     else:
         # ??? -> let tabfileio deal with this extension
+        from ..tpl import tabfileio
         names, data = tabfileio.read_file(filename, disp=1, sheetname=sheetname)
 
     if columns:
@@ -131,20 +130,132 @@ def loadtxt(filename, comments='#', skiprows=0, upcase=False,
         return names, data
     return data
 
-def flatten(a):
-    flat = []
-    for x in a:
-        try: flat.extend(x)
-        except TypeError: flat.append(x)
-    return flat
-
-def rec2arr(recarr):
-    arr = []
-    for row in recarr:
-        arr.append(flatten(row.tolist()))
-    return np.array(arr)
+def rec2arr(recarr, rows=None):
+    """Flatten the record array recarr to a 2D array
+
+    Each field of recarr occupies as many columns as it has components. If
+    all fields share the same base type and are packed one after another, the
+    returned array is a read only strided view of recarr's memory. Otherwise,
+    the fields are copied, one block of columns at a time, to a float array.
+
+    """
+    if rows is not None:
+        recarr = recarr[rows]
+
+    layout = []
+    for name in recarr.dtype.names:
+        dtype, offset = recarr.dtype.fields[name][:2]
+        layout.append((name, dtype.base, offset, int(np.prod(dtype.shape))))
+    ncol = sum([x[3] for x in layout])
+
+    arr = _rec2arr_view(recarr, layout, ncol)
+    if arr is not None:
+        return arr
+
+    arr = np.empty((recarr.shape[0], ncol))
+    j = 0
+    for (name, base, offset, n) in layout:
+        arr[:, j:j+n] = recarr[name].reshape(-1, n)
+        j += n
+    return arr
+
+def _rec2arr_view(recarr, layout, ncol):
+    """Return a (rows, ncol) view of recarr, or None if one is not possible"""
+    if recarr.ndim != 1 or not layout:
+        return None
+    base, start = layout[0][1], layout[0][2]
+    offset = start
+    for (name, b, o, n) in layout:
+        if b != base or o != offset:
+            return None
+        offset += n * base.itemsize
+    try:
+        arr = np.ndarray((recarr.shape[0], ncol), dtype=base, buffer=recarr,
+                         offset=start, strides=(recarr.strides[0], base.itemsize))
+    except (TypeError, ValueError, BufferError):
+        return None
+    arr.flags.writeable = False
+    return arr
+
+class RecordStream(object):
+    """Append rows of a record array to a file on disk
+
+    The file is in the numpy .npy format, so that it is read by np.load (and
+    loadrec) like any other record array. Room for the largest possible shape
+    is reserved in the header when the file is created. Rows are appended to
+    the end of the file and the number of rows in the header is rewritten
+    after them, so a file left behind by a run that died holds every row
+    written before the last call to write.
+
+    If num_rows is given, the existing stream filename is reopened and rows
+    are appended after its first num_rows rows, those following are dropped.
+
+    """
+    magic = b'\x93NUMPY\x01\x00'
+    def __init__(self, filename, dtype, num_rows=None):
+        self.filename = filename
+        self.dtype = np.dtype(dtype)
+        # header length with room for any number of rows, aligned to 64 bytes
+        size = len(self.magic) + 2 + len(self.descr(10 ** 18)) + 1
+        self.header_len = 64 * ((size + 63) // 64) - len(self.magic) - 2
+        self.offset = len(self.magic) + 2 + self.header_len
+        if num_rows is None:
+            self.num_rows = 0
+            self.fh = open(filename, 'wb')
+        else:
+            self.fh = open(filename, 'r+b')
+            self.num_rows = num_rows
+            self.check_header(num_rows)
+            self.fh.truncate(self.offset + num_rows * self.dtype.itemsize)
+        self.fh.seek(0)
+        self.fh.write(self.header(self.num_rows))
+        self.fh.flush()
+
+    def check_header(self, num_rows):
+        """Check that the file being reopened is a stream of this dtype"""
+        version = np.lib.format.read_magic(self.fh)
+        shape, fortran_order, dtype = \
+            np.lib.format.read_array_header_1_0(self.fh)
+        if (version != (1, 0) or self.fh.tell() != self.offset or
+            dtype != self.dtype or shape[0] < num_rows):
+            self.close()
+            raise ValueError('{0}: not a record stream of the expected '
+                             'type and length'.format(self.filename))
+
+    def descr(self, n):
+        return repr({'descr': np.lib.format.dtype_to_descr(self.dtype),
+                     'fortran_order': False, 'shape': (n,)})
+
+    def header(self, n):
+        """The .npy header for n rows"""
+        h = self.descr(n).ljust(self.header_len - 1) + '\n'
+        return self.magic + np.array(len(h), '<u2').tobytes() + asbytes(h)
+
+    def write(self, rows):
+        """Append rows to the file"""
+        if self.fh is None:
+            raise ValueError('I/O operation on closed record stream')
+        if not len(rows):
+            return
+        rows = np.ascontiguousarray(rows, dtype=self.dtype)
+        self.fh.seek(self.offset + self.num_rows * self.dtype.itemsize)
+        self.fh.write(rows.tobytes())
+        self.num_rows += rows.shape[0]
+        self.fh.seek(0)
+        self.fh.write(self.header(self.num_rows))
+        self.fh.flush()
+
+    def load(self):
+        """Memory mapped view of the rows written"""
+        return np.load(self.filename, mmap_mode='r')
+
+    def close(self):
+        if self.fh is not None:
+            self.fh.close()
+        self.fh = None
 
 def filediff_entry(argv=None):
+    import argparse
     if argv is None:
         argv = sys.argv[1:]
     parser = argparse.ArgumentParser()
@@ -240,6 +351,7 @@ def read_diff_file(filepath, stream):
       individual floor (Variable floor attribute)
 
     '''
+    import xml.dom.minidom as xdom
     doc = xdom.parse(filepath)
     try:
         exdiff = doc.getElementsByTagName('ExDiff')[0]
@@ -327,6 +439,7 @@ def plot_files(source1, source2):
     return
 
 def filedump_entry(argv=None):
+    import argparse
     if argv is None:
         argv = sys.argv[1:]
     parser = argparse.ArgumentParser()
@@ -2,11 +2,11 @@
 import os
 import re
 import sys
-import glob
 import shutil
 import logging
 import warnings
 import subprocess
+from time import time as tt
 
 from os.path import isfile, realpath, dirname, join, splitext, basename, isdir
 
@@ -16,12 +16,16 @@ from numpy.distutils.misc_util import Configuration
 from numpy.distutils.system_info import get_info
 from numpy.distutils.core import setup
 
-from .product import LAPACK, LAPACK_OBJ, MMLABPACK, ABA_UTL, FORT_INC
+from .product import (LAPACK, LAPACK_OBJ, MMLABPACK, ABA_UTL, FORT_INC,
+                      IO_F90, IO_OBJ, SO_EXT)
+from .manifest import BuildManifest, fortran_flags
 from ..misc import remove, stdout_redirected, merged_stderr_stdout
 from ...mml_siteenv import environ
 from ...product import PKG_D, PYEXE
 
 FORT_COMPILER = environ.fc
+LAPACK_FLAGS = ["-fPIC", "-shared", "-O3"]
+IO_FLAGS = ["-fPIC", "-O3", "-fno-second-underscore", "-c"]
 
 class ExtModuleNotBuilt(Exception): pass
 class FortranNotFoundError(Exception): pass
@@ -30,7 +34,7 @@ class FortranExtBuilder(object):
     place
 
     """
-    def __init__(self, name, fc=None, verbosity=1):
+    def __init__(self, name, fc=None, verbosity=1, nprocs=None):
         # find fortran compiler
         global FORT_COMPILER
         if fc is None:
@@ -51,9 +55,17 @@ class FortranExtBuilder(object):
         self.exts_to_build = []
         self.ext_modules_built = False
         self._build_blas_lapack = False
+        self.manifest = BuildManifest()
+        self.sources = {}
+        self.nprocs = build_nprocs(nprocs)
 
     def add_extension(self, name, sources, **kwargs):
-        """Add an extension module to build"""
+        """Add an extension module to build. Modules built from the same
+        sources, with the same compiler and flags, are not built again unless
+        force=True"""
+        # distutils requires str names, names read from the material
+        # registry are unicode
+        name = str(name)
         options = {}
         lapack = kwargs.get("lapack")
         mmlabpack = kwargs.get("mmlabpack")
@@ -74,6 +86,12 @@ class FortranExtBuilder(object):
         if ABA_UTL in sources:
             lapack = 'lite'
 
+        if (not kwargs.get('force') and
+            self.manifest.is_current(name, sources, fc=self.fc)):
+            logging.getLogger('matmodlab.mmd.builder').debug(
+                '{0}: extension module is up to date'.format(name))
+            return 0
+
         if lapack:
             if lapack == "lite":
                 self._build_blas_lapack = True
@@ -99,10 +117,18 @@ class FortranExtBuilder(object):
         options["library_dirs"] = [d]
 
         self.exts_to_build.append((name, sources, options))
+        self.sources[name] = sources
         return
 
     def build_extension_modules(self, verbosity=None):
-        """Build all extension modules in config"""
+        """Build all extension modules in config
+
+        The objects shared by the modules are built first, then the modules,
+        each in its own process and build directory, nprocs at a time. The
+        output of the build of each module is written to its log,
+        PKG_D/build/<name>.log
+
+        """
         if not self.exts_to_build:
             return
 
@@ -110,88 +136,92 @@ class FortranExtBuilder(object):
             chatty = verbosity >= 2
         else:
             chatty = self.chatty
+        logger = logging.getLogger('matmodlab.mmd.builder')
 
-        to_build = [x[0] for x in self.exts_to_build]
-        if self._build_blas_lapack and not isfile(LAPACK_OBJ):
-            to_build.insert(0, "blas_lapack-lite")
-        logging.getLogger('matmodlab.mmd.builder').info(
-            'The following fortran extension modules will be built:\n'
-            '    {0}'.format(','.join(to_build)))
-
+        # objects built once and linked in every module using them
+        objects = []
         if self._build_blas_lapack:
-            if not isfile(LAPACK_OBJ):
-                stat = build_blas_lapack()
-                if stat != 0:
-                    logging.getLogger('matmodlab.mmd.builder').error(
-                        'failed to build blas_lapack, dependent '
-                        'libraries will not be importable')
-
-        config = Configuration(self.name, parent_package="", top_path="",
-                               package_path=PKG_D)
-        for (name, sources, options) in self.exts_to_build:
-            if any(' ' in x for x in sources):
-                logging.getLogger('matmodlab.mmd.builder').warn(
-                    'File paths with spaces are known to fail to build')
-            config.add_extension(name, sources=sources, **options)
-
-        cwd = os.getcwd()
-        os.chdir(PKG_D)
-
-        fexec = "--f77exec={0} --f90exec={0}".format(self.fc)
-        argv = "./setup.py config_fc {0}".format(fexec).split()
-        fflags = ["-Wno-unused-dummy-argument"]
-        if environ.fflags:
-            fflags.extend(environ.fflags)
-        fflags = " ".join(fflags)
-        fflags = "--f77flags='{0}' --f90flags='{0}'".format(fflags).split()
-        argv.extend(fflags)
-        argv.extend("build_ext -i".split())
-
-        # build the extension modules with distutils setup
-        logging.getLogger('matmodlab.mmd.builder').info(
-            'building extension module[s]... ', extra={'continued':1})
-        failed = 0
-
-        # change sys.argv for distutils
-        hold = [x for x in sys.argv]
-        sys.argv = [x for x in argv]
-        try:
-            if environ.notebook:
-                from IPython.utils import io
-                with io.capture_output() as captured:
-                    setup(**config.todict())
-                logging.getLogger('matmodlab.mmd.builder').info('done')
+            objects.append(('blas_lapack-lite', LAPACK, LAPACK_OBJ,
+                            LAPACK_FLAGS))
+        if any(shares_io(x[1]) for x in self.exts_to_build):
+            objects.append(('mml_io', IO_F90, IO_OBJ,
+                            IO_FLAGS + fortran_flags()))
+        objects = [x for x in objects if not self.manifest.is_current(
+            x[0], [x[1]], fc=self.fc, fflags=x[3], filename=x[2])]
+
+        to_build = [x[0] for x in objects + self.exts_to_build]
+        logger.info('The following fortran extension modules will be built:\n'
+                    '    {0}'.format(','.join(to_build)))
+
+        failed = []
+        for (name, source, obj, flags) in objects:
+            stat = build_object(name, source, obj, flags)
+            if stat != 0:
+                logger.error('failed to build {0}, dependent '
+                             'libraries will not be importable'.format(name))
+                failed.append(name)
             else:
-                f = join(PKG_D, "build.log") if not chatty else sys.stdout
-                with stdout_redirected(to=f), merged_stderr_stdout():
-                    setup(**config.todict())
-                logging.getLogger('matmodlab.mmd.builder').info('done')
-        except:
-            logging.getLogger('matmodlab.mmd.builder').error('failed')
-            failed = 1
-        finally:
-            sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
-            sys.argv = [x for x in hold]
-
-        os.chdir(cwd)
-        # move files
-        d = config.package_dir[config.name]
-        for mod in glob.glob(d + "/*.so"):
-            self.exts_built.append(module_name(mod))
+                self.manifest.record(name, [source], fc=self.fc, fflags=flags)
 
-        logging.getLogger('matmodlab.mmd.builder').info(
-            'staging extension module[s]... ', extra={'continued':1})
+        log_d = join(PKG_D, 'build')
+        if not isdir(log_d):
+            os.makedirs(log_d)
+        jobs = []
+        for (name, sources, options) in self.exts_to_build:
+            if any(' ' in x for x in sources):
+                logger.warn('File paths with spaces are known to fail to build')
+            if shares_io(sources) and 'mml_io' not in failed:
+                sources = [x for x in sources if x != IO_F90]
+                options = dict(options)
+                options['extra_objects'] = options.get('extra_objects', []) + \
+                    [IO_OBJ]
+            log = None if chatty else join(log_d, name + '.log')
+            jobs.append((self.name, name, sources, options, self.fc, log))
+
+        nprocs = min(self.nprocs, len(jobs))
+        logger.info('building extension module[s]... ', extra={'continued':1})
+        start = tt()
+        if nprocs <= 1 or environ.notebook:
+            results = [build_extension(job) for job in jobs]
+        else:
+            import multiprocessing as mp
+            pool = mp.Pool(processes=nprocs)
+            try:
+                results = pool.map(build_extension, jobs, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        logger.info('failed' if any(x[1] for x in results) else 'done')
+
+        # modules not written by this build failed, even if an old build of
+        # the module exists
+        for (name, stat, dt) in results:
+            so = join(PKG_D, name + SO_EXT)
+            if stat == 0 and isfile(so) and os.path.getmtime(so) >= int(start):
+                self.exts_built.append(name)
+                self.manifest.record(name, self.sources[name], fc=self.fc)
+                logger.debug('{0}: built in {1:.1f}s'.format(name, dt))
+
+        logger.info('staging extension module[s]... ', extra={'continued':1})
 
         self.exts_failed = [n[0] for n in self.exts_to_build
                             if n[0] not in self.exts_built]
         self.ext_modules_built = True
         self.exts_to_build = []
+        self.sources = {}
         if self.exts_failed:
-            logging.getLogger('matmodlab.mmd.builder').info('failed')
+            logger.info('failed')
+            for (name, sources, options, fc, log) in [x[1:] for x in jobs]:
+                if name not in self.exts_failed:
+                    continue
+                message = '{0}: failed to build'.format(name)
+                if log is not None:
+                    message += ', see {0}:\n{1}'.format(log, log_tail(log))
+                logger.error(message)
             raise ExtModuleNotBuilt("{0}: failed to build".format(
                     ", ".join(self.exts_failed)))
         else:
-            logging.getLogger('matmodlab.mmd.builder').info('done')
+            logger.info('done')
 
         return
 
@@ -207,17 +237,35 @@ class FortranExtBuilder(object):
                 return lapack
 
 
+def build_nprocs(nprocs=None):
+    """The number of processes building extension modules: nprocs, or
+    environ.build_nprocs, or one per cpu if these are 0"""
+    if nprocs is None:
+        nprocs = environ.build_nprocs
+    if not nprocs:
+        import multiprocessing as mp
+        nprocs = mp.cpu_count()
+    return max(1, int(nprocs))
+
+
 def module_name(filepath):
     return splitext(basename(filepath))[0]
 
 
-def build_blas_lapack():
-    """Build the blas_lapack-lite object
+def shares_io(sources):
+    """Is the mml_io object linked in place of the mml_io source? Only in
+    modules wrapped by signature files, f2py wraps every routine of the
+    sources of modules without"""
+    return IO_F90 in sources and any(x.endswith('.pyf') for x in sources)
+
+
+def build_object(name, source, obj, flags):
+    """Build the object obj of the fortran source
 
     """
     logging.getLogger('matmodlab.mmd.builder').info(
-        'building blas_lapack-lite... ', extra={'continued':1})
-    cmd = [FORT_COMPILER, "-fPIC", "-shared", "-O3", LAPACK, "-o" + LAPACK_OBJ]
+        'building {0}... '.format(name), extra={'continued':1})
+    cmd = [FORT_COMPILER] + flags + [source, "-o" + obj]
     build = subprocess.Popen(cmd, stdout=open(os.devnull, "a"),
                              stderr=subprocess.STDOUT)
     build.wait()
@@ -226,3 +274,108 @@ def build_blas_lapack():
     else:
         logging.getLogger('matmodlab.mmd.builder').info('no')
     return build.returncode
+
+
+def build_blas_lapack():
+    """Build the blas_lapack-lite object
+
+    """
+    return build_object('blas_lapack-lite', LAPACK, LAPACK_OBJ, LAPACK_FLAGS)
+
+
+def build_extension(args):
+    """Build one extension module in place with numpy distutils
+
+    Parameters
+    ----------
+    args : tuple
+        (package, name, sources, options, fc, log). The output of the build
+        is written to the file log, or to stdout if log is None
+
+    Returns
+    -------
+    name, status, time : str, int, float
+        status is nonzero if the build failed
+
+    """
+    package, name, sources, options, fc, log = args
+    start = tt()
+    # forget the distribution of the last module built by this process
+    import distutils.core
+    distutils.core._setup_distribution = None
+    config = Configuration(package, parent_package="", top_path="",
+                           package_path=PKG_D)
+    config.add_extension(name, sources=sources, **options)
+
+    # each module is built out of place in its own directory, build/<name>,
+    # so that builds in parallel share no intermediate files. in place,
+    # build_src writes the f2py wrappers of modules with signatures (and
+    # fortranobject.c and .h) next to the signature, shared by the modules
+    # with signatures in the same directory. the built module is copied to
+    # PKG_D
+    build_d = join(PKG_D, "build", name)
+    build_lib = join(build_d, "lib")
+    fexec = "--f77exec={0} --f90exec={0}".format(fc)
+    argv = "./setup.py config_fc {0}".format(fexec).split()
+    fflags = " ".join(fortran_flags())
+    fflags = "--f77flags='{0}' --f90flags='{0}'".format(fflags).split()
+    argv.extend(fflags)
+    argv.extend("build_src --build-src={0}".format(join(build_d, "src")).split())
+    # the manifest decides what is built, not the timestamps distutils checks
+    argv.extend("build_ext -f --build-temp={0} --build-lib={1}".format(
+        build_d, build_lib).split())
+
+    cwd = os.getcwd()
+    os.chdir(PKG_D)
+
+    # change sys.argv for distutils
+    hold = [x for x in sys.argv]
+    sys.argv = [x for x in argv]
+    status = 0
+    try:
+        if environ.notebook:
+            from IPython.utils import io
+            with io.capture_output() as captured:
+                setup(**config.todict())
+        else:
+            f = log if log is not None else sys.stdout
+            with stdout_redirected(to=f), merged_stderr_stdout():
+                setup(**config.todict())
+        stage_extension(name, build_lib)
+    except:
+        status = 1
+    finally:
+        sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+        sys.argv = [x for x in hold]
+        os.chdir(cwd)
+
+    return name, status, tt() - start
+
+
+def stage_extension(name, build_lib):
+    """Copy the extension module name built in build_lib to PKG_D
+
+    The module is copied to a temporary file that is renamed, a module
+    loaded by a running process is replaced, not overwritten
+
+    """
+    for (dirname, dirs, files) in os.walk(build_lib):
+        if name + SO_EXT in files:
+            break
+    else:
+        raise ExtModuleNotBuilt("{0}: extension module not found".format(name))
+    dest = join(PKG_D, name + SO_EXT)
+    tmp = "{0}.{1}.tmp".format(dest, os.getpid())
+    shutil.copyfile(join(dirname, name + SO_EXT), tmp)
+    os.chmod(tmp, 0o755)
+    os.rename(tmp, dest)
+
+
+def log_tail(filename, n=10):
+    """The last n lines of the file filename"""
+    try:
+        with open(filename) as fh:
+            lines = fh.readlines()
+    except IOError:
+        return ''
+    return ''.join('    ' + x for x in lines[-n:]).rstrip()
@@ -0,0 +1,160 @@
+'''Record of the Fortran extension modules built and what they were built from
+
+An extension module is current if it exists and the key it was built with
+matches the key of its sources now. The key is a hash of the contents of the
+source files (the signature file among them), the compiler, the compiler
+flags, and the versions of python and numpy the module is built against, so
+that editing a source, changing flags, or switching compilers rebuilds the
+module, and only that module.
+
+Entries are kept in a manifest in the library directory, by module name.
+Each records the mtime, size, and hash of its source files: sources whose
+mtime and size are unchanged are not hashed again, touched sources are
+hashed and compared.
+
+'''
+import os
+import re
+import sys
+import json
+import hashlib
+import logging
+import numpy as np
+
+from ...mml_siteenv import environ
+from ...product import PKG_D
+
+__all__ = ['BuildManifest', 'MANIFEST', 'fortran_flags', 'rename_signature']
+
+MANIFEST = os.path.join(PKG_D, 'build_manifest.json')
+
+def fortran_flags():
+    '''The flags Fortran sources are compiled with'''
+    fflags = ['-Wno-unused-dummy-argument']
+    if environ.fflags:
+        fflags.extend(environ.fflags)
+    return fflags
+
+def compiler(fc=None):
+    '''The path of the Fortran compiler fc, or that of the environment'''
+    fc = fc or environ.fc
+    return os.path.realpath(fc) if fc else None
+
+def digest(filename):
+    with open(filename, 'rb') as fh:
+        return hashlib.sha1(fh.read()).hexdigest()
+
+class BuildManifest(object):
+    '''The keys of the extension modules built, by module name
+
+    Parameters
+    ----------
+    filename : str
+        File holding the manifest [default: PKG_D/build_manifest.json]
+
+    '''
+    def __init__(self, filename=None):
+        self.filename = filename or MANIFEST
+        self.entries = self.read()
+
+    def read(self):
+        try:
+            with open(self.filename) as fh:
+                return json.load(fh)
+        except (IOError, ValueError):
+            return {}
+
+    def stamps(self, name, sources):
+        '''The (mtime, size, sha1) of each of sources, hashing only those
+        not matching the stamps of the entry of name'''
+        old = self.entries.get(name, {}).get('sources', {})
+        stamps = {}
+        for f in sorted(set(sources)):
+            st = os.stat(f)
+            stamp = old.get(f)
+            if stamp is None or stamp[:2] != [st.st_mtime, st.st_size]:
+                stamp = [st.st_mtime, st.st_size, digest(f)]
+            stamps[f] = stamp
+        return stamps
+
+    def key(self, stamps, fc=None, fflags=None):
+        '''The key of an extension module built from sources with stamps'''
+        if fflags is None:
+            fflags = fortran_flags()
+        h = hashlib.sha1()
+        for item in (compiler(fc), fflags, sys.version, np.__version__):
+            h.update(repr(item))
+        for f in sorted(stamps):
+            h.update(f)
+            h.update(stamps[f][2])
+        return h.hexdigest()
+
+    def is_current(self, name, sources, fc=None, fflags=None, filename=None):
+        '''Is the extension module name, in filename, built from sources?
+
+        filename defaults to PKG_D/name.so
+
+        '''
+        if filename is None:
+            filename = os.path.join(PKG_D, name + '.so')
+        self.entries = self.read()
+        entry = self.entries.get(name)
+        if entry is None or not os.path.isfile(filename):
+            return False
+        if sorted(entry['sources']) != sorted(set(sources)):
+            return False
+        stamps = self.stamps(name, sources)
+        if self.key(stamps, fc, fflags) != entry['key']:
+            return False
+        if stamps != entry['sources']:
+            # touched, but unchanged
+            self.record(name, sources, fc, fflags, stamps=stamps)
+        return True
+
+    def record(self, name, sources, fc=None, fflags=None, stamps=None):
+        '''Record that the extension module name was built from sources'''
+        if stamps is None:
+            stamps = self.stamps(name, sources)
+        key = self.key(stamps, fc, fflags)
+        # entries may have been recorded by another process
+        self.entries = self.read()
+        self.entries[name] = {'key': key, 'sources': stamps}
+        self.save()
+
+    def remove(self, name):
+        self.entries = self.read()
+        if self.entries.pop(name, None) is not None:
+            self.save()
+
+    def save(self):
+        tmp = '{0}.{1}.tmp'.format(self.filename, os.getpid())
+        try:
+            with open(tmp, 'w') as fh:
+                json.dump(self.entries, fh, indent=1, sort_keys=True)
+            os.rename(tmp, self.filename)
+        except (IOError, OSError):
+            logging.getLogger('matmodlab.mmd.builder').warn(
+                'failed to write build manifest {0}'.format(self.filename))
+
+def rename_signature(signature, old_name, new_name):
+    '''The signature file of module old_name, written for module new_name.
+
+    The new signature, PKG_D/new_name.pyf, is written only if its contents
+    change, so that its mtime does not change otherwise
+
+    '''
+    with open(signature, 'r') as fh:
+        lines = fh.read()
+    pat = r'(?is)python\s+module\s+{0}'.format(old_name)
+    repl = r'python module {0}'.format(new_name)
+    lines = re.sub(pat, repl, lines)
+    new_signature = os.path.join(PKG_D, new_name + '.pyf')
+    try:
+        with open(new_signature, 'r') as fh:
+            if fh.read() == lines:
+                return new_signature
+    except IOError:
+        pass
+    with open(new_signature, 'w') as fh:
+        fh.write(lines)
+    return new_signature
@@ -5,7 +5,6 @@ import sys
 import string
 import random
 import shutil
-import inspect
 import importlib
 from subprocess import check_output
 from select import select
@@ -51,10 +50,12 @@ def backup(src, mv=0):
 
 def whoami():
     """ return name of calling function """
+    import inspect
     return inspect.stack()[1][3]
 
 def who_is_calling(disp=0):
     """return the name of the calling function"""
+    import inspect
     stack = inspect.stack()[2]
     if disp:
         return stack
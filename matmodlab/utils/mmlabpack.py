@@ -7,6 +7,8 @@ import logging
 import numpy as np
 from sys import modules, argv
 from ..product import PKG_D
+from ..constants import VOIGT
+from .symeig import expm3_batch, funcm3_batch
 
 mmlabpack_so = os.path.join(PKG_D, "mmlabpack.so")
 warned = False
@@ -19,8 +21,10 @@ def should_warn():
 
 try:
     from ..lib.mmlabpack import mmlabpack as m
+    compiled = True
 except ImportError:
     from . import _mmlabpack as m
+    compiled = False
     if not warned and should_warn():
         d = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../lib")
         if not os.path.isfile(mmlabpack_so):
@@ -50,3 +54,67 @@ def isotropic_part(A):
     Aiso[:, 3:] /= np.sqrt(2.)
     Aiso[3:, :] /= np.sqrt(2.)
     return Aiso
+
+def as3x3_batch(a):
+    """Convert the (N,6) array of symmetric tensors to an (N,3,3) array"""
+    a = np.asarray(a)
+    return a[:, [[0, 3, 5], [3, 1, 4], [5, 4, 2]]]
+
+def symarray_batch(a):
+    """Convert the (N,3,3) array of matrices to an (N,6) array of the
+    symmetric parts"""
+    a = .5 * (a + a.transpose(0, 2, 1))
+    return a[:, [0, 1, 2, 0, 1, 0], [0, 1, 2, 1, 2, 2]]
+
+def c2e_batch(k, c):
+    """Seth-Hill strains of the (N,3,3) right Cauchy-Green tensors c"""
+    if k == 0:
+        eps = funcm3_batch(c, lambda x: .5 * np.log(x))
+    else:
+        eps = funcm3_batch(c, lambda x: (x ** (.5 * k) - 1.) / k)
+    return symarray_batch(eps) * VOIGT
+
+def update_deformation_batch(dt, k, farg, darg):
+    """Update the deformation gradients and strains of N points
+
+    The batched form of update_deformation, F = exp(d dt) F0 and
+    E = 1/k (U**k - I), with U = (F^T F)**(1/2)
+
+    Parameters
+    ----------
+    dt : float or (N,) array
+        The time step
+    k : float
+        The Seth-Hill parameter
+    farg : (N,9) array
+        The deformation gradients at the beginning of the step
+    darg : (N,6) array
+        The symmetric parts of the velocity gradients
+
+    Returns
+    -------
+    f : (N,9) array
+        The updated deformation gradients
+    e : (N,6) array
+        The updated strains
+
+    """
+    farg = np.asarray(farg, dtype=np.float64)
+    N = farg.shape[0]
+    dt = np.reshape(dt, (-1, 1, 1))
+    f0 = farg.reshape((N, 3, 3))
+    ff = np.einsum('nij,njk->nik', expm3_batch(as3x3_batch(darg / VOIGT) * dt),
+                   f0)
+    if np.any(np.linalg.det(ff) <= 0.):
+        raise Exception("negative jacobian encountered")
+    e = c2e_batch(k, np.einsum('nki,nkj->nij', ff, ff))
+    return ff.reshape((N, 9)), e
+
+def e_from_f_batch(k, farg):
+    """The strains of the (N,9) deformation gradients farg, the batched form
+    of e_from_f"""
+    farg = np.asarray(farg, dtype=np.float64)
+    f = farg.reshape((farg.shape[0], 3, 3))
+    if np.any(np.linalg.det(f) <= 0.):
+        raise Exception("negative jacobian encountered")
+    return c2e_batch(k, np.einsum('nki,nkj->nij', f, f))
@@ -1,9 +1,7 @@
 import os
 import sys
 import time
-import argparse
 import numpy as np
-import xml.dom.minidom as xdom
 from os.path import realpath, join, isdir, isfile, dirname, splitext
 from ..constants import DB_FMTS
 from ..mml_siteenv import environ
@@ -99,11 +97,22 @@ class MMLTabularWriter(object):
 
         """
         d = d.replace(self.evald, ".")
-        self.start_element(U_EVAL, ((U_EVAL_N, n), (U_EVAL_S, s), (U_EVAL_D, d)))
-        self.create_element(U_PARAMS, parameters)
+        sp = IND * len(self.stack)
+        attrs = lambda a: " ".join('{0}="{1}"'.format(k, v) for (k, v) in a)
+        lines = ["{0}<{1} {2}>".format(sp, U_EVAL, attrs(((U_EVAL_N, n),
+                                                          (U_EVAL_S, s),
+                                                          (U_EVAL_D, d))))]
+        lines.append("{0}{1}<{2} {3}/>".format(sp, IND, U_PARAMS,
+                                               attrs(parameters)))
         if responses:
-            self.create_element(U_RESP, responses)
-        self.end_element(U_EVAL)
+            lines.append("{0}{1}<{2} {3}/>".format(sp, IND, U_RESP,
+                                                   attrs(responses)))
+        lines.append("{0}</{1}>".format(sp, U_EVAL))
+
+        # write the evaluation with a single write
+        with open(self.filename, "a") as stream:
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
         return
 
     def close(self):
@@ -130,6 +139,7 @@ def read_mml_evaldb(filepath):
         (name, value) pairs for parameters for each evaluation
 
     """
+    import xml.dom.minidom as xdom
     D = realpath(dirname(filepath))
     doc = xdom.parse(filepath)
     root = doc.getElementsByTagName(U_ROOT)[0]
@@ -289,6 +299,7 @@ def is_evaldb(filename):
     return False
 
 def main(argv):
+    import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("action", choices=("plot", "table"))
     parser.add_argument("filepath")
@@ -0,0 +1,244 @@
+"""Closed form eigendecomposition of symmetric 3x3 matrices and the spectral
+matrix functions built on it
+
+The eigenvalues are found with Cardano's method, as in dsyev3.f. The
+eigenvector of the isolated eigenvalue (the one farthest from the other two)
+is the largest cross product of the rows of A - w I. The remaining pair is
+found by diagonalizing A, projected on the plane orthogonal to that vector,
+with a Jacobi rotation, so that nearly degenerate eigenvalues do not cost
+accuracy. Only the upper triangle of A is referenced.
+
+Each function taking a single 3x3 matrix has a _batch variant taking an
+(N,3,3) array of matrices.
+
+"""
+import math
+import numpy
+
+__all__ = ['eigh3', 'funcm3', 'expm3', 'sqrtm3', 'logm3', 'powm3', 'issym3',
+           'eigh3_batch', 'funcm3_batch', 'expm3_batch', 'sqrtm3_batch',
+           'logm3_batch', 'powm3_batch']
+
+TWOPI3 = 2. * math.pi / 3.
+
+def issym3(a):
+    """Is the 3x3 matrix a symmetric?"""
+    a01, a02, a12 = a[0, 1], a[0, 2], a[1, 2]
+    return a01 == a[1, 0] and a02 == a[2, 0] and a12 == a[2, 1]
+
+def _cross(a, b):
+    return (a[1] * b[2] - a[2] * b[1],
+            a[2] * b[0] - a[0] * b[2],
+            a[0] * b[1] - a[1] * b[0])
+
+def _dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+def eigh3(a):
+    """Eigenvalues and eigenvectors of the symmetric 3x3 matrix a
+
+    Returns
+    -------
+    w : ndarray
+        The eigenvalues in ascending order
+    Q : ndarray
+        The normalized eigenvectors, Q[:, i] is the eigenvector of w[i]
+
+    """
+    a00, a01, a02 = float(a[0, 0]), float(a[0, 1]), float(a[0, 2])
+    a11, a12, a22 = float(a[1, 1]), float(a[1, 2]), float(a[2, 2])
+
+    off = a01 * a01 + a02 * a02 + a12 * a12
+    if off == 0.:
+        # diagonal
+        w = numpy.array([a00, a11, a22])
+        i = numpy.argsort(w)
+        return w[i], numpy.eye(3)[:, i]
+
+    # shift by the mean eigenvalue and scale to a unit deviator
+    q = (a00 + a11 + a22) / 3.
+    b00, b11, b22 = a00 - q, a11 - q, a22 - q
+    p = math.sqrt((b00 * b00 + b11 * b11 + b22 * b22 + 2. * off) / 6.)
+    r = (b00 * (b11 * b22 - a12 * a12) - a01 * (a01 * b22 - a12 * a02) +
+         a02 * (a01 * a12 - b11 * a02)) / (2. * p * p * p)
+    phi = math.acos(min(max(r, -1.), 1.)) / 3.
+
+    # isolated eigenvalue of the shifted matrix
+    wmax = 2. * p * math.cos(phi)
+    wmin = 2. * p * math.cos(phi + TWOPI3)
+    wmid = -wmax - wmin
+    wi = wmax if wmax - wmid >= wmid - wmin else wmin
+
+    # its eigenvector is normal to the rows of B - wi I
+    r0 = (b00 - wi, a01, a02)
+    r1 = (a01, b11 - wi, a12)
+    r2 = (a02, a12, b22 - wi)
+    v, vv = None, -1.
+    for c in (_cross(r0, r1), _cross(r0, r2), _cross(r1, r2)):
+        cc = _dot(c, c)
+        if cc > vv:
+            v, vv = c, cc
+    if vv == 0.:
+        # a multiple of the identity, up to roundoff
+        return numpy.array([q, q, q]), numpy.eye(3)
+    vv = math.sqrt(vv)
+    v = (v[0] / vv, v[1] / vv, v[2] / vv)
+
+    # orthonormal basis (u, t) of the plane normal to v
+    k = min(range(3), key=lambda i: abs(v[i]))
+    e = [0., 0., 0.]
+    e[k] = 1.
+    u = _cross(v, e)
+    uu = math.sqrt(_dot(u, u))
+    u = (u[0] / uu, u[1] / uu, u[2] / uu)
+    t = _cross(v, u)
+
+    # B projected on the plane, diagonalized by a Jacobi rotation
+    B = ((b00, a01, a02), (a01, b11, a12), (a02, a12, b22))
+    Bu = (_dot(B[0], u), _dot(B[1], u), _dot(B[2], u))
+    Bt = (_dot(B[0], t), _dot(B[1], t), _dot(B[2], t))
+    Bv = (_dot(B[0], v), _dot(B[1], v), _dot(B[2], v))
+    m00, m01, m11 = _dot(u, Bu), _dot(u, Bt), _dot(t, Bt)
+    theta = .5 * math.atan2(2. * m01, m00 - m11)
+    c, s = math.cos(theta), math.sin(theta)
+    wa = c * c * m00 + 2. * c * s * m01 + s * s * m11
+    wb = s * s * m00 - 2. * c * s * m01 + c * c * m11
+
+    w = numpy.array([_dot(v, Bv), wa, wb]) + q
+    Q = numpy.array([v,
+                     [c * u[i] + s * t[i] for i in range(3)],
+                     [c * t[i] - s * u[i] for i in range(3)]]).T
+    i = numpy.argsort(w)
+    return w[i], Q[:, i]
+
+def funcm3(a, f):
+    """Apply f to the eigenvalues of the symmetric 3x3 matrix a and
+    reconstruct the matrix from the new eigenvalues and the eigenprojectors"""
+    w, Q = eigh3(a)
+    return numpy.dot(Q * f(w), Q.T)
+
+def expm3(a):
+    """Matrix exponential of the symmetric 3x3 matrix a"""
+    return funcm3(a, numpy.exp)
+
+def sqrtm3(a):
+    """Matrix square root of the symmetric positive definite 3x3 matrix a"""
+    return funcm3(a, numpy.sqrt)
+
+def logm3(a):
+    """Matrix logarithm of the symmetric positive definite 3x3 matrix a"""
+    return funcm3(a, numpy.log)
+
+def powm3(a, m):
+    """Matrix power of the symmetric positive definite 3x3 matrix a"""
+    return funcm3(a, lambda x: x ** m)
+
+def _bdot(a, b):
+    return numpy.einsum('...i,...i->...', a, b)
+
+def eigh3_batch(a):
+    """Eigenvalues and eigenvectors of each symmetric 3x3 matrix in the
+    (N,3,3) array a
+
+    Returns
+    -------
+    w : ndarray
+        (N,3) array of the eigenvalues in ascending order
+    Q : ndarray
+        (N,3,3) array of the eigenvectors, Q[n, :, i] is the eigenvector of
+        w[n, i]
+
+    """
+    a = numpy.asarray(a, dtype=numpy.float64)
+    N = a.shape[0]
+    a00, a01, a02 = a[:, 0, 0], a[:, 0, 1], a[:, 0, 2]
+    a11, a12, a22 = a[:, 1, 1], a[:, 1, 2], a[:, 2, 2]
+
+    off = a01 * a01 + a02 * a02 + a12 * a12
+    diagonal = off == 0.
+
+    q = (a00 + a11 + a22) / 3.
+    b00, b11, b22 = a00 - q, a11 - q, a22 - q
+    p = numpy.sqrt((b00 * b00 + b11 * b11 + b22 * b22 + 2. * off) / 6.)
+    p[diagonal] = 1.
+    r = (b00 * (b11 * b22 - a12 * a12) - a01 * (a01 * b22 - a12 * a02) +
+         a02 * (a01 * a12 - b11 * a02)) / (2. * p * p * p)
+    phi = numpy.arccos(numpy.clip(r, -1., 1.)) / 3.
+
+    wmax = 2. * p * numpy.cos(phi)
+    wmin = 2. * p * numpy.cos(phi + TWOPI3)
+    wmid = -wmax - wmin
+    wi = numpy.where(wmax - wmid >= wmid - wmin, wmax, wmin)
+
+    B = numpy.empty((N, 3, 3))
+    B[:, 0, 0], B[:, 1, 1], B[:, 2, 2] = b00, b11, b22
+    B[:, 0, 1] = B[:, 1, 0] = a01
+    B[:, 0, 2] = B[:, 2, 0] = a02
+    B[:, 1, 2] = B[:, 2, 1] = a12
+
+    R = B.copy()
+    R[:, [0, 1, 2], [0, 1, 2]] -= wi[:, None]
+    C = numpy.cross(R[:, [0, 0, 1]], R[:, [1, 2, 2]])
+    cc = _bdot(C, C)
+    k = numpy.argmax(cc, axis=1)
+    n = numpy.arange(N)
+    v, vv = C[n, k], cc[n, k]
+    v[vv == 0., 0] = vv[vv == 0.] = 1.
+    v /= numpy.sqrt(vv)[:, None]
+
+    e = numpy.zeros((N, 3))
+    e[n, numpy.argmin(abs(v), axis=1)] = 1.
+    u = numpy.cross(v, e)
+    u /= numpy.sqrt(_bdot(u, u))[:, None]
+    t = numpy.cross(v, u)
+
+    Bu = numpy.einsum('nij,nj->ni', B, u)
+    Bt = numpy.einsum('nij,nj->ni', B, t)
+    Bv = numpy.einsum('nij,nj->ni', B, v)
+    m00, m01, m11 = _bdot(u, Bu), _bdot(u, Bt), _bdot(t, Bt)
+    theta = .5 * numpy.arctan2(2. * m01, m00 - m11)
+    c, s = numpy.cos(theta), numpy.sin(theta)
+
+    w = numpy.empty((N, 3))
+    w[:, 0] = _bdot(v, Bv)
+    w[:, 1] = c * c * m00 + 2. * c * s * m01 + s * s * m11
+    w[:, 2] = s * s * m00 - 2. * c * s * m01 + c * c * m11
+    w += q[:, None]
+
+    Q = numpy.empty((N, 3, 3))
+    Q[:, :, 0] = v
+    Q[:, :, 1] = c[:, None] * u + s[:, None] * t
+    Q[:, :, 2] = c[:, None] * t - s[:, None] * u
+
+    if diagonal.any():
+        w[diagonal] = a[diagonal][:, [0, 1, 2], [0, 1, 2]]
+        Q[diagonal] = numpy.eye(3)
+
+    i = numpy.argsort(w, axis=1)
+    w = w[n[:, None], i]
+    Q = Q[n[:, None, None], numpy.arange(3)[:, None], i[:, None, :]]
+    return w, Q
+
+def funcm3_batch(a, f):
+    """Apply the vectorized function f to the eigenvalues of each symmetric
+    3x3 matrix in the (N,3,3) array a"""
+    w, Q = eigh3_batch(a)
+    return numpy.einsum('nik,nk,njk->nij', Q, f(w), Q)
+
+def expm3_batch(a):
+    """Matrix exponentials of the symmetric 3x3 matrices in a"""
+    return funcm3_batch(a, numpy.exp)
+
+def sqrtm3_batch(a):
+    """Matrix square roots of the symmetric positive definite 3x3 matrices
+    in a"""
+    return funcm3_batch(a, numpy.sqrt)
+
+def logm3_batch(a):
+    """Matrix logarithms of the symmetric positive definite 3x3 matrices
+    in a"""
+    return funcm3_batch(a, numpy.log)
+
+def powm3_batch(a, m):
+    """Matrix powers of the symmetric positive definite 3x3 matrices in a"""
+    return funcm3_batch(a, lambda x: x ** m)
@@ -31,6 +31,7 @@ setup(name='matmodlab',
       license='MIT',
       packages=[
                 'matmodlab',
+                'matmodlab.benchmarks',
                 'matmodlab.fitting',
                 'matmodlab.lib',
                 'matmodlab.materials',